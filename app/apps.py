@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RPKIAppConfig(AppConfig):
     name = 'app'
     verbose_name = 'RPKI Browser app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,201 @@
+"""
+Cold storage of old Results (enabled with config.archive_dir)
+
+`manage.py archive_results` moves the Results older than config.archive_after_days
+out of app_result, oldest first, in batches of config.archive_batch_size:
+each batch is written as a compressed NDJSON segment (rows as in
+`manage.py export_results`), indexed by an ArchiveSegment row (date range, ASNs).
+
+    <archive_dir>/results-<first date>-<first id>-<last id>.ndjson.gz|.zst
+
+A segment is written to a temporary file, fsync'ed and renamed before its
+ArchiveSegment is created and its rows deleted, in one transaction: a batch
+interrupted half way leaves at worst a file which isn't indexed, and which
+the next run writes again.
+
+Archived results are read back with `rows`, by date range and ASN (see
+?archived=1 of GET /results/export/ and `manage.py export_results --archived`).
+Their timings (ResultEvent) go with them, but AsnRovState and AsnRollup are
+history and keep counting them: don't run `manage.py rebuild_rov_state` or
+`recompute_rollups` over archived days, which only read app_result.
+"""
+
+import gzip
+import io
+import json
+import os
+import zstandard
+from datetime import timedelta
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rpki_validation_browser.utils import config
+from .export import rows as export_rows
+from .models import Result, ResultEvent, ArchiveSegment, invalidate_latency
+
+EXTENSIONS = {
+    ArchiveSegment.GZIP: '.ndjson.gz',
+    ArchiveSegment.ZSTD: '.ndjson.zst',
+}
+
+
+class ArchiveConflict(Exception):
+    pass
+
+
+def enabled():
+    return bool(config.archive_dir)
+
+
+def path(segment):
+    return os.path.join(config.archive_dir, segment.name + EXTENSIONS[segment.compression])
+
+
+def write_segment(segment, rows):
+    """
+    Write rows out to the segment's file, replacing what a previous attempt might have left
+
+    :return: size of the file, in bytes
+    """
+
+    target = path(segment)
+    temporary = target + '.tmp'
+
+    with open(temporary, 'wb') as raw:
+        if segment.compression == ArchiveSegment.ZSTD:
+            f = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        else:
+            f = gzip.GzipFile(fileobj=raw, mode='wb')
+
+        with f:
+            for row in rows:
+                f.write((json.dumps(row) + '\n').encode())
+
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    os.rename(temporary, target)
+
+    return os.path.getsize(target)
+
+
+def read_segment(segment):
+    """
+    :return: iterator of the rows of a segment
+    """
+
+    if segment.compression == ArchiveSegment.ZSTD:
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path(segment), 'rb'))
+        f = io.TextIOWrapper(reader, encoding='utf-8')
+    else:
+        f = gzip.open(path(segment), 'rt', encoding='utf-8')
+
+    with f:
+        for line in f:
+            yield json.loads(line)
+
+
+def archive_batch(cutoff, batch_size=None, compression=None):
+    """
+    Move the oldest Results before `cutoff` into a new segment
+
+    :return: the ArchiveSegment, None if there was nothing left to archive
+    """
+
+    queryset = Result.objects.filter(date__lt=cutoff).order_by('date', 'id')[:batch_size or config.archive_batch_size]
+    rows = list(export_rows(queryset))
+
+    if not rows:
+        return None
+
+    first, last = rows[0], rows[-1]
+    since = parse_datetime(first['date'])
+
+    segment = ArchiveSegment(
+        name="results-{since:%Y%m%dT%H%M%S}-{first}-{last}".format(since=since, first=first['id'], last=last['id']),
+        compression=compression or config.archive_compression,
+        since=since,
+        until=parse_datetime(last['date']),
+        asns=sorted({asn for row in rows for asn in row['asns']}),
+        records=len(rows),
+    )
+    segment.size = write_segment(segment, rows)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        segment.save()
+
+        ids = [row['id'] for row in rows]
+
+        # the date bounds keep the other partitions out
+        cursor.execute("DELETE FROM {table} WHERE date >= %s AND date <= %s AND id = ANY(%s)".format(
+            table=Result._meta.db_table
+        ), [segment.since, segment.until, ids])
+
+        if cursor.rowcount != len(rows):
+            raise ArchiveConflict("{name}: {deleted} of {count} results deleted, is another archiver running?".format(
+                name=segment.name, deleted=cursor.rowcount, count=len(rows)
+            ))
+
+        # no foreign key constraint to cascade through, see ResultEvent
+        cursor.execute("DELETE FROM {table} WHERE date >= %s AND date <= %s AND result_id = ANY(%s)".format(
+            table=ResultEvent._meta.db_table
+        ), [segment.since, segment.until, ids])
+
+        invalidate_latency([parse_datetime(row['date']) for row in rows])
+
+    return segment
+
+
+def archive(older_than=None, batch_size=None, compression=None, max_batches=None):
+    """
+    :param older_than: days, default config.archive_after_days
+    :return: iterator of the ArchiveSegments written
+    """
+
+    cutoff = timezone.now() - timedelta(days=config.archive_after_days if older_than is None else older_than)
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        segment = archive_batch(cutoff, batch_size=batch_size, compression=compression)
+        if segment is None:
+            return
+
+        batches += 1
+        yield segment
+
+
+def segments(since=None, until=None, asn=None):
+    queryset = ArchiveSegment.objects.order_by('since', 'id')
+
+    if since is not None:
+        queryset = queryset.filter(until__gte=since)
+    if until is not None:
+        queryset = queryset.filter(since__lt=until)
+    if asn is not None:
+        queryset = queryset.filter(asns__contains=[str(asn)])
+
+    return queryset
+
+
+def rows(since=None, until=None, asn=None):
+    """
+    Archived results, oldest first, same filters as app.export.results
+
+    :param since: inclusive
+    :param until: exclusive
+    :return: iterator of rows, as app.export.rows
+    """
+
+    for segment in segments(since=since, until=until, asn=asn):
+        for row in read_segment(segment):
+            date = parse_datetime(row['date'])
+
+            if since is not None and date < since:
+                continue
+            if until is not None and date >= until:
+                # rows of a segment are in date order
+                break
+            if asn is not None and str(asn) not in row['asns']:
+                continue
+
+            yield row
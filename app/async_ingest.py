@@ -0,0 +1,249 @@
+"""
+Async ingest path for ASGI deployments (see rpki_validation_browser/asgi.py)
+
+Django 2.2 has no async views, so POST /results/ is answered here natively
+and everything else is handed to the regular WSGI application in a thread.
+
+Validation, scrubbing and classification run in the event loop (they're
+CPU only, see app.ingest.prepare). Results are then queued to a single
+BatchWriter task, which inserts whatever has accumulated in one transaction
+through app.ingest.save_results, in a thread (sync_to_async). Thousands of
+beacons waiting on the database then cost a future each rather than a
+worker thread and a connection each.
+
+There is no outbound I/O on this path: notifications only go into the outbox,
+`manage.py process_notifications` does the RIPEstat / Mattermost requests.
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+from rpki_validation_browser.utils import config
+from .ingest import prepare, save_results
+from .models import Result
+from .serializers import ResultSerializer
+
+PATHS = ('/results', '/results/')
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+def write(results):
+    # runs in a thread of its own, as a request would
+    close_old_connections()
+    try:
+        return save_results(results)
+    finally:
+        close_old_connections()
+
+
+class BatchWriter:
+    """
+    Single writer: batches of up to config.async_batch_size results,
+    waiting at most config.async_batch_delay seconds for a batch to fill up
+    """
+
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=config.async_queue_size)
+        self.task = asyncio.ensure_future(self.run())
+
+    async def submit(self, result):
+        """
+        :return: True once the result has been saved
+        """
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((result, future))
+
+        return await future
+
+    async def close(self):
+        await self.queue.put(None)
+        await self.task
+
+    async def next_batch(self):
+        """
+        :return: (batch, closing)
+        """
+
+        item = await self.queue.get()
+        if item is None:
+            return [], True
+
+        batch = [item]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.async_batch_delay
+
+        while len(batch) < config.async_batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            if item is None:
+                return batch, True
+
+            batch.append(item)
+
+        return batch, False
+
+    async def run(self):
+        closing = False
+
+        while not closing:
+            batch, closing = await self.next_batch()
+            if batch:
+                await self.flush(batch)
+
+    async def flush(self, batch):
+        try:
+            saved = await sync_to_async(write, thread_sensitive=True)([result for result, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # don't fail a whole batch for one bad row
+                for item in batch:
+                    await self.flush([item])
+                return
+
+            future = batch[0][1]
+            # the request might have been cancelled meanwhile
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        saved = {id(result) for result in saved}
+        for result, future in batch:
+            if not future.done():
+                future.set_result(id(result) in saved)
+
+
+async def create(data, dry_run=False, writer=None):
+    """
+    Async equivalent of ResultView.create
+
+    :param data: {"json": {...}, "date": ...} as posted by the client
+    :return: (HTTP status, body)
+    """
+
+    try:
+        index, fingerprint = prepare(data)
+
+        serializer = ResultSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+    except ValidationError as e:
+        return 400, e.detail
+
+    result = Result(fingerprint=fingerprint, **serializer.validated_data)
+    result.event_index = index
+
+    if dry_run or result.is_documentation():
+        return 200, dict(serializer.data, **{
+            "dry_run": True,
+            "classification": result.classification(),
+        })
+
+    if not await writer.submit(result):
+        # already seen, see app.duplicates
+        return 200, dict(serializer.data, duplicate=True)
+
+    return 201, ResultSerializer(result).data
+
+
+async def read_body(receive):
+    body = b''
+
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+
+        if len(body) > config.async_max_body:
+            raise PayloadTooLarge()
+
+        if not message.get('more_body', False):
+            return body
+
+
+async def respond(send, status, body):
+    content = json.dumps(body, cls=JSONEncoder).encode()
+
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(content)).encode()),
+    ]
+    if getattr(settings, 'CORS_ORIGIN_ALLOW_ALL', False):
+        headers.append((b'access-control-allow-origin', b'*'))
+
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': content})
+
+
+class IngestApplication:
+    """
+    ASGI application: POST /results/ natively, the rest through `wsgi_application`
+    """
+
+    def __init__(self, wsgi_application):
+        self.fallback = WsgiToAsgi(wsgi_application)
+        self.writer = None
+
+    def get_writer(self):
+        # bound to the event loop it's first used from
+        if self.writer is None:
+            self.writer = BatchWriter()
+        return self.writer
+
+    async def close(self):
+        if self.writer is not None:
+            await self.writer.close()
+            self.writer = None
+
+    async def __call__(self, scope, receive, send):
+
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] in PATHS:
+            return await self.ingest(scope, receive, send)
+
+        return await self.fallback(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def ingest(self, scope, receive, send):
+
+        try:
+            data = json.loads(await read_body(receive))
+        except PayloadTooLarge:
+            return await respond(send, 413, {"error": "payload too large"})
+        except ValueError as e:
+            return await respond(send, 400, {"error": "JSON parse error - {e}".format(e=e)})
+
+        query = parse_qs(scope.get('query_string', b'').decode())
+        dry_run = query.get('dry_run', [''])[0].lower() in ('1', 'true', 'yes')
+
+        status, body = await create(data, dry_run=dry_run, writer=self.get_writer())
+
+        await respond(send, status, body)
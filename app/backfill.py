@@ -0,0 +1,281 @@
+"""
+Backfills: named jobs fixing up the stored Results after a rule has changed,
+for `manage.py backfill <name>`
+
+    finished-on-time    reclassify with app.events.ON_TIME_THRESHOLD, in SQL (jsonb_set),
+                        adjusting AsnRovState and the rollups in the same statement
+    scrub               apply the DataProtector rules again (see app.events.scrub_events),
+                        in Python, only the rows that change are written
+
+Jobs run over app_result in batches of ids, one transaction per batch, sleeping
+in between to leave room for ingestion. Progress is checkpointed in BackfillJob
+(see there): a backfill that's been interrupted resumes where it stopped, and
+two runs of the same job don't process the same batch twice.
+
+Jobs are registered with `register`, as a subclass of Job implementing `batch`.
+"""
+
+import copy
+import json
+import time
+from django.db import connection, transaction
+from psycopg2.extras import execute_values
+from rpki_validation_browser.utils import config
+from .events import ON_TIME_THRESHOLD, scrub_events
+from .models import Result, AsnRovState, AsnRollup, BackfillJob, invalidate_latency
+
+JOBS = {}
+
+
+class BackfillFinished(Exception):
+    pass
+
+
+def register(job):
+    JOBS[job.name] = job()
+    return job
+
+
+class Job:
+    name = None
+    help = ''
+
+    def batch(self, cursor, low, high):
+        """
+        Fix up the Results with low < id <= high
+
+        :return: number of rows changed
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """
+        Run once all the batches are done, again if it's been interrupted
+        """
+        pass
+
+
+def events(alias):
+    return "CASE jsonb_typeof({alias}.json->'events') WHEN 'array' THEN {alias}.json->'events' ELSE '[]' END".format(
+        alias=alias
+    )
+
+
+def first_duration(stages):
+    """
+    :param stages: SQL list of stages, by order of preference
+    :return: SQL expression, duration of the first event of the first of `stages` found
+    """
+
+    return """(
+        SELECT CASE jsonb_typeof(e.event->'data'->'duration')
+                   WHEN 'number' THEN (e.event->'data'->>'duration')::numeric
+               END
+        FROM jsonb_array_elements({events}) WITH ORDINALITY AS e(event, position)
+        WHERE e.event->>'stage' = ANY({stages})
+        ORDER BY array_position({stages}, e.event->>'stage'), e.position
+        LIMIT 1
+    )""".format(events=events('r'), stages=stages)
+
+
+@register
+class FinishedOnTime(Job):
+    """
+    SQL counterpart of app.events.finished_on_time
+    """
+
+    name = 'finished-on-time'
+    help = "Reclassify finished-on-time (and is_rov) with the current threshold"
+
+    sql = """
+        WITH batch AS (
+            SELECT r.id, r.date, r.finished_on_time AS was_on_time, r.is_rov AS was_rov, COALESCE(
+                {valid} < %(threshold)s AND {invalid} < %(threshold)s,
+                false
+            ) AS on_time
+            FROM {table} r
+            WHERE r.id > %(low)s AND r.id <= %(high)s
+        ), updated AS (
+            UPDATE {table} r
+            SET json = jsonb_set(r.json, '{{finished-on-time}}', to_jsonb(b.on_time)),
+                finished_on_time = b.on_time,
+                is_rov = r.rpki_valid_passed IS TRUE AND r.rpki_invalid_passed IS FALSE AND b.on_time
+            FROM batch b
+            WHERE r.id = b.id AND r.date = b.date
+              AND jsonb_typeof(r.json) = 'object'
+              AND (r.json->'finished-on-time' IS DISTINCT FROM to_jsonb(b.on_time)
+                   OR r.finished_on_time IS DISTINCT FROM b.on_time)
+            RETURNING r.date, r.asns, r.rpki_valid_passed IS TRUE AND r.rpki_invalid_passed IS FALSE AS rov,
+                      COALESCE(b.was_on_time, false) AS was_on_time, r.finished_on_time AS on_time,
+                      COALESCE(b.was_rov, false) AS was_rov, r.is_rov
+        ), deltas AS (
+            -- of the counters of AsnRollupManager.record and AsnRovStateManager.record
+            SELECT
+                a.asn,
+                u.date,
+                u.is_rov::int - u.was_rov::int AS rov,
+                u.was_on_time::int - u.on_time::int AS not_on_time,
+                CASE WHEN u.rov THEN u.on_time::int - u.was_on_time::int ELSE 0 END AS rov_on_time
+            FROM updated u
+            CROSS JOIN LATERAL (SELECT DISTINCT unnest(u.asns)) AS a(asn)
+        ), rollups AS (
+            -- never below 0, should the counters be off already
+            UPDATE {rollup_table} t
+            SET rov = GREATEST(t.rov + d.rov, 0), not_on_time = GREATEST(t.not_on_time + d.not_on_time, 0)
+            FROM (
+                SELECT p.period, date_trunc(p.period, d.date AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket,
+                       d.asn, SUM(d.rov) AS rov, SUM(d.not_on_time) AS not_on_time
+                FROM deltas d
+                CROSS JOIN (VALUES (%(hour)s), (%(day)s)) AS p(period)
+                GROUP BY 1, 2, 3
+            ) d
+            WHERE t.period = d.period AND t.bucket = d.bucket AND t.asn = d.asn
+              AND (d.rov <> 0 OR d.not_on_time <> 0)
+        ), states AS (
+            UPDATE {state_table} s
+            SET rov_on_time_count = GREATEST(s.rov_on_time_count + d.rov_on_time, 0)
+            FROM (SELECT asn, SUM(rov_on_time) AS rov_on_time FROM deltas GROUP BY asn) d
+            WHERE s.asn = d.asn AND d.rov_on_time <> 0
+        )
+        SELECT COUNT(*) FROM updated
+    """.format(
+        table=Result._meta.db_table,
+        rollup_table=AsnRollup._meta.db_table,
+        state_table=AsnRovState._meta.db_table,
+        valid=first_duration("ARRAY['validReceived']"),
+        invalid=first_duration("ARRAY['invalidBlocked', 'invalidReceived']"),
+    )
+
+    def batch(self, cursor, low, high):
+        cursor.execute(self.sql, {
+            "low": low, "high": high, "threshold": ON_TIME_THRESHOLD, "hour": AsnRollup.HOUR, "day": AsnRollup.DAY
+        })
+        changed, = cursor.fetchone()
+        return changed
+
+
+@register
+class Scrub(Job):
+    name = 'scrub'
+    help = "Apply the DataProtector rules to the stored events again"
+
+    def batch(self, cursor, low, high):
+        cursor.execute("SELECT id, date, json FROM {table} WHERE id > %s AND id <= %s".format(
+            table=Result._meta.db_table
+        ), [low, high])
+
+        changed = []
+        for id, date, payload in cursor.fetchall():
+            scrubbed = copy.deepcopy(payload)
+
+            if isinstance(scrubbed, dict):
+                scrubbed.pop("ip", None)
+                if isinstance(scrubbed.get("events"), list):
+                    try:
+                        scrub_events(scrubbed["events"])
+                    except (KeyError, TypeError, AttributeError, IndexError):
+                        # not something the beacon sends, leave it be
+                        continue
+
+            if scrubbed != payload:
+                changed.append((id, date, json.dumps(scrubbed)))
+
+        if changed:
+            execute_values(cursor, """
+                UPDATE {table} r SET json = v.json::jsonb
+                FROM (VALUES %s) AS v(id, date, json)
+                WHERE r.id = v.id AND r.date = v.date
+            """.format(table=Result._meta.db_table), changed, template="(%s, %s::timestamptz, %s)")
+
+        return len(changed)
+
+
+def next_bound(cursor, last_id, batch_size):
+    """
+    :return: (highest id of the next batch, number of rows in it), (None, 0) if there's none left
+    """
+
+    cursor.execute("""
+        SELECT MAX(id), COUNT(*)
+        FROM (SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT %s) s
+    """.format(table=Result._meta.db_table), [last_id, batch_size])
+
+    return cursor.fetchone()
+
+
+def batch_days(cursor, last_id, high):
+    """
+    :return: the UTC days of the Results of a batch
+    """
+
+    cursor.execute("""
+        SELECT DISTINCT date_trunc('day', date AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+        FROM {table} WHERE id > %s AND id <= %s
+    """.format(table=Result._meta.db_table), [last_id, high])
+
+    return [day for day, in cursor.fetchall()]
+
+
+def run(name, batch_size=None, sleep=None, max_batches=None, restart=False, progress=None):
+    """
+    Run (or resume) a job until it's done or max_batches have been run
+
+    :param progress: called with (BackfillJob, rows of the batch, seconds spent on it) after each batch
+    :return: BackfillJob
+    :raise: BackfillFinished if the job has been run to completion already
+    """
+
+    job = JOBS[name]
+    batch_size = batch_size or config.backfill_batch_size
+    sleep = config.backfill_sleep if sleep is None else sleep
+
+    if restart:
+        BackfillJob.objects.filter(name=name).delete()
+
+    state, _ = BackfillJob.objects.get_or_create(name=name)
+    if state.finished:
+        raise BackfillFinished("{name} has been run already, see --restart".format(name=name))
+
+    batches = 0
+    done = False
+
+    while not done and (max_batches is None or batches < max_batches):
+        start = time.perf_counter()
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # another run of the same job waits for this batch, and carries on after it
+            state = BackfillJob.objects.select_for_update().get(pk=state.pk)
+            if state.finished:
+                return state
+
+            high, rows = next_bound(cursor, state.last_id, batch_size)
+            if high is None:
+                done = True
+                continue
+
+            changed = job.batch(cursor, state.last_id, high)
+            if changed:
+                # e.g. the origin of the latency stats
+                invalidate_latency(batch_days(cursor, state.last_id, high))
+
+            seconds = time.perf_counter() - start
+            state.last_id = high
+            state.batches += 1
+            state.rows += rows
+            state.changed += changed
+            state.seconds += seconds
+            state.save()
+
+        batches += 1
+        if progress is not None:
+            progress(state, rows, seconds)
+
+        if sleep:
+            time.sleep(sleep)
+
+    if done:
+        job.finish()
+        state.finished = True
+        state.save()
+
+    return state
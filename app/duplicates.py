@@ -0,0 +1,101 @@
+"""
+Duplicate submissions (browser retries, pages posting a measurement twice)
+
+The beacon tests fetch <hash>.rpki-valid-beacon.meerval.net and
+<hash>.rpki-invalid-beacon.meerval.net, the hash being unique to the run.
+The hash is scrubbed from what we store (see DataProtector), but before
+that a keyed, non-reversible fingerprint is derived from it: HMAC-SHA256 with
+config.fingerprint_key (SECRET_KEY by default), so it can't be matched
+against hashes seen elsewhere.
+
+A fingerprint is claimed in the cache (cache.add, atomic on memcached)
+for config.duplicate_window seconds, repeated posts within the window cost
+a cache lookup. Past the window, or when the cache has been flushed, the
+unique (fingerprint, date) constraint of app_result catches them on insert.
+The constraint has to include the partition key, so it only catches
+repeated posts of the same date; the cache catches any.
+"""
+
+import hashlib
+import hmac
+import re
+from django.conf import settings
+from django.core.cache import cache
+from rpki_validation_browser.utils import config
+
+PREFIX = 'result-fp'
+CONSTRAINT = 'result_fingerprint_uniq'
+
+# the beacon names runs with a UUID, anything else isn't unique enough to dedupe on
+RUN_HASH = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE)
+
+
+class DuplicateResult(Exception):
+    pass
+
+
+def beacon_hash(payload):
+    """
+    :param payload: Result.json as posted, before scrubbing
+    :return: the run's hash, from the first test URL found, None if there's none
+             or it isn't a UUID
+    """
+
+    for event in payload.get("events") or []:
+        data = event.get("data") or {}
+        urls = [o.get("url") for o in data.get("testUrls") or [] if isinstance(o, dict)]
+        urls.append(data.get("testUrl"))
+
+        for url in urls:
+            if isinstance(url, str) and '://' in url:
+                hash = url.split('://')[1].split('.')[0]
+                return hash if RUN_HASH.match(hash) else None
+
+    return None
+
+
+def fingerprint(payload):
+    """
+    :param payload: Result.json as posted, before scrubbing
+    :return: hex fingerprint of the run, None if it has no hash
+    """
+
+    hash = beacon_hash(payload)
+    if hash is None:
+        return None
+
+    key = (config.fingerprint_key or settings.SECRET_KEY).encode()
+
+    return hmac.new(key, hash.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def claim(fp):
+    """
+    :return: False if the fingerprint has been claimed within config.duplicate_window
+    """
+
+    if fp is None or not config.duplicate_window:
+        return True
+
+    return cache.add("{prefix}:{fp}".format(prefix=PREFIX, fp=fp), 1, config.duplicate_window)
+
+
+def release(fp):
+    """
+    Forget a claim, when the result couldn't be saved after all
+    """
+
+    if fp is not None:
+        cache.delete("{prefix}:{fp}".format(prefix=PREFIX, fp=fp))
+
+
+def is_duplicate_error(error):
+    """
+    :param error: IntegrityError
+    :return: True if it's the unique (fingerprint, date) constraint being violated
+    """
+
+    # reported by the partition, e.g. app_result_p201908_fingerprint_date_key
+    name = getattr(getattr(error.__cause__, 'diag', None), 'constraint_name', None) or ''
+
+    return name == CONSTRAINT or name.endswith('_fingerprint_date_key')
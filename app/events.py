@@ -0,0 +1,147 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from .libs import DataProtector
+
+# Both fetches must complete under this many ms
+# for a result to be flagged finished-on-time
+ON_TIME_THRESHOLD = 5000
+
+# stage -> rules scrubbing the first event of that stage
+SCRUB_RULES = {
+    # Strip out any trailing strings after /, remove URLs containing hashes
+    "initialized": (DataProtector.protect_origin, DataProtector.protect_initialized),
+    # Remove traces of IP in enrichedReceived event
+    "enrichedReceived": (DataProtector.protect_entich_received,),
+    # Remove hashes from <hash>.url.tld
+    "validReceived": (DataProtector.protect_event,),
+    "invalidReceived": (DataProtector.protect_event,),
+    "invalidAwait": (DataProtector.protect_event,),
+    "invalidBlocked": (DataProtector.protect_event,),
+}
+
+# timed stages, as stored in ResultEvent.stage (don't renumber)
+STAGES = {
+    "enrichedReceived": 1,
+    "validReceived": 2,
+    "invalidReceived": 3,
+    "invalidAwait": 4,
+    "invalidBlocked": 5,
+}
+
+
+def index_events(events):
+    """
+    :param events: Result.json['events']
+    :return: stage -> position of the first event of that stage
+    """
+    index = {}
+    for position, event in enumerate(events):
+        index.setdefault(event["stage"], position)
+
+    return index
+
+
+def finished_on_time(events, index):
+    """
+    Flag this experiment as finished-on-time if
+    time to fetch valid < ON_TIME_THRESHOLD and
+    time to fetch invalid < ON_TIME_THRESHOLD
+    """
+
+    valid = index.get("validReceived")
+
+    # ROV = True, otherwise ROV = False
+    invalid = index.get("invalidBlocked")
+    if invalid is None:
+        invalid = index.get("invalidReceived")
+
+    # other cases are not considered to have finished-on-time
+    if valid is None or invalid is None:
+        return False
+
+    return events[invalid]["data"]["duration"] < ON_TIME_THRESHOLD and \
+        events[valid]["data"]["duration"] < ON_TIME_THRESHOLD
+
+
+def process_events(payload):
+    """
+    Scrub and classify the events of a submitted result in a single pass.
+    Works in place.
+
+    :param payload: Result.json, with an "events" array
+    :return: stage index, as returned by index_events
+    """
+
+    index = scrub_events(payload["events"])
+
+    payload["finished-on-time"] = finished_on_time(payload["events"], index)
+
+    return index
+
+
+def scrub_events(events):
+    """
+    Apply the DataProtector rules to events, in place
+
+    :param events: Result.json['events']
+    :return: stage index, as returned by index_events
+    """
+
+    index = {}
+
+    for position, event in enumerate(events):
+        stage = event["stage"]
+
+        # Remove individual ip address stored in events array
+        DataProtector.wipe_ip(event)
+
+        if stage in index:
+            continue
+
+        index[stage] = position
+        for rule in SCRUB_RULES.get(stage, ()):
+            rule(event)
+
+    return index
+
+
+def rounded(value):
+    """
+    :return: int, half away from zero as round(numeric) in ResultEventManager.rebuild
+             (not half to even), None if value isn't a number
+    """
+
+    if type(value) not in (int, float):
+        return None
+
+    try:
+        return int(Decimal(str(value)).quantize(0, ROUND_HALF_UP))
+    except InvalidOperation:
+        # more digits than the decimal context's precision, inf / nan
+        return None
+
+
+def timings(events, index):
+    """
+    :param events: Result.json['events']
+    :param index: stage index, as returned by index_events
+    :return: list of (stage, duration, success, address family) of the first
+             event of each timed stage (see STAGES), None where not a number / boolean
+    """
+
+    rows = []
+    for stage, position in index.items():
+        if stage not in STAGES:
+            continue
+
+        event = events[position]
+        data = event.get("data") or {}
+        success = event.get("success")
+
+        rows.append((
+            STAGES[stage],
+            rounded(data.get("duration")),
+            success if type(success) is bool else None,
+            rounded(data.get("addressFamily")),
+        ))
+
+    return rows
@@ -0,0 +1,92 @@
+"""
+Streaming export of Results, for `manage.py export_results` and GET /results/export/.
+Rows are read through a server-side cursor and written out one at a time,
+so memory use doesn't depend on the number of rows exported.
+"""
+
+import csv
+import json
+import zlib
+from itertools import chain
+from .models import Result
+
+FIELDS = [
+    'id', 'date', 'asns', 'pfx', 'rpki_valid_passed', 'rpki_invalid_passed',
+    'finished_on_time', 'is_rov', 'json'
+]
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def results(since=None, until=None, asn=None):
+    queryset = Result.objects.order_by('date')
+
+    if since is not None:
+        queryset = queryset.filter(date__gte=since)
+    if until is not None:
+        queryset = queryset.filter(date__lt=until)
+    if asn is not None:
+        queryset = queryset.filter(asns__contains=[str(asn)])
+
+    return queryset
+
+
+def rows(queryset, chunk_size=2000):
+    for row in queryset.values_list(*FIELDS).iterator(chunk_size=chunk_size):
+        row = dict(zip(FIELDS, row))
+        row['date'] = row['date'].isoformat()
+        yield row
+
+
+def ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+class Echo:
+    """
+    File-like object handing back what is written to it, to stream csv.writer output
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        row['asns'] = ' '.join(row['asns'])
+        row['json'] = json.dumps(row['json'])
+        yield writer.writerow([row[field] for field in FIELDS])
+
+
+def export(queryset, fmt='ndjson', chunk_size=2000, archived=()):
+    """
+    :param archived: rows read from the archive (see app.archive.rows), written out first
+    :return: iterator of str, in the requested format
+    """
+
+    lines = csv_lines if fmt == 'csv' else ndjson
+
+    return lines(chain(archived, rows(queryset, chunk_size)))
+
+
+def gzipped(lines):
+    """
+    :param lines: iterator of str
+    :return: iterator of gzip compressed bytes
+    """
+
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+
+    for line in lines:
+        chunk = compressor.compress(line.encode())
+        if chunk:
+            yield chunk
+
+    yield compressor.flush()
@@ -0,0 +1,242 @@
+"""
+Bulk import of Result dumps, for `manage.py import_results`
+
+Reads, as a stream:
+    - fixtures (`manage.py dumpdata app.result`, app/fixtures/*.json),
+      a JSON array of {"model": "app.result", "fields": {...}}
+    - NDJSON, one fixture object, exported row (`manage.py export_results`)
+      or result as POSTed to /results/ ({"json": {...}, "date": ...}) per line
+
+Results are inserted with COPY in batches (see ResultManager.copy), ids are
+assigned by the database, along with their ResultEvents. AsnRovState and
+AsnRollup are rebuilt once at the end rather than maintained per batch, and
+no notification is queued for historical results.
+
+With rescrub, records are validated, scrubbed and classified in worker
+processes (see app.pool), in order; this process parses the dump and is
+the only one writing to the database.
+
+ImportJob.position, the number of records read, is moved forward in the
+transaction of each batch: importing the same dump again resumes after the
+last committed batch.
+"""
+
+import json
+from functools import partial
+from itertools import islice
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from .ingest import process, insert
+from .pool import imap
+from .models import Result, ResultEvent, AsnRovState, AsnRollup, ImportJob
+
+CHUNK = 1 << 20
+
+# a record not parsed within that many characters is taken as broken JSON
+MAX_RECORD = 64 << 20
+
+# between top level values: whitespace, and the brackets and commas of a fixture's array
+SEPARATORS = ' \t\r\n,[]'
+
+
+class ImportConflict(Exception):
+    pass
+
+
+def values(f):
+    """
+    :param f: text file, a JSON array or JSON values one after the other (NDJSON)
+    :return: iterator of the top level values, or of the items of the top level array
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    while True:
+        while position < len(buffer) and buffer[position] in SEPARATORS:
+            position += 1
+
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+            # a number might go on in the next chunk
+            complete = end < len(buffer) or eof
+        except ValueError:
+            if eof:
+                if position < len(buffer):
+                    raise
+                return
+            if len(buffer) - position > MAX_RECORD:
+                raise ValueError("invalid JSON, or a record of more than {max} characters".format(max=MAX_RECORD))
+            complete = False
+
+        if not complete:
+            chunk = f.read(CHUNK)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        yield value
+        position = end
+
+
+def to_fields(record, rescrub=False):
+    """
+    :param record: fixture object, exported row or POSTed result
+    :param rescrub: scrub and classify again, as ResultView does (see app.ingest.process)
+    :return: dict of Result fields (json, date, fingerprint), None for fixture objects of other models
+    :raise: ValueError, ValidationError
+    """
+
+    if not isinstance(record, dict):
+        raise ValueError("expected a JSON object")
+
+    if "model" in record:
+        if record["model"] != "app.result":
+            return None
+        record = record.get("fields") or {}
+
+    if not isinstance(record.get("json"), dict):
+        raise ValueError("json: expected an object")
+
+    data = {"json": record["json"], "date": record.get("date")}
+    fingerprint = record.get("fingerprint")
+
+    if rescrub:
+        data, fingerprint = process(data)
+        fingerprint = fingerprint or record.get("fingerprint")
+
+    date = parse_datetime(data["date"]) if isinstance(data["date"], str) else None
+    if date is None:
+        raise ValueError("date: expected an ISO 8601 date-time")
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+
+    return {"json": data["json"], "date": date, "fingerprint": fingerprint}
+
+
+def to_result(record, rescrub=False):
+    """
+    :return: unsaved Result, None for fixture objects of other models (see to_fields)
+    """
+
+    fields = to_fields(record, rescrub=rescrub)
+
+    return None if fields is None else Result(**fields)
+
+
+def convert(record, rescrub=False):
+    """
+    to_fields, for the worker processes
+
+    :return: (fields, None), or (None, the error) if the record can't be imported
+    """
+
+    try:
+        return to_fields(record, rescrub=rescrub), None
+    except (ValueError, KeyError, TypeError, ValidationError) as e:
+        return None, e
+
+
+def commit(job, results, read, skipped, rejected):
+    """
+    Insert a batch and move the job forward, in one transaction
+
+    :param read: number of records the batch covers, Results or not
+    """
+
+    with transaction.atomic():
+        saved = insert(results, copy=True)
+        ResultEvent.objects.record(saved)
+
+        dates = [result.date for result in saved]
+        if job.since is not None:
+            dates += [job.since, job.until]
+
+        progress = dict(
+            position=job.position + read,
+            imported=job.imported + len(saved),
+            # already stored
+            skipped=job.skipped + skipped + len(results) - len(saved),
+            rejected=job.rejected + rejected,
+            since=min(dates) if dates else None,
+            until=max(dates) if dates else None,
+            updated=timezone.now(),
+        )
+
+        # claims the job's position, in case the same dump is being imported twice
+        if not ImportJob.objects.filter(pk=job.pk, position=job.position).update(**progress):
+            raise ImportConflict("{job} has been moved forward by another import".format(job=job.name))
+
+    for key, value in progress.items():
+        setattr(job, key, value)
+
+
+def rebuild(job):
+    """
+    Rebuild the tables derived from the Results, once they've all been imported
+
+    :return: (ASNs in AsnRovState, rollup rows written)
+    """
+
+    if job.since is None:
+        return AsnRovState.objects.count(), 0
+
+    return AsnRovState.objects.rebuild(), AsnRollup.objects.recompute(since=job.since, until=job.until)
+
+
+def run(f, job, batch_size=10000, rescrub=False, progress=None, reject=None, processes=None):
+    """
+    Import records from `f`, from job.position on
+
+    :param f: text file (see values)
+    :param job: ImportJob
+    :param progress: called with the number of records read, after each batch
+    :param reject: called with (position, record, error) for the records which can't be imported
+    :param processes: worker processes with rescrub, see app.pool.workers
+    """
+
+    # without rescrub there's too little to do per record to make up for sending it to a worker
+    records = imap(partial(convert, rescrub=rescrub), islice(values(f), job.position, None),
+                   processes=processes if rescrub else 1)
+
+    results = []
+    read = skipped = rejected = 0
+
+    for position, (record, (fields, error)) in enumerate(records, start=job.position):
+        read += 1
+
+        try:
+            if error is not None:
+                raise error
+
+            result = None if fields is None else Result(**fields)
+
+            if result is None or result.is_documentation():
+                skipped += 1
+            else:
+                results.append(result)
+        except (ValueError, KeyError, TypeError, ValidationError) as e:
+            rejected += 1
+            if reject is not None:
+                reject(position, record, e)
+
+        if read >= batch_size:
+            commit(job, results, read, skipped, rejected)
+            if progress is not None:
+                progress(read)
+
+            results = []
+            read = skipped = rejected = 0
+
+    if read:
+        commit(job, results, read, skipped, rejected)
+        if progress is not None:
+            progress(read)
+
+    job.finished = True
+    job.save()
@@ -0,0 +1,142 @@
+import copy
+from django.db import transaction, IntegrityError
+from .models import Result, Notification
+from . import duplicates
+from .events import process_events
+from .validation import validate_result
+from . import metrics
+
+
+def prepare(data):
+    """
+    Validate a submitted result, remove the data we don't want to keep
+    and classify it (finished-on-time). Works in place.
+
+    :param data: {"json": {...}, "date": ...} as posted by the client
+    :return: (stage index of the events (see app.events.index_events),
+              fingerprint of the beacon run (see app.duplicates))
+    """
+
+    with metrics.stage('validate'):
+        validate_result(data)
+
+    __json = data["json"]
+
+    # before the hash of the run is scrubbed
+    fingerprint = duplicates.fingerprint(__json)
+
+    # Remove sensitive data we just don't want to store in our DB
+
+    # Remove individual ip address
+    if "ip" in __json.keys():
+        del __json["ip"]
+
+    # Track if the result finished on time ( t < 5000 )
+    __json["finished-on-time"] = False
+
+    # Scrub what we don't *really* need from the events
+    # and flag finished-on-time, in one pass
+    index = {}
+    if "events" in __json.keys():
+        with metrics.stage('scrub'):
+            index = process_events(__json)
+
+    return index, fingerprint
+
+
+def process(data):
+    """
+    prepare, as a pure function of plain data, to be run in worker processes
+    (see app.pool): data is left as is
+
+    :param data: {"json": {...}, "date": ...}
+    :return: (prepared copy of data, fingerprint)
+    :raise: ValidationError
+    """
+
+    data = copy.deepcopy(data)
+    _, fingerprint = prepare(data)
+
+    return data, fingerprint
+
+
+def insert(results, copy=False):
+    """
+    Insert Results in bulk, leaving out those which have been stored already,
+    or twice within the batch (same fingerprint and date, see app.duplicates)
+
+    :param results: list of unsaved Result
+    :param copy: insert with COPY rather than INSERT
+    :return: list of the Results which have been inserted
+    """
+
+    # bulk_create doesn't send pre_save/post_save, see app.signals
+    for result in results:
+        result.sync_columns()
+
+    write = Result.objects.copy if copy else Result.objects.bulk_create
+
+    try:
+        with transaction.atomic():
+            write(results)
+    except IntegrityError as e:
+        if not duplicates.is_duplicate_error(e):
+            raise
+
+        # duplicates of results older than the cache window, or within the batch
+        seen = set(Result.objects.filter(
+            fingerprint__in=[result.fingerprint for result in results]
+        ).values_list('fingerprint', 'date'))
+
+        unique = []
+        for result in results:
+            key = (result.fingerprint, result.date)
+            if result.fingerprint is None or key not in seen:
+                seen.add(key)
+                unique.append(result)
+
+        results = unique
+        write(results)
+
+    return results
+
+
+def save_results(results, claim=True, copy=False):
+    """
+    Insert prepared Results in bulk, together with their derived rows
+    (see ResultManager.record_derived) and the notifications they trigger,
+    in one transaction.
+    Results from documentation ASNs and duplicates (see app.duplicates)
+    are not persisted.
+
+    :param results: list of unsaved Result, with their fingerprint set
+    :param claim: claim the fingerprints, False if that's been done already (see app.spool)
+    :param copy: insert with COPY rather than INSERT
+    :return: list of the Results which have been saved
+    """
+
+    results = [
+        result for result in results
+        if not result.is_documentation() and (not claim or duplicates.claim(result.fingerprint))
+    ]
+
+    try:
+        with transaction.atomic():
+            results = insert(results, copy=copy)
+
+            new = Result.objects.record_derived(results)
+
+            # notify the first result of each AS new to ROV
+            for result in results:
+                asns = set(result.get_asns())
+
+                if asns & new and result.is_doing_rpki():
+                    Notification.objects.enqueue_new_rov(result)
+                    new -= asns
+    except Exception:
+        if claim:
+            for result in results:
+                duplicates.release(result.fingerprint)
+        raise
+
+    return results
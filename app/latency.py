@@ -0,0 +1,375 @@
+"""
+Latency distributions of the beacon fetches, for GET /stats/latency/
+
+Durations are read from ResultEvent (see app.events.timings) in chunks of
+config.latency_chunk_size rows into NumPy arrays, and counted into histograms
+on fixed bin edges (EDGES), per UTC day, stage and group (ASN, address family
+or origin site). Quantiles, the fraction of fetches over the finished-on-time
+threshold and coarser histograms are then computed from the histograms
+summed over the days asked for, for every group at once.
+
+Past days' histograms are cached for config.latency_cache_ttl seconds, the
+day in progress is always read. Past days do change: results are posted with
+a date of their own, dumps imported, ResultEvents rebuilt, Results scrubbed
+again, archived or expired. Whatever writes or deletes them calls `invalidate`
+with their dates, which replaces the generation token of those days in the keys
+of their cached histograms (or the token of all days, without dates).
+
+Quantiles are interpolated within a bin, so they're as precise as the bins
+are wide: 10 ms up to 1 s, 50 ms up to 10 s, 500 ms up to 60 s.
+"""
+
+import io
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+import numpy
+from django.core.cache import cache
+from django.db import connection
+from rpki_validation_browser.utils import config
+from .events import STAGES, ON_TIME_THRESHOLD
+from .models import Result, ResultEvent
+
+PREFIX = 'latency'
+GENERATION = PREFIX + ':generation'
+
+EDGES = numpy.concatenate([
+    numpy.arange(0, 1000, 10),
+    numpy.arange(1000, 10000, 50),
+    numpy.arange(10000, 60001, 500),
+])
+# the last bin is everything from EDGES[-1] on
+BINS = len(EDGES)
+
+# of the histograms returned
+COARSE_EDGES = numpy.arange(0, 10001, 500)
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+STAGE_NAMES = {value: name for name, value in STAGES.items()}
+
+# group -> SQL expression of its label
+GROUPS = {
+    'none': "''",
+    'asn': "a.asn",
+    'family': "COALESCE(e.address_family::text, '')",
+    'origin': """COALESCE((
+        SELECT i->'data'->>'originLocation'
+        FROM jsonb_array_elements(
+            CASE jsonb_typeof(r.json->'events') WHEN 'array' THEN r.json->'events' ELSE '[]' END
+        ) AS i
+        WHERE i->>'stage' = 'initialized'
+        LIMIT 1
+    ), '')""",
+}
+
+
+class Histograms:
+    """
+    Sparse histograms of durations, one per (label, stage) row:
+    the non-empty bins as (rows, bins, counts), sorted by row and bin
+    """
+
+    def __init__(self, labels, stages, rows, bins, counts):
+        self.labels = labels
+        self.stages = stages
+        self.rows = rows
+        self.bins = bins
+        self.counts = counts
+
+    @classmethod
+    def empty(cls):
+        return cls.build(numpy.array([], dtype=str), *(numpy.array([], dtype=numpy.int64) for _ in range(3)))
+
+    @classmethod
+    def build(cls, names, keys, bins, counts):
+        """
+        :param names: sorted array of labels
+        :param keys: index in names * 256 + stage, per entry
+        :param bins: per entry
+        :param counts: per entry, entries of the same key and bin are summed
+        """
+
+        flat, inverse = numpy.unique(keys * BINS + bins, return_inverse=True)
+        counts = numpy.bincount(inverse.reshape(-1), weights=counts, minlength=len(flat)).astype(numpy.int64)
+
+        row_keys, rows = numpy.unique(flat // BINS, return_inverse=True)
+
+        return cls(names[row_keys // 256], (row_keys % 256).astype(numpy.int16),
+                   rows.reshape(-1), flat % BINS, counts)
+
+    @classmethod
+    def count(cls, labels, stages, durations):
+        """
+        :param labels: array of group labels, one per duration
+        :param stages: array of ResultEvent.stage, one per duration
+        :param durations: array of ms
+        """
+
+        names, inverse = numpy.unique(labels, return_inverse=True)
+        bins = numpy.clip(numpy.searchsorted(EDGES, durations, side='right') - 1, 0, BINS - 1)
+
+        return cls.build(names, inverse.reshape(-1).astype(numpy.int64) * 256 + stages, bins,
+                         numpy.ones(len(durations), dtype=numpy.int64))
+
+    @classmethod
+    def merge(cls, histograms):
+        names = numpy.unique(numpy.concatenate([h.labels for h in histograms] or [numpy.array([], dtype=str)]))
+
+        keys = [
+            (numpy.searchsorted(names, h.labels).astype(numpy.int64) * 256 + h.stages)[h.rows]
+            for h in histograms
+        ]
+
+        return cls.build(
+            names,
+            numpy.concatenate(keys or [numpy.array([], dtype=numpy.int64)]),
+            numpy.concatenate([h.bins for h in histograms] or [numpy.array([], dtype=numpy.int64)]),
+            numpy.concatenate([h.counts for h in histograms] or [numpy.array([], dtype=numpy.int64)]),
+        )
+
+    def totals(self):
+        return numpy.bincount(self.rows, weights=self.counts, minlength=len(self.labels)).astype(numpy.int64)
+
+    def dumps(self):
+        f = io.BytesIO()
+        numpy.savez_compressed(f, labels=self.labels, stages=self.stages, rows=self.rows.astype(numpy.int32),
+                               bins=self.bins.astype(numpy.int16), counts=self.counts)
+        return f.getvalue()
+
+    @classmethod
+    def loads(cls, data):
+        arrays = numpy.load(io.BytesIO(data))
+        return cls(arrays['labels'], arrays['stages'], arrays['rows'].astype(numpy.int64),
+                   arrays['bins'].astype(numpy.int64), arrays['counts'])
+
+
+def read_day(day, group, asn=None):
+    """
+    :param day: datetime, start of a UTC day
+    :return: Histograms of that day
+    """
+
+    join = "JOIN {result_table} r ON r.id = e.result_id AND r.date = e.date".format(
+        result_table=Result._meta.db_table
+    )
+    if group == 'asn':
+        join += " CROSS JOIN LATERAL (SELECT DISTINCT unnest(r.asns)) AS a(asn)"
+
+    # the bounds on r.date prune the other partitions
+    conditions = ["e.stage = ANY(%s)", "e.date >= %s", "e.date < %s", "r.date >= %s", "r.date < %s",
+                  "e.duration IS NOT NULL"]
+    params = [list(STAGE_NAMES), day, day + timedelta(days=1), day, day + timedelta(days=1)]
+    if asn is not None:
+        conditions.append("r.asns @> ARRAY[%s]::varchar(16)[]")
+        params.append(str(asn))
+
+    sql = """
+        SELECT {label}, e.stage, e.duration
+        FROM {table} e
+        {join}
+        WHERE {where}
+    """.format(
+        label=GROUPS[group],
+        table=ResultEvent._meta.db_table,
+        join=join,
+        where=" AND ".join(conditions)
+    )
+
+    histograms = Histograms.empty()
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+
+        while True:
+            rows = cursor.fetchmany(config.latency_chunk_size)
+            if not rows:
+                break
+
+            labels, stages, durations = zip(*rows)
+            histograms = Histograms.merge([histograms, Histograms.count(
+                numpy.array(labels, dtype=str),
+                numpy.array(stages, dtype=numpy.int16),
+                numpy.array(durations, dtype=numpy.int64),
+            )])
+
+    return histograms
+
+
+def generation(day=None):
+    """
+    :param day: start of a UTC day, None for the token of all days
+    :return: token in the keys of the cached histograms, see invalidate
+    """
+
+    key = GENERATION if day is None else "{generation}:{day:%Y%m%d}".format(generation=GENERATION, day=day)
+
+    token = cache.get(key)
+    if token is None:
+        # never one of a previous generation, should the key have been evicted
+        cache.add(key, time.time_ns(), None)
+        token = cache.get(key)
+
+    return token
+
+
+def invalidate(dates=None):
+    """
+    Histograms of past days are read again from now on
+
+    :param dates: of the ResultEvents written or deleted, only their days are invalidated
+                  (none of the day in progress, which isn't cached), all days without dates
+    """
+
+    if dates is None:
+        cache.set(GENERATION, time.time_ns(), None)
+        return
+
+    now = datetime.now(dt_timezone.utc)
+    today = datetime(now.year, now.month, now.day, tzinfo=dt_timezone.utc)
+
+    past = set()
+    for date in dates:
+        if not isinstance(date, datetime):
+            # can't tell its day
+            return invalidate()
+
+        date = (date if date.tzinfo else date.replace(tzinfo=dt_timezone.utc)).astimezone(dt_timezone.utc)
+        day = datetime(date.year, date.month, date.day, tzinfo=dt_timezone.utc)
+        if day < today:
+            past.add(day)
+
+    if past:
+        token = time.time_ns()
+        cache.set_many({
+            "{generation}:{day:%Y%m%d}".format(generation=GENERATION, day=day): token for day in past
+        }, None)
+
+
+def day_histograms(day, group, asn=None, now=None):
+    """
+    Histograms of a day, through the cache once the day is over
+    """
+
+    now = now or datetime.now(dt_timezone.utc)
+    if day + timedelta(days=1) > now:
+        return read_day(day, group, asn)
+
+    key = "{prefix}:{generation}:{day_generation}:{group}:{asn}:{day:%Y%m%d}".format(
+        prefix=PREFIX, generation=generation(), day_generation=generation(day), group=group, asn=asn or '', day=day
+    )
+
+    data = cache.get(key)
+    if data is not None:
+        return Histograms.loads(data)
+
+    histograms = read_day(day, group, asn)
+    cache.set(key, histograms.dumps(), config.latency_cache_ttl)
+
+    return histograms
+
+
+def days(since, until):
+    """
+    :return: start of the UTC days from since's to until's (exclusive)
+    """
+
+    since = since.astimezone(dt_timezone.utc)
+    day = datetime(since.year, since.month, since.day, tzinfo=dt_timezone.utc)
+    while day < until:
+        yield day
+        day += timedelta(days=1)
+
+
+def quantiles(histograms, qs=QUANTILES):
+    """
+    :return: 2D array of ms, one row per histogram, one column per quantile
+    """
+
+    totals = histograms.totals()
+    cumulative = numpy.cumsum(histograms.counts)
+    widths = numpy.diff(EDGES, append=EDGES[-1])
+
+    # of the first entry of each row
+    first = numpy.searchsorted(histograms.rows, numpy.arange(len(totals)))
+    before_row = numpy.r_[0, cumulative][first]
+
+    columns = []
+    for q in qs:
+        # entries are positive, the cumulative sum of all rows finds the bin within the row
+        target = before_row + q * totals
+        entry = numpy.minimum(numpy.searchsorted(cumulative, target, side='left'), len(cumulative) - 1)
+
+        bins = histograms.bins[entry]
+        within = (target - (cumulative[entry] - histograms.counts[entry])) / histograms.counts[entry]
+
+        columns.append(EDGES[bins] + within * widths[bins])
+
+    return numpy.stack(columns, axis=1) if columns else numpy.zeros((len(totals), 0))
+
+
+def over(histograms, threshold=ON_TIME_THRESHOLD):
+    """
+    :return: fraction of each histogram at or over threshold (not finished-on-time, see app.events)
+    """
+
+    late = histograms.counts * (histograms.bins >= numpy.searchsorted(EDGES, threshold))
+
+    return numpy.bincount(histograms.rows, weights=late, minlength=len(histograms.labels)) / histograms.totals()
+
+
+def coarse(histograms):
+    """
+    :return: 2D array, histograms on COARSE_EDGES, the last bin counting everything over COARSE_EDGES[-1]
+    """
+
+    width = len(COARSE_EDGES)
+    bins = numpy.searchsorted(numpy.searchsorted(EDGES, COARSE_EDGES), histograms.bins, side='right') - 1
+
+    return numpy.bincount(
+        histograms.rows * width + bins, weights=histograms.counts, minlength=len(histograms.labels) * width
+    ).astype(numpy.int64).reshape(-1, width)
+
+
+def stats(since, until, group='none', asn=None, limit=None, now=None):
+    """
+    :param since: datetime, whole UTC days from its day
+    :param until: datetime, exclusive
+    :param group: one of GROUPS
+    :param limit: only the groups with the most fetches
+    :return: list of dict, one per group and stage
+    """
+
+    histograms = Histograms.merge([day_histograms(day, group, asn, now=now) for day in days(since, until)])
+
+    if not len(histograms.labels):
+        return []
+
+    totals = histograms.totals()
+
+    # groups with the most fetches first, stages in order within a group
+    labels, inverse = numpy.unique(histograms.labels, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    per_label = numpy.bincount(inverse, weights=totals, minlength=len(labels))
+    rank = numpy.empty(len(labels), dtype=numpy.int64)
+    rank[numpy.lexsort((labels, -per_label))] = numpy.arange(len(labels))
+
+    order = numpy.lexsort((histograms.stages, rank[inverse]))
+    if limit is not None:
+        order = order[rank[inverse][order] < limit]
+
+    qs = quantiles(histograms)
+    fractions = over(histograms)
+    histogram = coarse(histograms)
+
+    return [
+        {
+            "group": str(histograms.labels[i]) if group != 'none' else None,
+            "stage": STAGE_NAMES[int(histograms.stages[i])],
+            "count": int(totals[i]),
+            "quantiles": {
+                "p{q:g}".format(q=q * 100): round(float(qs[i, j]), 1) for j, q in enumerate(QUANTILES)
+            },
+            "over_threshold": float(fractions[i]),
+            "histogram": histogram[i].tolist(),
+        }
+        for i in order
+    ]
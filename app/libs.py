@@ -1,17 +1,257 @@
-from requests import post, get
-from rpki_validation_browser.settings import DEBUG
+import random
+import time
+import requests
+import requests.adapters
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date as parse_day
 from rpki_validation_browser.utils import config
+from . import metrics
 
 
-class HttpClient:
+def parse_date(value):
+    """
+    :param value: ISO 8601 date or date-time, e.g. 2019-08-28 or 2019-08-28T10:00:00Z
+    :return: timezone aware datetime (UTC if none given), None if it can't be parsed
+    """
+
+    date = parse_datetime(value)
+    if date is None:
+        day = parse_day(value)
+        if day is None:
+            return None
+        date = timezone.datetime(day.year, day.month, day.day)
+
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+
+    return date
+
+
+class TTLCache:
+    """
+    Two tier cache: a small in-process LRU in front of the
+    Django cache framework (memcached, shared by all workers).
+
+    Failures can be cached too (negative caching), usually with a shorter TTL.
+    """
+
+    def __init__(self, prefix, ttl, negative_ttl, size):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.size = size
+
+        self.local = OrderedDict()
+        self.lock = Lock()
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    def key(self, key):
+        return "{prefix}:{key}".format(prefix=self.prefix, key=key)
+
+    def get(self, key):
+        """
+        :return: (found, ok, value), ok=False being a cached failure
+        """
+        key = self.key(key)
+
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.local.move_to_end(key)
+                self.stats['local_hits'] += 1
+                return (True,) + entry[1]
+
+        entry = cache.get(key)
+        if entry is not None:
+            # don't keep it locally for longer than a fresh entry would live
+            self.remember(key, tuple(entry), self.negative_ttl if not entry[0] else self.ttl)
+            self.count('shared_hits')
+            return (True,) + tuple(entry)
+
+        self.count('misses')
+        return False, False, None
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def set(self, key, value):
+        self.store(key, (True, value), self.ttl)
+
+    def set_failure(self, key):
+        self.store(key, (False, None), self.negative_ttl)
+
+    def store(self, key, entry, ttl):
+        key = self.key(key)
+        cache.set(key, entry, ttl)
+        self.remember(key, entry, ttl)
+
+    def remember(self, key, entry, ttl):
+        with self.lock:
+            self.local[key] = (time.monotonic() + ttl, entry)
+            self.local.move_to_end(key)
+
+            while len(self.local) > self.size:
+                self.local.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.local.clear()
+            for k in self.stats:
+                self.stats[k] = 0
+
+
+class RipestatError(Exception):
+    pass
+
+
+class CircuitOpen(requests.RequestException):
     pass
 
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures, then lets a single
+    trial request through every `cooldown` seconds until one succeeds
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self.lock = Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened is None:
+                return True
+
+            if time.monotonic() - self.opened >= self.cooldown:
+                # half open, the next trial is due after another cooldown
+                self.opened = time.monotonic()
+                return True
+
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened = time.monotonic()
+
+
+class HttpClient:
+    """
+    Outbound requests share a keep-alive connection pool, have connect/read timeouts,
+    are retried with jittered exponential backoff (idempotent methods only)
+    and go through a circuit breaker per host, so that a slow or failing
+    upstream fails fast rather than tying up workers.
+    """
+
+    RETRY_METHODS = ('GET', 'HEAD')
+
+    session = None
+    breakers = {}
+    lock = Lock()
+
+    @classmethod
+    def get_session(cls):
+        with HttpClient.lock:
+            if HttpClient.session is None:
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=config.http_pool_size)
+                HttpClient.session = requests.Session()
+                HttpClient.session.mount('http://', adapter)
+                HttpClient.session.mount('https://', adapter)
+
+            return HttpClient.session
+
+    @classmethod
+    def get_breaker(cls, host):
+        with HttpClient.lock:
+            if host not in HttpClient.breakers:
+                HttpClient.breakers[host] = CircuitBreaker(config.http_breaker_threshold, config.http_breaker_cooldown)
+
+            return HttpClient.breakers[host]
+
+    @classmethod
+    def reset(cls):
+        with HttpClient.lock:
+            if HttpClient.session is not None:
+                HttpClient.session.close()
+            HttpClient.session = None
+            HttpClient.breakers.clear()
+
+    @staticmethod
+    def backoff(attempt):
+        # "full jitter"
+        return random.uniform(0, config.http_retry_backoff * 2 ** attempt)
+
+    def request(self, method, url, retries=None, **kwargs):
+        """
+        :param retries: default config.http_retries for idempotent methods, 0 otherwise
+        :return: requests.Response, 5xx included once retries are exhausted
+        :raise: requests.RequestException, CircuitOpen without trying if the host is failing
+        """
+
+        host = urlsplit(url).netloc
+        breaker = self.get_breaker(host)
+
+        if retries is None:
+            retries = config.http_retries if method in self.RETRY_METHODS else 0
+
+        attempt = 0
+        while True:
+
+            if not breaker.allow():
+                raise CircuitOpen("{host}: circuit open after repeated failures".format(host=host))
+
+            start = time.perf_counter()
+            response = None
+            status = 'error'
+
+            try:
+                response = self.get_session().request(
+                    method, url, timeout=(config.http_connect_timeout, config.http_timeout), **kwargs
+                )
+                status = response.status_code
+            except requests.RequestException as e:
+                error = e
+            finally:
+                metrics.observe_http(url, status, time.perf_counter() - start)
+
+            if response is not None and response.status_code < 500:
+                breaker.success()
+                return response
+
+            breaker.failure()
+
+            if attempt >= retries:
+                if response is None:
+                    raise error
+                return response
+
+            attempt += 1
+            time.sleep(self.backoff(attempt))
+
+
 class MattermostClient(HttpClient):
 
     def __init__(self):
         super(MattermostClient, self).__init__()
 
-        if DEBUG:
+        if settings.DEBUG:
             self.send_msg = self.print
         else:
             self.send_msg = self.post
@@ -20,15 +260,16 @@ class MattermostClient(HttpClient):
         return print(msg)
 
     def post(self, msg=""):
-        post(
-            "https://mattermost.ripe.net/hooks/{token}".format(token=config.mattermost_token),
+        self.request(
+            'POST',
+            "{url}/hooks/{token}".format(url=config.mattermost_url, token=config.mattermost_token),
             headers={
               'Content-Type': 'application/json'
             },
             json={
                 "text": msg
             }
-        )
+        ).raise_for_status()
 
 
 class HeClient:
@@ -43,9 +284,78 @@ class RipestatClient(HttpClient):
         if resource is None:
             return None
 
-        return get("https://stat.ripe.net/data/as-overview/data.json?resource={resource}".format(
-            resource=resource
-        )).json()
+        response = self.request(
+            'GET',
+            "{url}/data/as-overview/data.json?resource={resource}".format(
+                url=config.ripestat_url,
+                resource=resource
+            )
+        )
+        response.raise_for_status()
+
+        return response.json()
+
+    def fetch_holder(self, asn):
+        """
+        :param asn: AS number, without the AS prefix
+        :return: AS holder name, cached for config.ripestat_cache_ttl
+        """
+
+        found, ok, holder = holder_cache.get(asn)
+
+        if not found:
+            try:
+                holder = self.fetch_info(resource="AS{asn}".format(asn=asn))['data']['holder']
+            except Exception as e:
+                holder_cache.set_failure(asn)
+                raise RipestatError("AS{asn} holder lookup failed: {e}".format(asn=asn, e=e))
+
+            holder_cache.set(asn, holder)
+
+        elif not ok:
+            raise RipestatError("AS{asn} holder lookup failed recently".format(asn=asn))
+
+        return holder
+
+    def fetch_holders(self, asns):
+        """
+        Look holders up concurrently, at most config.http_max_concurrency at a time
+
+        :param asns: AS numbers, without the AS prefix
+        :return: AS holder names, in the same order
+        :raise: RipestatError if any of the lookups failed
+        """
+
+        asns = list(asns)
+
+        if len(asns) <= 1:
+            return [self.fetch_holder(asn) for asn in asns]
+
+        return list(lookups().map(self.fetch_holder, asns))
+
+
+_lookups = None
+
+
+def lookups():
+    """
+    :return: the thread pool upstream lookups are fanned out to
+    """
+    global _lookups
+
+    with HttpClient.lock:
+        if _lookups is None:
+            _lookups = ThreadPoolExecutor(max_workers=config.http_max_concurrency, thread_name_prefix='lookup')
+
+        return _lookups
+
+
+holder_cache = TTLCache(
+    prefix='ripestat-holder',
+    ttl=config.ripestat_cache_ttl,
+    negative_ttl=config.ripestat_negative_ttl,
+    size=config.ripestat_lru_size
+)
 
 
 class DataProtector:
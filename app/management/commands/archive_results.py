@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from app import archive
+from app.models import ArchiveSegment
+from rpki_validation_browser.utils import config
+
+
+class Command(BaseCommand):
+    help = "Move old Results out of app_result into compressed segment files (see app.archive)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=config.archive_after_days,
+                            help="Archive results older than this many days")
+        parser.add_argument('--batch-size', type=int, default=config.archive_batch_size,
+                            help="Results per segment")
+        parser.add_argument('--compression', choices=[ArchiveSegment.GZIP, ArchiveSegment.ZSTD],
+                            default=config.archive_compression)
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Stop after this many segments, default: archive everything old enough")
+
+    def handle(self, *args, **options):
+
+        if not archive.enabled():
+            raise CommandError("archiving is disabled, set archive_dir in the configuration")
+
+        segments = archive.archive(
+            older_than=options['older_than'],
+            batch_size=options['batch_size'],
+            compression=options['compression'],
+            max_batches=options['max_batches'],
+        )
+
+        archived = 0
+        try:
+            for segment in segments:
+                archived += segment.records
+                self.stdout.write(f"wrote {segment} ({segment.size} bytes)")
+        except archive.ArchiveConflict as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} results"))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from app import backfill
+from rpki_validation_browser.utils import config
+
+
+class Command(BaseCommand):
+    help = "Run (or resume) a backfill job over the stored Results, see app.backfill"
+
+    def add_arguments(self, parser):
+        parser.add_argument('job', choices=sorted(backfill.JOBS),
+                            help="; ".join(f"{name}: {job.help}" for name, job in sorted(backfill.JOBS.items())))
+        parser.add_argument('--batch-size', type=int, default=config.backfill_batch_size, help="Rows per batch")
+        parser.add_argument('--sleep', type=float, default=config.backfill_sleep, help="Seconds between batches")
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Stop after this many batches, the next run resumes from there")
+        parser.add_argument('--restart', action='store_true', help="Forget the checkpoint and start over")
+
+    def handle(self, *args, **options):
+
+        def progress(state, rows, seconds):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f"batch {state.batches}: ids up to {state.last_id}, {rows} rows in {seconds:.2f}s "
+                    f"({rows / seconds if seconds else 0:.0f} rows/s), {state.changed} changed so far"
+                )
+
+        try:
+            state = backfill.run(
+                options['job'],
+                batch_size=options['batch_size'],
+                sleep=options['sleep'],
+                max_batches=options['max_batches'],
+                restart=options['restart'],
+                progress=progress
+            )
+        except backfill.BackfillFinished as e:
+            raise CommandError(str(e))
+
+        throughput = state.throughput()
+        self.stdout.write(self.style.SUCCESS(
+            f"{state.name}: {state.rows} rows in {state.batches} batches, {state.changed} changed, "
+            f"{throughput or 0:.0f} rows/s{'' if state.finished else ', not finished'}"
+        ))
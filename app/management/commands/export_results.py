@@ -0,0 +1,51 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from app import archive
+from app.export import FORMATS, results, export, gzipped
+from app.libs import parse_date
+
+
+class Command(BaseCommand):
+    help = "Stream Results out as NDJSON or CSV, optionally gzipped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--since', help="ISO 8601 date, inclusive")
+        parser.add_argument('--until', help="ISO 8601 date, exclusive")
+        parser.add_argument('--asn', help="Only results from this ASN")
+        parser.add_argument('--archived', action='store_true',
+                            help="Include the results moved to cold storage (see archive_results)")
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Rows fetched per round trip of the server-side cursor")
+        parser.add_argument('--output', default='-', help="File to write to, - for stdout")
+
+    def handle(self, *args, **options):
+
+        dates = {}
+        for option in ('since', 'until'):
+            dates[option] = options[option] and parse_date(options[option])
+            if options[option] and dates[option] is None:
+                raise CommandError(f"--{option}: expected an ISO 8601 date")
+
+        lines = export(
+            results(asn=options['asn'], **dates),
+            fmt=options['format'],
+            chunk_size=options['chunk_size'],
+            archived=archive.rows(asn=options['asn'], **dates) if options['archived'] else ()
+        )
+
+        if options['gzip']:
+            lines = gzipped(lines)
+
+        if options['output'] == '-':
+            out = sys.stdout.buffer if options['gzip'] else sys.stdout
+        else:
+            out = open(options['output'], 'wb' if options['gzip'] else 'w')
+
+        try:
+            for chunk in lines:
+                out.write(chunk)
+        finally:
+            if options['output'] != '-':
+                out.close()
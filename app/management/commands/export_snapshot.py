@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+from django.core.management.base import BaseCommand, CommandError
+from app.export import results
+from app.libs import parse_date
+
+
+class Command(BaseCommand):
+    help = "Write Results as flattened columns to Parquet or Arrow IPC files, one per day"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['parquet', 'arrow'], default='parquet')
+        parser.add_argument('--output', required=True, help="Directory to write the day=YYYY-MM-DD/ files to")
+        parser.add_argument('--since', help="ISO 8601 date, inclusive, from the start of its UTC day")
+        parser.add_argument('--until', help="ISO 8601 date, exclusive, to the end of its UTC day if not midnight")
+        parser.add_argument('--asn', help="Only results from this ASN")
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help="Rows per record batch (and per round trip of the server-side cursor)")
+
+    def handle(self, *args, **options):
+
+        try:
+            from app.snapshot import write_snapshot
+        except ImportError:
+            raise CommandError("pyarrow is required for snapshots, pip install pyarrow")
+
+        dates = {}
+        for option in ('since', 'until'):
+            dates[option] = options[option] and parse_date(options[option])
+            if options[option] and dates[option] is None:
+                raise CommandError(f"--{option}: expected an ISO 8601 date")
+
+        # whole UTC days, each day's file is replaced
+        for option, days in (('since', 0), ('until', 1)):
+            date = dates[option] and dates[option].astimezone(timezone.utc)
+            if date:
+                start = datetime(date.year, date.month, date.day, tzinfo=timezone.utc)
+                dates[option] = start if start == date else start + timedelta(days=days)
+
+        counts = write_snapshot(
+            results(asn=options['asn'], **dates),
+            options['output'],
+            fmt=options['format'],
+            batch_size=options['batch_size']
+        )
+
+        for day, count in sorted(counts.items()):
+            self.stdout.write(f"{day}: {count} results")
@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from app import spool
+
+
+class Command(BaseCommand):
+    help = "Load spooled results (see app.spool) in batches with COPY"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Flush what has been spooled so far and exit")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Seconds between flushes (default: config.spool_flush_interval)")
+        parser.add_argument('--if-enabled', action='store_true',
+                            help="Exit quietly when spooling is disabled, rather than with an error")
+
+    def handle(self, *args, **options):
+
+        if not spool.enabled():
+            if options['if_enabled']:
+                return
+            raise CommandError("spooling is disabled, set spool_dir in the configuration")
+
+        interval = options['interval'] if options['interval'] is not None else spool.config.spool_flush_interval
+
+        while True:
+            saved = spool.flush()
+
+            if saved is None:
+                self.stderr.write("another flusher is running")
+            elif saved:
+                self.stdout.write(f"{saved} results loaded")
+
+            if options['once']:
+                break
+
+            time.sleep(interval)
@@ -0,0 +1,83 @@
+import gzip
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from tqdm import tqdm
+from app import importer
+from app.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = "Load a dump of Results (fixture JSON or NDJSON, optionally gzipped) with COPY, resumably"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fixture (JSON array) or NDJSON file, .gz for gzipped")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Results per COPY / transaction")
+        parser.add_argument('--rescrub', action='store_true',
+                            help="Scrub and classify (finished-on-time) again, as on POST /results/")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Processes scrubbing with --rescrub, 0 for one per core, default: config.pool_workers")
+        parser.add_argument('--name', help="Checkpoint to resume from, default: the absolute path of the dump")
+        parser.add_argument('--restart', action='store_true',
+                            help="Forget the checkpoint and import the whole dump again")
+        parser.add_argument('--rejected', help="NDJSON file to write the records which can't be imported to")
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help="Don't rebuild AsnRovState and the rollups at the end")
+        parser.add_argument('--no-progress', action='store_true')
+
+    def handle(self, *args, **options):
+
+        if not os.path.isfile(options['path']):
+            raise CommandError(f"{options['path']}: no such file")
+
+        name = options['name'] or os.path.abspath(options['path'])
+
+        if options['restart']:
+            ImportJob.objects.filter(name=name).delete()
+
+        job, created = ImportJob.objects.get_or_create(name=name)
+
+        if job.finished:
+            raise CommandError(f"{name} has been imported already ({job.imported} results), see --restart")
+
+        if not created:
+            self.stdout.write(f"Resuming {name} after {job.position} records")
+
+        opener = gzip.open if options['path'].endswith('.gz') else open
+        rejected = open(options['rejected'], 'a') if options['rejected'] else None
+
+        def reject(position, record, error):
+            if options['verbosity'] > 1:
+                self.stderr.write(f"record {position}: {error}")
+            if rejected is not None:
+                rejected.write(json.dumps(record) + '\n')
+
+        bar = tqdm(initial=job.position, unit=' records',
+                   disable=options['no_progress'] or options['verbosity'] == 0)
+
+        try:
+            with opener(options['path'], 'rt', encoding='utf-8') as f:
+                importer.run(
+                    f, job,
+                    batch_size=options['batch_size'],
+                    rescrub=options['rescrub'],
+                    processes=options['workers'],
+                    progress=bar.update,
+                    reject=reject
+                )
+        except importer.ImportConflict as e:
+            raise CommandError(str(e))
+        except ValueError as e:
+            raise CommandError(f"{options['path']}, after {job.position} records: {e}")
+        finally:
+            bar.close()
+            if rejected is not None:
+                rejected.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {job.imported} results ({job.skipped} skipped, {job.rejected} rejected)"
+        ))
+
+        if not options['no_rebuild']:
+            asns, rollups = importer.rebuild(job)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt ROV state for {asns} ASNs, wrote {rollups} rollup rows"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from app.partitions import ensure_partitions, expire_partitions
+from rpki_validation_browser.utils import config
+
+
+class Command(BaseCommand):
+    help = "Create upcoming monthly partitions of app_result and detach (or drop) expired ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=config.partition_months_ahead,
+                            help="Months to create partitions for, in advance")
+        parser.add_argument('--retention-months', type=int, default=config.result_retention_months,
+                            help="Expire partitions entirely older than this (0 keeps everything)")
+        parser.add_argument('--drop', action='store_true',
+                            help="Drop expired partitions instead of detaching them")
+
+    def handle(self, *args, **options):
+
+        for name in ensure_partitions(ahead=options['ahead']):
+            self.stdout.write(f"created {name}")
+
+        if options['retention_months']:
+            for name in expire_partitions(options['retention_months'], drop=options['drop']):
+                self.stdout.write(f"{'dropped' if options['drop'] else 'detached'} {name}")
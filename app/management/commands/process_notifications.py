@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from app.models import Notification
+from app.notifications import process_next
+
+
+class Command(BaseCommand):
+    help = "Deliver queued notifications (RIPEstat enrichment + Mattermost), retrying with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the notifications currently due and exit")
+        parser.add_argument('--interval', type=float, default=5,
+                            help="Seconds to sleep when there is nothing to do")
+
+    def handle(self, *args, **options):
+
+        while True:
+            notification = process_next()
+
+            if notification is not None:
+                self.stdout.write(f"{notification} attempts={notification.attempts}")
+                continue
+
+            if options['once']:
+                break
+
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{Notification.objects.filter(status=Notification.PENDING).count()} notifications pending"
+        ))
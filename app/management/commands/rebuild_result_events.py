@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from app.libs import parse_date
+from app.models import ResultEvent
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-stage timings (ResultEvent) from the stored Results"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="ISO 8601 date, inclusive, default: all")
+        parser.add_argument('--until', help="ISO 8601 date, exclusive, default: all")
+
+    def handle(self, *args, **options):
+
+        dates = {}
+        for option in ('since', 'until'):
+            dates[option] = options[option] and parse_date(options[option])
+            if options[option] and dates[option] is None:
+                raise CommandError(f"--{option}: expected an ISO 8601 date")
+
+        written = ResultEvent.objects.rebuild(**dates)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} result events"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from app.models import AsnRovState
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-ASN ROV state table from the stored Results"
+
+    def handle(self, *args, **options):
+        count = AsnRovState.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ROV state for {count} ASNs"))
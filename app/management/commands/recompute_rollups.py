@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from app.libs import parse_date
+from app.models import AsnRollup
+
+
+class Command(BaseCommand):
+    help = "Recompute the hourly and daily per-ASN rollups from the stored Results"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="First day to recompute (ISO 8601), default: all")
+        parser.add_argument('--until', help="Last day to recompute (ISO 8601), default: all")
+
+    def handle(self, *args, **options):
+
+        dates = {}
+        for option in ('since', 'until'):
+            if options[option] is None:
+                dates[option] = None
+                continue
+
+            dates[option] = parse_date(options[option])
+            if dates[option] is None:
+                raise CommandError(f"--{option}: expected an ISO 8601 date")
+
+        written = AsnRollup.objects.recompute(**dates)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} rollup rows"))
@@ -0,0 +1,148 @@
+"""
+Prometheus metrics, exposed at /metrics when config.metrics is set
+
+    rpki_request_seconds{method, view, status}      per request, see MetricsMiddleware
+    rpki_db_queries{view}, rpki_db_seconds{view}    DB queries / time spent in them, per request
+    rpki_stage_seconds{stage}                       stages of ResultView and ResultManager (nested)
+    rpki_http_client_seconds{host, status}          outbound requests of the HttpClient subclasses
+    rpki_notifications_total{kind, outcome}         notifications queued / sent / failed by this process
+    rpki_notification_queue{status}                 notifications in the outbox, read at scrape time
+
+Counters are per process: what `manage.py process_notifications` sends shows up in
+rpki_notification_queue, not in the web server's rpki_notifications_total.
+
+With config.metrics unset every hook is a single attribute lookup.
+"""
+
+from contextlib import nullcontext
+from functools import wraps
+from time import perf_counter
+from urllib.parse import urlsplit
+from django.db import connection, DatabaseError
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from rpki_validation_browser.utils import config
+
+REQUEST = Histogram('rpki_request_seconds', "Request duration", ['method', 'view', 'status'])
+DB_QUERIES = Histogram('rpki_db_queries', "DB queries per request", ['view'],
+                       buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, float('inf')))
+DB_SECONDS = Histogram('rpki_db_seconds', "Time spent in DB queries per request", ['view'])
+STAGE = Histogram('rpki_stage_seconds', "Duration of a stage of ingestion", ['stage'])
+HTTP = Histogram('rpki_http_client_seconds', "Outbound HTTP request duration", ['host', 'status'])
+NOTIFICATIONS = Counter('rpki_notifications', "Notifications queued, sent and failed", ['kind', 'outcome'])
+
+NOOP = nullcontext()
+
+
+def stage(name):
+    """
+    :return: context manager timing the block as rpki_stage_seconds{stage=name}
+    """
+
+    if not config.metrics:
+        return NOOP
+
+    return STAGE.labels(name).time()
+
+
+def timed(name):
+    """
+    Decorator, times calls as rpki_stage_seconds{stage=name}
+    """
+
+    def decorator(fn):
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not config.metrics:
+                return fn(*args, **kwargs)
+
+            with STAGE.labels(name).time():
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def observe_http(url, status, seconds):
+    if config.metrics:
+        HTTP.labels(urlsplit(url).netloc, status).observe(seconds)
+
+
+def notification(kind, outcome):
+    if config.metrics:
+        NOTIFICATIONS.labels(kind, outcome).inc()
+
+
+class QueryStats:
+    """
+    connection.execute_wrapper counting the queries of a request and the time spent in them
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Times requests and counts their DB queries. For streaming responses,
+    up to the moment the response starts.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+
+        if not config.metrics:
+            return self.get_response(request)
+
+        queries = QueryStats()
+        start = perf_counter()
+
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+
+        REQUEST.labels(request.method, view, response.status_code).observe(perf_counter() - start)
+        DB_QUERIES.labels(view).observe(queries.count)
+        DB_SECONDS.labels(view).observe(queries.seconds)
+
+        return response
+
+
+class NotificationQueueCollector:
+
+    def describe(self):
+        return [GaugeMetricFamily('rpki_notification_queue', "Notifications in the outbox", labels=['status'])]
+
+    def collect(self):
+        from django.db.models import Count
+        from .models import Notification
+
+        gauge = GaugeMetricFamily('rpki_notification_queue', "Notifications in the outbox", labels=['status'])
+
+        try:
+            counts = dict(Notification.objects.values_list('status').annotate(Count('id')).order_by())
+        except DatabaseError:
+            return
+
+        for status in (Notification.PENDING, Notification.SENT, Notification.FAILED):
+            gauge.add_metric([status], counts.get(status, 0))
+
+        yield gauge
+
+
+REGISTRY.register(NotificationQueueCollector())
@@ -0,0 +1,76 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from ._batches import by_result_id
+
+# AsnRovState.objects.rebuild as of this migration, on Result.json,
+# adding up per batch (see _batches) as AsnRovState.objects.record does
+FILL = """
+    INSERT INTO app_asnrovstate (
+        asn, first_seen_rov, last_seen_rov, last_seen_not_rov,
+        rov_count, rov_on_time_count, not_rov_count
+    )
+    SELECT
+        asn,
+        MIN(date) FILTER (WHERE rov),
+        MAX(date) FILTER (WHERE rov),
+        MAX(date) FILTER (WHERE not_rov),
+        COUNT(*) FILTER (WHERE rov),
+        COUNT(*) FILTER (WHERE rov AND on_time),
+        COUNT(*) FILTER (WHERE not_rov)
+    FROM (
+        SELECT DISTINCT
+            r.id,
+            r.date,
+            a.asn,
+            r.json @> '{"rpki-valid-passed": true, "rpki-invalid-passed": false}'::jsonb AS rov,
+            r.json @> '{"rpki-valid-passed": true, "rpki-invalid-passed": true}'::jsonb AS not_rov,
+            r.json @> '{"finished-on-time": true}'::jsonb AS on_time
+        FROM app_result r,
+             jsonb_array_elements_text(
+                 CASE jsonb_typeof(r.json->'asn') WHEN 'array' THEN r.json->'asn' ELSE '[]' END
+             ) AS a(asn)
+        WHERE r.id > %(after)s AND r.id <= %(last)s
+    ) s
+    GROUP BY asn
+    ON CONFLICT (asn) DO UPDATE SET
+        first_seen_rov = LEAST(app_asnrovstate.first_seen_rov, EXCLUDED.first_seen_rov),
+        last_seen_rov = GREATEST(app_asnrovstate.last_seen_rov, EXCLUDED.last_seen_rov),
+        last_seen_not_rov = GREATEST(app_asnrovstate.last_seen_not_rov, EXCLUDED.last_seen_not_rov),
+        rov_count = app_asnrovstate.rov_count + EXCLUDED.rov_count,
+        rov_on_time_count = app_asnrovstate.rov_on_time_count + EXCLUDED.rov_on_time_count,
+        not_rov_count = app_asnrovstate.not_rov_count + EXCLUDED.not_rov_count
+"""
+
+
+def fill(apps, schema_editor):
+    """
+    Fill the table before the code recording new results runs: an ASN missing
+    from it would be seen doing ROV for the first time, and notified again
+    """
+    by_result_id(schema_editor, FILL)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('app', '0002_result_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AsnRovState',
+            fields=[
+                ('asn', models.CharField(max_length=16, primary_key=True, serialize=False)),
+                ('first_seen_rov', models.DateTimeField(null=True)),
+                ('last_seen_rov', models.DateTimeField(null=True)),
+                ('last_seen_not_rov', models.DateTimeField(null=True)),
+                ('rov_count', models.PositiveIntegerField(default=0)),
+                ('rov_on_time_count', models.PositiveIntegerField(default=0)),
+                ('not_rov_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill, migrations.RunPython.noop),
+    ]
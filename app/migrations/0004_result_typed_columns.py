@@ -0,0 +1,51 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:14
+
+import app.models
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_asnrovstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='asns',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=16), default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='finished_on_time',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='is_rov',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='pfx',
+            field=app.models.CidrField(null=True),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='rpki_invalid_passed',
+            field=models.NullBooleanField(),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='rpki_valid_passed',
+            field=models.NullBooleanField(),
+        ),
+        migrations.AlterField(
+            model_name='result',
+            name='date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,89 @@
+from ipaddress import ip_network
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+# app.models.typed_columns (and helpers) as of this migration
+
+
+def as_prefix(pfx):
+    if not isinstance(pfx, str):
+        return None
+
+    try:
+        return str(ip_network(pfx, strict=False))
+    except ValueError:
+        pass
+
+    # abbreviated IPv4 prefixes, as accepted by postgres' cidr input
+    address, _, length = pfx.partition('/')
+    octets = address.split('.')
+    if ':' in address or not length or not 1 <= len(octets) < 4:
+        return None
+
+    try:
+        return str(ip_network('.'.join(octets + ['0'] * (4 - len(octets))) + '/' + length, strict=False))
+    except ValueError:
+        return None
+
+
+def typed_columns(json):
+
+    def boolean(key):
+        value = json.get(key)
+        return value if type(value) == bool else None
+
+    asn = json.get('asn', [])
+    valid = boolean('rpki-valid-passed')
+    invalid = boolean('rpki-invalid-passed')
+    finished_on_time = json.get('finished-on-time') is True
+
+    return {
+        'asns': [str(a) for a in asn] if isinstance(asn, list) else [],
+        'pfx': as_prefix(json.get('pfx')),
+        'rpki_valid_passed': valid,
+        'rpki_invalid_passed': invalid,
+        'finished_on_time': finished_on_time,
+        'is_rov': valid is True and invalid is False and finished_on_time,
+    }
+
+
+def backfill(apps, schema_editor):
+    """
+    Fill the typed columns of existing rows, one short transaction per batch
+    so only the rows of the current batch are locked at any time
+    """
+    Result = apps.get_model('app', 'Result')
+    columns = list(typed_columns({}).keys())
+
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Result.objects.filter(id__gt=last_id).order_by('id').only('id', 'json')[:BATCH_SIZE]
+            )
+
+            if not batch:
+                break
+
+            for result in batch:
+                for column, value in typed_columns(result.json).items():
+                    setattr(result, column, value)
+
+            Result.objects.bulk_update(batch, columns)
+
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('app', '0004_result_typed_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('app', '0005_backfill_result_columns'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "result_date_idx" '
+                    'ON "app_result" ("date")',
+                    'DROP INDEX CONCURRENTLY IF EXISTS "result_date_idx"',
+                ),
+                migrations.RunSQL(
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "result_asns_gin" '
+                    'ON "app_result" USING gin ("asns")',
+                    'DROP INDEX CONCURRENTLY IF EXISTS "result_asns_gin"',
+                ),
+                migrations.RunSQL(
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "result_signal_idx" '
+                    'ON "app_result" ("rpki_valid_passed", "rpki_invalid_passed", "finished_on_time")',
+                    'DROP INDEX CONCURRENTLY IF EXISTS "result_signal_idx"',
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='result',
+                    index=models.Index(fields=['date'], name='result_date_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='result',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['asns'], name='result_asns_gin'),
+                ),
+                migrations.AddIndex(
+                    model_name='result',
+                    index=models.Index(
+                        fields=['rpki_valid_passed', 'rpki_invalid_passed', 'finished_on_time'],
+                        name='result_signal_idx'
+                    ),
+                ),
+            ],
+        ),
+    ]
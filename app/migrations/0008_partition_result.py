@@ -0,0 +1,101 @@
+from datetime import datetime, timezone
+from django.db import migrations, transaction
+
+INDEXES = ['result_date_idx', 'result_asns_gin', 'result_signal_idx']
+
+# months of partitions created ahead of this one, as app.partitions.ensure_partitions
+AHEAD = 3
+
+# rows moved to the partitioned table per transaction
+BATCH_SIZE = 10000
+
+
+def add_months(dt, months):
+    month = dt.month - 1 + months
+    return dt.replace(year=dt.year + month // 12, month=month % 12 + 1)
+
+
+def create_partitions(cursor, since):
+    """
+    The monthly partitions from the month of `since` to AHEAD months from now,
+    named as in app.partitions (app_result_pYYYYMM)
+    """
+
+    now = datetime.now(timezone.utc)
+    start = datetime((since or now).year, (since or now).month, 1, tzinfo=timezone.utc)
+    until = add_months(datetime(now.year, now.month, 1, tzinfo=timezone.utc), AHEAD)
+
+    while start <= until:
+        cursor.execute(
+            "CREATE TABLE app_result_p{start:%Y%m} PARTITION OF app_result FOR VALUES FROM (%s) TO (%s)".format(
+                start=start
+            ), [start, add_months(start, 1)]
+        )
+        start = add_months(start, 1)
+
+
+def partition(apps, schema_editor):
+    """
+    Replace app_result with a table partitioned by month on date, then move
+    the existing rows over, newest first, one short transaction per batch:
+    results are written to the new table meanwhile, and the old rows show up
+    again as they're moved
+    """
+
+    connection = schema_editor.connection
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        # Free the names for the partitioned table
+        cursor.execute("ALTER TABLE app_result RENAME TO app_result_unpartitioned")
+        for index in ['app_result_pkey'] + INDEXES:
+            cursor.execute("ALTER INDEX IF EXISTS {index} RENAME TO {index}_unpartitioned".format(index=index))
+
+        cursor.execute("""
+            CREATE TABLE app_result (LIKE app_result_unpartitioned INCLUDING DEFAULTS)
+            PARTITION BY RANGE (date)
+        """)
+        # the partition key has to be part of the primary key
+        cursor.execute("ALTER TABLE app_result ADD CONSTRAINT app_result_pkey PRIMARY KEY (id, date)")
+        cursor.execute("ALTER SEQUENCE app_result_id_seq OWNED BY app_result.id")
+
+        cursor.execute('CREATE INDEX result_date_idx ON app_result ("date")')
+        cursor.execute('CREATE INDEX result_asns_gin ON app_result USING gin ("asns")')
+        cursor.execute(
+            'CREATE INDEX result_signal_idx ON app_result '
+            '("rpki_valid_passed", "rpki_invalid_passed", "finished_on_time")'
+        )
+
+        cursor.execute("CREATE TABLE app_result_default PARTITION OF app_result DEFAULT")
+
+        cursor.execute("SELECT MIN(date) FROM app_result_unpartitioned")
+        since, = cursor.fetchone()
+        create_partitions(cursor, since)
+
+    while True:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute("""
+                WITH moved AS (
+                    DELETE FROM app_result_unpartitioned WHERE id IN (
+                        SELECT id FROM app_result_unpartitioned ORDER BY id DESC LIMIT %s
+                    )
+                    RETURNING *
+                )
+                INSERT INTO app_result SELECT * FROM moved
+            """, [BATCH_SIZE])
+
+            if not cursor.rowcount:
+                cursor.execute("DROP TABLE app_result_unpartitioned")
+                return
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('app', '0007_notification'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:22
+
+from django.db import migrations, models
+from ._batches import by_result_id
+
+# AsnRollup.objects.recompute as of this migration, per period,
+# adding up per batch (see _batches) as AsnRollup.objects.record does
+FILL = """
+    INSERT INTO app_asnrollup (period, bucket, asn, rov, not_rov, not_on_time, total)
+    SELECT
+        %(period)s,
+        date_trunc(%(period)s, r.date AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+        a.asn,
+        COUNT(*) FILTER (WHERE r.is_rov),
+        COUNT(*) FILTER (WHERE r.rpki_valid_passed AND r.rpki_invalid_passed),
+        COUNT(*) FILTER (WHERE NOT r.finished_on_time),
+        COUNT(*)
+    FROM app_result r
+    CROSS JOIN LATERAL (SELECT DISTINCT unnest(r.asns)) AS a(asn)
+    WHERE r.id > %(after)s AND r.id <= %(last)s
+    GROUP BY 1, 2, 3
+    ON CONFLICT (asn, period, bucket) DO UPDATE SET
+        rov = app_asnrollup.rov + EXCLUDED.rov,
+        not_rov = app_asnrollup.not_rov + EXCLUDED.not_rov,
+        not_on_time = app_asnrollup.not_on_time + EXCLUDED.not_on_time,
+        total = app_asnrollup.total + EXCLUDED.total
+"""
+
+
+def fill(apps, schema_editor):
+    for period in ('hour', 'day'):
+        by_result_id(schema_editor, FILL, {'period': period})
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('app', '0008_partition_result'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AsnRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('asn', models.CharField(max_length=16)),
+                ('rov', models.PositiveIntegerField(default=0)),
+                ('not_rov', models.PositiveIntegerField(default=0)),
+                ('not_on_time', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        # not deferred to the end of the migration as with CreateModel, the fill needs it
+        migrations.AlterUniqueTogether(
+            name='asnrollup',
+            unique_together={('asn', 'period', 'bucket')},
+        ),
+        migrations.RunPython(fill, migrations.RunPython.noop),
+    ]
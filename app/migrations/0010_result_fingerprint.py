@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_asnrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='fingerprint',
+            field=models.CharField(editable=False, max_length=32, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='result',
+            constraint=models.UniqueConstraint(fields=('fingerprint', 'date'), name='result_fingerprint_uniq'),
+        ),
+    ]
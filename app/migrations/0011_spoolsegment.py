@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_result_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpoolSegment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('records', models.PositiveIntegerField(default=0)),
+                ('rejected', models.PositiveIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:43
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, unique=True)),
+                ('compression', models.CharField(choices=[('gzip', 'gzip'), ('zstd', 'zstd')], default='zstd', max_length=8)),
+                ('since', models.DateTimeField()),
+                ('until', models.DateTimeField()),
+                ('asns', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=16), default=list, size=None)),
+                ('records', models.PositiveIntegerField(default=0)),
+                ('size', models.BigIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivesegment',
+            index=models.Index(fields=['since', 'until'], name='archive_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivesegment',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['asns'], name='archive_asns_gin'),
+        ),
+    ]
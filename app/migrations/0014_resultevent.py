@@ -0,0 +1,67 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+from ._batches import by_result_id
+
+# ResultEvent.objects.rebuild as of this migration, per batch (see _batches)
+FILL = """
+    INSERT INTO app_resultevent (result_id, date, stage, duration, success, address_family)
+    SELECT DISTINCT ON (r.id, s.stage)
+        r.id,
+        r.date,
+        s.stage,
+        CASE jsonb_typeof(e.event->'data'->'duration')
+            WHEN 'number' THEN round((e.event->'data'->'duration')::text::numeric)::int
+        END,
+        CASE jsonb_typeof(e.event->'success') WHEN 'boolean' THEN (e.event->>'success')::boolean END,
+        CASE jsonb_typeof(e.event->'data'->'addressFamily')
+            WHEN 'number' THEN round((e.event->'data'->'addressFamily')::text::numeric)::int
+        END
+    FROM app_result r
+    CROSS JOIN LATERAL jsonb_array_elements(
+        CASE jsonb_typeof(r.json->'events') WHEN 'array' THEN r.json->'events' ELSE '[]' END
+    ) WITH ORDINALITY AS e(event, position)
+    JOIN (VALUES
+        ('enrichedReceived', 1),
+        ('validReceived', 2),
+        ('invalidReceived', 3),
+        ('invalidAwait', 4),
+        ('invalidBlocked', 5)
+    ) AS s(name, stage) ON s.name = e.event->>'stage'
+    WHERE r.id > %(after)s AND r.id <= %(last)s
+    ORDER BY r.id, s.stage, e.position
+"""
+
+
+def fill(apps, schema_editor):
+    by_result_id(schema_editor, FILL)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('app', '0013_archivesegment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('stage', models.PositiveSmallIntegerField(choices=[(1, 'enrichedReceived'), (2, 'validReceived'), (3, 'invalidReceived'), (4, 'invalidAwait'), (5, 'invalidBlocked')])),
+                ('duration', models.IntegerField(null=True)),
+                ('success', models.NullBooleanField()),
+                ('address_family', models.PositiveSmallIntegerField(null=True)),
+                ('result', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='timings', to='app.Result')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='resultevent',
+            index=models.Index(fields=['stage', 'date'], name='resultevent_stage_date_idx'),
+        ),
+        migrations.RunPython(fill, migrations.RunPython.noop),
+    ]
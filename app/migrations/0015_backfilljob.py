@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_resultevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('batches', models.PositiveIntegerField(default=0)),
+                ('rows', models.BigIntegerField(default=0)),
+                ('changed', models.BigIntegerField(default=0)),
+                ('seconds', models.FloatField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('started', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
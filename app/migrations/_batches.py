@@ -0,0 +1,42 @@
+"""
+Batched fill of the tables derived from app_result, shared by the migrations
+creating them (which have to be `atomic = False`, as 0005): the rows are read
+by ranges of ids, one short transaction per batch, so app_result is never
+scanned within a single transaction and rows posted meanwhile are picked up
+by the last batches.
+
+Like the migrations, this mustn't use the app's code, which changes.
+"""
+
+from django.db import transaction
+
+BATCH_SIZE = 10000
+
+
+def by_result_id(schema_editor, sql, params=None, batch_size=BATCH_SIZE):
+    """
+    Run `sql` once per batch of app_result rows, in a transaction of its own
+
+    :param sql: filtering the rows with "r.id > %(after)s AND r.id <= %(last)s"
+    :param params: other named parameters of sql
+    :return: number of rows written
+    """
+
+    connection = schema_editor.connection
+    written = 0
+    after = 0
+
+    while True:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM app_result WHERE id > %s ORDER BY id LIMIT %s) s",
+                [after, batch_size]
+            )
+            last, = cursor.fetchone()
+            if last is None:
+                return written
+
+            cursor.execute(sql, dict(params or {}, after=after, last=last))
+            written += cursor.rowcount
+
+        after = last
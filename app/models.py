@@ -1,13 +1,105 @@
-from django.db.models import Model, Manager, DateTimeField
-from django.contrib.postgres.fields import JSONField
+import csv
+import io
+import json
+from ipaddress import ip_network
+from django.db import connection, transaction
+from datetime import timedelta
+from django.db.models import Model, Manager, Field, Index, DateTimeField, CharField, BooleanField, BigIntegerField, \
+    IntegerField, NullBooleanField, PositiveIntegerField, PositiveSmallIntegerField, TextField, UniqueConstraint, \
+    FloatField, ForeignKey, DO_NOTHING, Max, Sum
+from django.contrib.postgres.fields import JSONField, ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.utils import timezone
+from rpki_validation_browser.utils import config
+from .events import STAGES, index_events, timings
+from . import metrics
+
+
+def as_asn_list(asns):
+    """
+    Callers pass either a single ASN or a list of them (as found in json['asn'])
+    """
+    if isinstance(asns, (list, tuple, set)):
+        return [str(asn) for asn in asns]
+
+    return [str(asns)]
+
+
+def as_prefix(pfx):
+    """
+    :param pfx: prefix as reported by the client, e.g. "193.0.20.0/23" or "193.0.20/23"
+    :return: normalised prefix suitable for a cidr column, None if it can't be parsed
+    """
+    if not isinstance(pfx, str):
+        return None
+
+    try:
+        return str(ip_network(pfx, strict=False))
+    except ValueError:
+        pass
+
+    # abbreviated IPv4 prefixes, as accepted by postgres' cidr input
+    address, _, length = pfx.partition('/')
+    octets = address.split('.')
+    if ':' in address or not length or not 1 <= len(octets) < 4:
+        return None
+
+    try:
+        return str(ip_network('.'.join(octets + ['0'] * (4 - len(octets))) + '/' + length, strict=False))
+    except ValueError:
+        return None
+
+
+def typed_columns(json):
+    """
+    Values of the Result columns promoted out of Result.json
+
+    :param json: Result.json
+    :return: dict of column name -> value
+    """
+
+    def boolean(key):
+        value = json.get(key)
+        return value if type(value) == bool else None
+
+    asn = json.get('asn', [])
+    valid = boolean('rpki-valid-passed')
+    invalid = boolean('rpki-invalid-passed')
+    finished_on_time = json.get('finished-on-time') is True
+
+    return {
+        'asns': as_asn_list(asn) if isinstance(asn, list) else [],
+        'pfx': as_prefix(json.get('pfx')),
+        'rpki_valid_passed': valid,
+        'rpki_invalid_passed': invalid,
+        'finished_on_time': finished_on_time,
+        'is_rov': valid is True and invalid is False and finished_on_time,
+    }
+
+
+class CidrField(Field):
+    description = "PostgreSQL cidr"
+
+    def db_type(self, connection):
+        return 'cidr'
 
 
 class ResultManager(Manager):
 
     def results_seen(self, signal):
+        columns = {Result.signal_columns[k]: v for k, v in signal.items() if k in Result.signal_columns}
+        rest = {k: v for k, v in signal.items() if k not in Result.signal_columns}
+
+        results = self.filter(**columns)
+        if rest:
+            # keys without a column of their own
+            results = results.filter(json__contains=rest)
+
+        return results
+
+    def results_seen_from(self, asns):
         return self.filter(
-            json__contains=signal,
+            asns__contains=as_asn_list(asns)
         )
 
     def results_seen_not_doing_rov(self):
@@ -16,35 +108,88 @@ class ResultManager(Manager):
     def results_seen_doing_rov(self):
         return self.results_seen(Result.rov_signal)
 
+    @metrics.timed('ases_have_been_seen_not_doing_rov')
     def ases_have_been_seen_not_doing_rov(self, asns):
-        return self.results_seen_not_doing_rov(
-        ).filter(
-            json__asn__contains=asns
-        ).count() >= 1
+        return AsnRovState.objects.all_seen(asns, not_rov_count__gte=1)
 
     def ases_have_been_seen_doing_rov(self, asns):
-        return self.results_seen_doing_rov(
-        ).filter(
-            json__asn__contains=asns
-        ).count() >= 1
+        return AsnRovState.objects.all_seen(asns, rov_count__gte=1)
 
+    @metrics.timed('ases_are_new_to_rov')
     def ases_are_new_to_rov(self, asn):
         """
         This method is to be called immediately after saving the object into DB
         :param asn:
-        :return:
+        :return: True if, for any of the ASNs, the result just saved is
+                 the only one seen doing ROV and finishing on time
         """
 
-        on_time_signal = {
-            'finished-on-time': True
-        }
+        return AsnRovState.objects.filter(
+            asn__in=as_asn_list(asn),
+            rov_on_time_count=1
+        ).exists()
 
-        return self.results_seen_doing_rov(
-        ).filter(
-            json__asn__contains=asn
-        ).filter(
-            json__contains=on_time_signal
-        ).count() == 1
+    @metrics.timed('last_seen_not_doing_rov')
+    def last_seen_not_doing_rov(self, asns):
+        return AsnRovState.objects.filter(
+            asn__in=as_asn_list(asns)
+        ).aggregate(
+            last_seen=Max('last_seen_not_rov')
+        )['last_seen']
+
+    def copy(self, results):
+        """
+        Insert Results with COPY, much cheaper than INSERTs for large batches.
+        Columns must have been synced (see Result.sync_columns).
+
+        :param results: list of unsaved Result, their ids are set
+        """
+
+        table = self.model._meta.db_table
+        columns = ['id', 'json', 'date', 'asns', 'pfx', 'rpki_valid_passed', 'rpki_invalid_passed',
+                   'finished_on_time', 'is_rov', 'fingerprint']
+
+        def array(values):
+            return '{' + ','.join('"{v}"'.format(v=v.replace('\\', '\\\\').replace('"', '\\"')) for v in values) + '}'
+
+        if not results:
+            return
+
+        with connection.cursor() as cursor:
+            # as bulk_create would, for the derived rows referencing them
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                           [table, len(results)])
+            for result, (id,) in zip(results, cursor.fetchall()):
+                result.id = id
+
+        rows = io.StringIO()
+        writer = csv.writer(rows)
+        for result in results:
+            writer.writerow([
+                result.id, json.dumps(result.json), result.date.isoformat(), array(result.asns), result.pfx,
+                result.rpki_valid_passed, result.rpki_invalid_passed,
+                result.finished_on_time, result.is_rov, result.fingerprint
+            ])
+        rows.seek(0)
+
+        with connection.cursor() as cursor:
+            cursor.copy_expert("COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)".format(
+                table=table,
+                columns=', '.join(columns)
+            ), rows)
+
+    @metrics.timed('record_derived')
+    def record_derived(self, results):
+        """
+        Update the tables derived from Result rows (AsnRovState, AsnRollup, ResultEvent)
+        with freshly inserted results. Same transaction as the insert.
+
+        :param results: list of saved Result, with their typed columns filled
+        :return: set of ASNs seen doing ROV for the first time (see AsnRovStateManager.record)
+        """
+        ResultEvent.objects.record(results)
+        AsnRollup.objects.record(results)
+        return AsnRovState.objects.record(results)
 
     @staticmethod
     def is_documentation_asn(asn):
@@ -64,6 +209,24 @@ class Result(Model):
     json = JSONField(default=dict)
     date = DateTimeField(default=timezone.now)
 
+    # Hot keys of json, kept in sync on save (see app.signals)
+    asns = ArrayField(CharField(max_length=16), default=list)
+    pfx = CidrField(null=True)
+    rpki_valid_passed = NullBooleanField()
+    rpki_invalid_passed = NullBooleanField()
+    finished_on_time = BooleanField(default=False)
+    is_rov = BooleanField(default=False)
+
+    # keyed hash of the beacon run, see app.duplicates
+    fingerprint = CharField(max_length=32, null=True, editable=False)
+
+    # json key -> column, for querying signals
+    signal_columns = {
+        "rpki-valid-passed": "rpki_valid_passed",
+        "rpki-invalid-passed": "rpki_invalid_passed",
+        "finished-on-time": "finished_on_time",
+    }
+
     # Signal that this fetch is being performed
     # from a network which is doing Route Origin Validation
     # (rpki-valid=true, rpki-invalid=false, asns)
@@ -82,6 +245,27 @@ class Result(Model):
 
     objects = ResultManager()
 
+    class Meta:
+        indexes = [
+            Index(fields=['date'], name='result_date_idx'),
+            GinIndex(fields=['asns'], name='result_asns_gin'),
+            Index(fields=['rpki_valid_passed', 'rpki_invalid_passed', 'finished_on_time'], name='result_signal_idx'),
+        ]
+        constraints = [
+            # must include the partition key, NULL fingerprints never conflict
+            UniqueConstraint(fields=['fingerprint', 'date'], name='result_fingerprint_uniq'),
+        ]
+
+    def sync_columns(self):
+        for column, value in typed_columns(self.json).items():
+            setattr(self, column, value)
+
+    def save(self, *args, **kwargs):
+        # derived tables (see app.signals) are written from post_save,
+        # keep them in the same transaction as the Result itself
+        with transaction.atomic():
+            super(Result, self).save(*args, **kwargs)
+
     def __str__(self):
         return f"(AS{self.json['asn'][0] if len(self.json['asn']) >= 1 else 'Unknown AS'}) ROV={self.is_doing_rpki()}"
 
@@ -92,13 +276,28 @@ class Result(Model):
 
         return []
 
+    @property
+    def event_index(self):
+        """
+        stage -> position of its first event, as computed at ingest
+        (see app.events.process_events) or built on first use
+        """
+        if getattr(self, '_event_index', None) is None:
+            self._event_index = index_events(self.get_events())
+
+        return self._event_index
+
+    @event_index.setter
+    def event_index(self, index):
+        self._event_index = index
+
     def get_event(self, evt):
 
-        for event in self.get_events():
-            if event["stage"] == evt:
-                return event
+        position = self.event_index.get(evt)
+        if position is None:
+            return {}
 
-        return {}
+        return self.get_events()[position]
 
     @staticmethod
     def is_event(event):
@@ -108,9 +307,45 @@ class Result(Model):
 
         return "data" in event and "duration" in event["data"]
 
+    def matches_signal(self, signal):
+        """
+        Python counterpart of ResultManager.results_seen(signal)
+        """
+        return all(self.json.get(k) is v for k, v in signal.items())
+
+    def is_documentation(self):
+        return any([Result.objects.is_documentation_asn(asn) for asn in self.get_asns()])
+
+    def classification(self):
+        """
+        How this result is counted, computed in memory only
+        """
+
+        columns = typed_columns(self.json)
+
+        if self.matches_signal(Result.rov_signal):
+            signal = "rov"
+        elif self.matches_signal(Result.not_rov_signal):
+            signal = "not-rov"
+        else:
+            signal = None
+
+        return {
+            "asns": columns["asns"],
+            "pfx": columns["pfx"],
+            "signal": signal,
+            "finished-on-time": columns["finished_on_time"],
+            "is-doing-rpki": self.is_doing_rpki(),
+            "documentation": self.is_documentation(),
+        }
+
+    def get_asns(self):
+        return as_asn_list(self.json.get('asn', []))
+
     def is_doing_rpki(self):
-        valid = self.json["rpki-valid-passed"]
-        invalid = self.json["rpki-invalid-passed"]
+        # not required by the schema (see app.validation)
+        valid = self.json.get("rpki-valid-passed")
+        invalid = self.json.get("rpki-invalid-passed")
 
         if type(valid) != bool or type(invalid) != bool:
             return False
@@ -128,3 +363,655 @@ class Result(Model):
             return self.json['finished-on-time']
         else:
             return False
+
+
+def invalidate_latency(dates=None):
+    """
+    app.latency.invalidate, now and again once the transaction is committed,
+    in case a day is read and cached in between
+    """
+
+    from .latency import invalidate
+
+    invalidate(dates)
+    transaction.on_commit(lambda: invalidate(dates))
+
+
+class ResultEventManager(Manager):
+
+    def record(self, results):
+        """
+        Insert the timings of freshly inserted results
+
+        :param results: list of saved Result
+        """
+
+        self.bulk_create([
+            ResultEvent(
+                result_id=result.id, date=result.date, stage=stage,
+                duration=duration, success=success, address_family=address_family
+            )
+            for result in results
+            for stage, duration, success, address_family in timings(result.get_events(), result.event_index)
+        ])
+
+        invalidate_latency([result.date for result in results])
+
+    def rebuild(self, since=None, until=None):
+        """
+        Recompute the timings of the Results between since (inclusive) and until (exclusive)
+        from Result.json, SQL counterpart of app.events.timings
+
+        :return: number of rows written
+        """
+
+        conditions = []
+        params = []
+        if since is not None:
+            conditions.append("r.date >= %s")
+            params.append(since)
+        if until is not None:
+            conditions.append("r.date < %s")
+            params.append(until)
+
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+        def number(value):
+            return "CASE jsonb_typeof({value}) WHEN 'number' THEN round(({value})::text::numeric)::int END".format(
+                value=value
+            )
+
+        sql = """
+            INSERT INTO {table} (result_id, date, stage, duration, success, address_family)
+            SELECT DISTINCT ON (r.id, s.stage)
+                r.id,
+                r.date,
+                s.stage,
+                {duration},
+                CASE jsonb_typeof(e.event->'success') WHEN 'boolean' THEN (e.event->>'success')::boolean END,
+                {address_family}
+            FROM {result_table} r
+            CROSS JOIN LATERAL jsonb_array_elements(
+                CASE jsonb_typeof(r.json->'events') WHEN 'array' THEN r.json->'events' ELSE '[]' END
+            ) WITH ORDINALITY AS e(event, position)
+            JOIN (VALUES {stages}) AS s(name, stage) ON s.name = e.event->>'stage'
+            {where}
+            ORDER BY r.id, s.stage, e.position
+        """.format(
+            table=self.model._meta.db_table,
+            result_table=Result._meta.db_table,
+            duration=number("e.event->'data'->'duration'"),
+            address_family=number("e.event->'data'->'addressFamily'"),
+            stages=", ".join(["(%s, %s)"] * len(STAGES)),
+            where=where,
+        )
+
+        events = self.all()
+        if since is not None:
+            events = events.filter(date__gte=since)
+        if until is not None:
+            events = events.filter(date__lt=until)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            events.delete()
+            cursor.execute(sql, [value for stage in STAGES.items() for value in stage] + params)
+
+            if since is None or until is None:
+                invalidate_latency()
+            else:
+                invalidate_latency([since + timedelta(days=day) for day in range((until - since).days + 1)])
+
+            return cursor.rowcount
+
+
+class ResultEvent(Model):
+    """
+    Timings of the first event of each timed stage of a Result (see app.events.timings),
+    narrow rows for latency analytics in SQL. Written along with the Result.
+    """
+
+    STAGES = [(value, name) for name, value in STAGES.items()]
+
+    # app_result's primary key is (id, date): there's no unique id to reference
+    result = ForeignKey(Result, on_delete=DO_NOTHING, db_constraint=False, related_name='timings')
+    # Result.date, for pruning and per-period aggregates
+    date = DateTimeField()
+    stage = PositiveSmallIntegerField(choices=STAGES)
+    # ms
+    duration = IntegerField(null=True)
+    success = NullBooleanField()
+    address_family = PositiveSmallIntegerField(null=True)
+
+    objects = ResultEventManager()
+
+    class Meta:
+        indexes = [
+            Index(fields=['stage', 'date'], name='resultevent_stage_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_stage_display()} of {self.result_id}: {self.duration}ms"
+
+
+class AsnRovStateManager(Manager):
+
+    def all_seen(self, asns, **conditions):
+        """
+        :return: True if every one of the ASNs matches the given conditions
+        """
+        asns = set(as_asn_list(asns))
+
+        if not asns:
+            return False
+
+        return self.filter(asn__in=asns, **conditions).count() == len(asns)
+
+    def record(self, results):
+        """
+        Upsert the per-ASN counters for freshly saved results.
+        This is meant to run in the same transaction as the Result insert.
+
+        :param results: iterable of Result
+        :return: set of ASNs seen doing ROV (and finishing on time) for the first time
+        """
+
+        rows = {}
+        for result in results:
+
+            rov = result.matches_signal(Result.rov_signal)
+            not_rov = result.matches_signal(Result.not_rov_signal)
+            on_time = rov and result.json.get('finished-on-time') is True
+
+            for asn in set(result.get_asns()):
+                row = rows.setdefault(asn, [None, None, None, 0, 0, 0])
+
+                if rov:
+                    row[0] = result.date if row[0] is None else min(row[0], result.date)
+                    row[1] = result.date if row[1] is None else max(row[1], result.date)
+                    row[3] += 1
+                if on_time:
+                    row[4] += 1
+                if not_rov:
+                    row[2] = result.date if row[2] is None else max(row[2], result.date)
+                    row[5] += 1
+
+        if not rows:
+            return set()
+
+        table = self.model._meta.db_table
+        sql = """
+            INSERT INTO {table} (
+                asn, first_seen_rov, last_seen_rov, last_seen_not_rov,
+                rov_count, rov_on_time_count, not_rov_count
+            )
+            VALUES {values}
+            ON CONFLICT (asn) DO UPDATE SET
+                first_seen_rov = LEAST({table}.first_seen_rov, EXCLUDED.first_seen_rov),
+                last_seen_rov = GREATEST({table}.last_seen_rov, EXCLUDED.last_seen_rov),
+                last_seen_not_rov = GREATEST({table}.last_seen_not_rov, EXCLUDED.last_seen_not_rov),
+                rov_count = {table}.rov_count + EXCLUDED.rov_count,
+                rov_on_time_count = {table}.rov_on_time_count + EXCLUDED.rov_on_time_count,
+                not_rov_count = {table}.not_rov_count + EXCLUDED.not_rov_count
+            RETURNING asn, rov_on_time_count
+        """.format(
+            table=table,
+            values=', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(rows))
+        )
+
+        params = []
+        for asn, row in rows.items():
+            params.extend([asn] + row)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            counts = cursor.fetchall()
+
+        # on_time counters that went from 0 to >0 within this upsert
+        return {
+            asn for asn, rov_on_time_count in counts
+            if rows[asn][4] and rov_on_time_count == rows[asn][4]
+        }
+
+    def rebuild(self):
+        """
+        Recompute the whole table from the Result rows
+        """
+
+        table = self.model._meta.db_table
+        sql = """
+            INSERT INTO {table} (
+                asn, first_seen_rov, last_seen_rov, last_seen_not_rov,
+                rov_count, rov_on_time_count, not_rov_count
+            )
+            SELECT
+                asn,
+                MIN(date) FILTER (WHERE rov),
+                MAX(date) FILTER (WHERE rov),
+                MAX(date) FILTER (WHERE not_rov),
+                COUNT(*) FILTER (WHERE rov),
+                COUNT(*) FILTER (WHERE rov AND on_time),
+                COUNT(*) FILTER (WHERE not_rov)
+            FROM (
+                SELECT DISTINCT
+                    r.id,
+                    r.date,
+                    a.asn,
+                    r.json @> %s::jsonb AS rov,
+                    r.json @> %s::jsonb AS not_rov,
+                    r.json @> '{{"finished-on-time": true}}'::jsonb AS on_time
+                FROM {result_table} r,
+                     jsonb_array_elements_text(
+                         CASE jsonb_typeof(r.json->'asn') WHEN 'array' THEN r.json->'asn' ELSE '[]' END
+                     ) AS a(asn)
+            ) s
+            GROUP BY asn
+        """.format(
+            table=table,
+            result_table=Result._meta.db_table
+        )
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {table}".format(table=table))
+            cursor.execute(sql, [json.dumps(Result.rov_signal), json.dumps(Result.not_rov_signal)])
+
+        return self.count()
+
+
+class AsnRovState(Model):
+    """
+    Per-ASN summary of the Results seen so far, maintained incrementally
+    on every Result insert so ingest doesn't need to scan app_result
+    """
+    asn = CharField(max_length=16, primary_key=True)
+
+    first_seen_rov = DateTimeField(null=True)
+    last_seen_rov = DateTimeField(null=True)
+    last_seen_not_rov = DateTimeField(null=True)
+
+    # matching Result.rov_signal
+    rov_count = PositiveIntegerField(default=0)
+    # matching Result.rov_signal and finished-on-time
+    rov_on_time_count = PositiveIntegerField(default=0)
+    # matching Result.not_rov_signal
+    not_rov_count = PositiveIntegerField(default=0)
+
+    objects = AsnRovStateManager()
+
+    def __str__(self):
+        return f"AS{self.asn} rov={self.rov_count} not_rov={self.not_rov_count}"
+
+
+class AsnRollupManager(Manager):
+
+    @staticmethod
+    def truncate(date, period):
+        date = date.astimezone(timezone.utc)
+        if period == AsnRollup.DAY:
+            return date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        return date.replace(minute=0, second=0, microsecond=0)
+
+    def record(self, results):
+        """
+        Add freshly inserted results to their hourly and daily buckets
+
+        :param results: list of saved Result, with their typed columns filled
+        """
+
+        rows = {}
+        for result in results:
+            for asn in set(result.asns):
+                for period in (AsnRollup.HOUR, AsnRollup.DAY):
+                    row = rows.setdefault((period, self.truncate(result.date, period), asn), [0, 0, 0, 0])
+
+                    row[0] += result.is_rov
+                    row[1] += result.rpki_valid_passed is True and result.rpki_invalid_passed is True
+                    row[2] += not result.finished_on_time
+                    row[3] += 1
+
+        if not rows:
+            return
+
+        table = self.model._meta.db_table
+        sql = """
+            INSERT INTO {table} (period, bucket, asn, rov, not_rov, not_on_time, total)
+            VALUES {values}
+            ON CONFLICT (asn, period, bucket) DO UPDATE SET
+                rov = {table}.rov + EXCLUDED.rov,
+                not_rov = {table}.not_rov + EXCLUDED.not_rov,
+                not_on_time = {table}.not_on_time + EXCLUDED.not_on_time,
+                total = {table}.total + EXCLUDED.total
+        """.format(
+            table=table,
+            values=', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(rows))
+        )
+
+        params = []
+        for key, row in rows.items():
+            params.extend(list(key) + row)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def recompute(self, since=None, until=None):
+        """
+        Recompute the buckets between since and until (whole days) from the Result rows
+
+        :return: number of rollup rows written
+        """
+
+        conditions = []
+        params = []
+        if since is not None:
+            since = self.truncate(since, AsnRollup.DAY)
+            conditions.append("date >= %s")
+            params.append(since)
+        if until is not None:
+            until = self.truncate(until, AsnRollup.DAY) + timedelta(days=1)
+            conditions.append("date < %s")
+            params.append(until)
+
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+        sql = """
+            INSERT INTO {table} (period, bucket, asn, rov, not_rov, not_on_time, total)
+            SELECT
+                %s,
+                date_trunc(%s, r.date AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+                a.asn,
+                COUNT(*) FILTER (WHERE r.is_rov),
+                COUNT(*) FILTER (WHERE r.rpki_valid_passed AND r.rpki_invalid_passed),
+                COUNT(*) FILTER (WHERE NOT r.finished_on_time),
+                COUNT(*)
+            FROM {result_table} r
+            CROSS JOIN LATERAL (SELECT DISTINCT unnest(r.asns)) AS a(asn)
+            {where}
+            GROUP BY 1, 2, 3
+        """.format(
+            table=self.model._meta.db_table,
+            result_table=Result._meta.db_table,
+            where=where
+        )
+
+        rollups = self.all()
+        if since is not None:
+            rollups = rollups.filter(bucket__gte=since)
+        if until is not None:
+            rollups = rollups.filter(bucket__lt=until)
+
+        written = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            rollups.delete()
+
+            for period in (AsnRollup.HOUR, AsnRollup.DAY):
+                cursor.execute(sql, [period, period] + params)
+                written += cursor.rowcount
+
+        return written
+
+    def totals(self, rollups):
+        return rollups.aggregate(
+            rov=Sum('rov'),
+            not_rov=Sum('not_rov'),
+            not_on_time=Sum('not_on_time'),
+            total=Sum('total'),
+        )
+
+
+class AsnRollup(Model):
+    """
+    Counts of Results per ASN and hourly or daily bucket,
+    updated on every insert (see ResultManager.record_derived)
+    """
+
+    HOUR = 'hour'
+    DAY = 'day'
+
+    period = CharField(max_length=4, choices=[(HOUR, 'Hour'), (DAY, 'Day')])
+    bucket = DateTimeField()
+    asn = CharField(max_length=16)
+
+    # Result.is_rov
+    rov = PositiveIntegerField(default=0)
+    # Result.not_rov_signal
+    not_rov = PositiveIntegerField(default=0)
+    # not Result.finished_on_time
+    not_on_time = PositiveIntegerField(default=0)
+    total = PositiveIntegerField(default=0)
+
+    objects = AsnRollupManager()
+
+    class Meta:
+        unique_together = [('asn', 'period', 'bucket')]
+
+    def __str__(self):
+        return f"AS{self.asn} {self.period} {self.bucket:%Y-%m-%d %H:%M} rov={self.rov}/{self.total}"
+
+
+class NotificationManager(Manager):
+
+    def enqueue_new_rov(self, result):
+        """
+        Queue the "AS seen doing ROV for the first time" message for a Result.
+        To be called in the same transaction that saves the Result.
+
+        :param result: Result which has just been saved
+        :return: Notification
+        """
+
+        asns = result.json['asn']
+        last_seen = None
+
+        # We've previously seen this ASNs not doing ROV
+        if Result.objects.ases_have_been_seen_not_doing_rov(asns):
+            last_seen = Result.objects.last_seen_not_doing_rov(asns).isoformat()
+
+        initialized = result.get_event("initialized")
+
+        metrics.notification(Notification.NEW_ROV, 'queued')
+
+        return self.create(
+            kind=Notification.NEW_ROV,
+            payload={
+                "asn": asns,
+                "pfx": result.json['pfx'],
+                "last_seen_not_rov": last_seen,
+                "third_party": bool(initialized) and
+                               initialized.get("data", {}).get("originLocation") != "sg-pub.ripe.net",
+            }
+        )
+
+    def claim_next(self):
+        """
+        Lock the next due notification, skipping those locked by other workers.
+        Must be called inside a transaction.
+        """
+        return self.select_for_update(
+            skip_locked=True
+        ).filter(
+            status=Notification.PENDING,
+            next_attempt__lte=timezone.now()
+        ).order_by('next_attempt').first()
+
+    def lease_next(self):
+        """
+        Claim the next due notification in a transaction of its own, by moving its
+        next_attempt config.notification_lease seconds ahead: it's delivered outside
+        of any transaction, and taken again by a worker once the lease has expired
+        if this one dies before recording the outcome.
+
+        :return: Notification, None if none is due
+        """
+
+        with transaction.atomic():
+            notification = self.claim_next()
+
+            if notification is not None:
+                notification.next_attempt = timezone.now() + timedelta(seconds=config.notification_lease)
+                notification.save(update_fields=['next_attempt'])
+
+        return notification
+
+
+class Notification(Model):
+    """
+    Outbox of messages to be delivered by `manage.py process_notifications`,
+    written in the same transaction as the Result that triggers them
+    """
+
+    NEW_ROV = 'new-rov'
+
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    kind = CharField(max_length=16, choices=[(NEW_ROV, 'New AS doing ROV')])
+    payload = JSONField(default=dict)
+
+    status = CharField(
+        max_length=8,
+        choices=[(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')],
+        default=PENDING
+    )
+    attempts = PositiveSmallIntegerField(default=0)
+    next_attempt = DateTimeField(default=timezone.now)
+    last_error = TextField(blank=True, default='')
+
+    created = DateTimeField(auto_now_add=True)
+    sent = DateTimeField(null=True)
+
+    objects = NotificationManager()
+
+    class Meta:
+        indexes = [
+            Index(fields=['status', 'next_attempt'], name='notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.payload.get('asn')} ({self.status})"
+
+    def mark_sent(self):
+        self.status = Notification.SENT
+        self.sent = timezone.now()
+        self.attempts += 1
+        self.save()
+
+        metrics.notification(self.kind, 'sent')
+
+    def mark_failed(self, error):
+        """
+        Schedule another attempt with exponential backoff, or give up
+        after config.notification_max_attempts
+        """
+
+        self.attempts += 1
+        self.last_error = str(error)
+
+        if self.attempts >= config.notification_max_attempts:
+            self.status = Notification.FAILED
+        else:
+            backoff = min(
+                config.notification_backoff * 2 ** (self.attempts - 1),
+                config.notification_max_backoff
+            )
+            self.next_attempt = timezone.now() + timedelta(seconds=backoff)
+
+        self.save()
+
+        metrics.notification(self.kind, 'failed' if self.status == Notification.FAILED else 'retried')
+
+
+class SpoolSegment(Model):
+    """
+    Progress of `manage.py flush_spool` through a spool segment (see app.spool).
+    `offset` is moved forward in the same transaction as the Results it covers,
+    so a crashed flush resumes right after the last committed batch.
+    """
+
+    name = CharField(max_length=64, unique=True)
+    offset = BigIntegerField(default=0)
+    records = PositiveIntegerField(default=0)
+    rejected = PositiveIntegerField(default=0)
+    finished = BooleanField(default=False)
+    updated = DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @{self.offset} ({self.records} records{', finished' if self.finished else ''})"
+
+
+class ImportJob(Model):
+    """
+    Progress of `manage.py import_results` through a dump (see app.importer).
+    `position` (records read) is moved forward in the same transaction as the
+    Results it covers, so an interrupted import resumes after the last committed batch.
+    """
+
+    name = CharField(max_length=255, unique=True)
+    position = BigIntegerField(default=0)
+    imported = PositiveIntegerField(default=0)
+    skipped = PositiveIntegerField(default=0)
+    rejected = PositiveIntegerField(default=0)
+    # range of the imported dates, for rebuilding the rollups
+    since = DateTimeField(null=True)
+    until = DateTimeField(null=True)
+    finished = BooleanField(default=False)
+    updated = DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @{self.position} ({self.imported} imported{', finished' if self.finished else ''})"
+
+
+class ArchiveSegment(Model):
+    """
+    Compressed NDJSON file of Results moved out of app_result by
+    `manage.py archive_results` (see app.archive), indexed by date range and ASN
+    """
+
+    GZIP = 'gzip'
+    ZSTD = 'zstd'
+
+    name = CharField(max_length=128, unique=True)
+    compression = CharField(max_length=8, choices=[(GZIP, 'gzip'), (ZSTD, 'zstd')], default=ZSTD)
+    since = DateTimeField()
+    until = DateTimeField()
+    asns = ArrayField(CharField(max_length=16), default=list)
+    records = PositiveIntegerField(default=0)
+    size = BigIntegerField(default=0)
+    created = DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            Index(fields=['since', 'until'], name='archive_date_idx'),
+            GinIndex(fields=['asns'], name='archive_asns_gin'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.records} results, {self.since:%Y-%m-%d} - {self.until:%Y-%m-%d})"
+
+
+class BackfillJob(Model):
+    """
+    Progress of `manage.py backfill <name>` (see app.backfill) through app_result.
+    `last_id` is moved forward in the same transaction as the batch it covers,
+    so an interrupted backfill resumes after the last committed batch.
+    """
+
+    name = CharField(max_length=64, unique=True)
+    last_id = BigIntegerField(default=0)
+    batches = PositiveIntegerField(default=0)
+    rows = BigIntegerField(default=0)
+    changed = BigIntegerField(default=0)
+    # spent in batches, sleeps excluded
+    seconds = FloatField(default=0)
+    finished = BooleanField(default=False)
+    started = DateTimeField(auto_now_add=True)
+    updated = DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @{self.last_id} ({self.rows} rows, {self.changed} changed{', finished' if self.finished else ''})"
+
+    def throughput(self):
+        """
+        :return: rows per second
+        """
+        return self.rows / self.seconds if self.seconds else None
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from .models import Notification
+from .libs import MattermostClient, RipestatClient
+
+
+def new_rov_message(payload, holders):
+    """
+    :param payload: Notification.payload, as written by Notification.objects.enqueue_new_rov
+    :param holders: AS holder names, in the same order as payload['asn']
+    :return: Mattermost message
+    """
+
+    names = [
+        "[AS {asn}](https://stat.ripe.net/AS{asn}) ({holder})".format(
+            asn=asn,
+            holder=holder
+        ) for asn, holder in zip(payload['asn'], holders)
+    ]
+
+    msg = "{names} {verb} just been seen with rpki-valid=true, rpki-invalid=false, pfx={pfx}.".format(
+        names=', '.join(names),
+        verb='have' if len(names) > 1 else 'has',
+        pfx="[{pfx}](https://stat.ripe.net/{pfx})".format(pfx=payload['pfx'])
+    )
+
+    if payload['last_seen_not_rov']:
+        msg += " We saw {subject} previously not doing Route Origin Validation (last seen: {last_seen}).".format(
+            subject='them' if len(names) > 1 else 'it',
+            last_seen=parse_datetime(payload['last_seen_not_rov']).strftime("%b %d %Y %H:%M:%S")
+        )
+
+    if payload['third_party']:
+        msg += " This result comes from a 3rd party site (not sg-pub.ripe.net)."
+
+    return msg
+
+
+def deliver(notification):
+    """
+    Fetch whatever enrichment the message needs and send it.
+    Raises on any upstream failure.
+    """
+
+    if notification.kind == Notification.NEW_ROV:
+        holders = RipestatClient().fetch_holders(notification.payload['asn'])
+        MattermostClient().send_msg(msg=new_rov_message(notification.payload, holders))
+    else:
+        raise ValueError("unknown notification kind: {kind}".format(kind=notification.kind))
+
+
+def process_next():
+    """
+    Deliver the next due notification, if any.
+    No transaction (nor row lock) is held while the upstream requests are made,
+    see NotificationManager.lease_next.
+
+    :return: the processed Notification, None if there was nothing to do
+    """
+
+    notification = Notification.objects.lease_next()
+
+    if notification is None:
+        return None
+
+    try:
+        deliver(notification)
+    except Exception as e:
+        with transaction.atomic():
+            notification.mark_failed(e)
+    else:
+        with transaction.atomic():
+            notification.mark_sent()
+
+    return notification
@@ -0,0 +1,159 @@
+"""
+Monthly range partitions of app_result on Result.date
+
+    app_result              partitioned parent, PRIMARY KEY (id, date)
+    app_result_pYYYYMM      [first of the month, first of next month)
+    app_result_default      anything not covered by a monthly partition
+
+app_resultevent isn't partitioned: the events of expired partitions are deleted
+after them, in batches. AsnRovState and AsnRollup are history and keep counting
+the expired months.
+"""
+
+from datetime import datetime, timedelta, timezone
+from django.db import connection, transaction
+from rpki_validation_browser.utils import config
+from .models import invalidate_latency
+
+PARENT = 'app_result'
+DEFAULT = PARENT + '_default'
+PREFIX = PARENT + '_p'
+EVENTS = 'app_resultevent'
+
+
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(dt, months):
+    month = dt.month - 1 + months
+    return dt.replace(year=dt.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(start):
+    return "{prefix}{start:%Y%m}".format(prefix=PREFIX, start=start)
+
+
+def partitions(cursor):
+    """
+    :return: {month start: partition name} of the monthly partitions attached to app_result
+    """
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, [PARENT])
+
+    return {
+        datetime.strptime(name[len(PREFIX):], "%Y%m").replace(tzinfo=timezone.utc): name
+        for name, in cursor.fetchall() if name.startswith(PREFIX)
+    }
+
+
+def create_partition(cursor, start):
+    """
+    Create the partition for the month starting at `start`, moving into
+    it any rows of that month which had landed in the default partition
+    """
+
+    name = partition_name(start)
+    end = add_months(start, 1)
+
+    cursor.execute("CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)".format(
+        name=name, parent=PARENT
+    ))
+    cursor.execute("""
+        WITH moved AS (
+            DELETE FROM {default} WHERE date >= %s AND date < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """.format(default=DEFAULT, name=name), [start, end])
+    cursor.execute("ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)".format(
+        parent=PARENT, name=name
+    ), [start, end])
+
+    return name
+
+
+def ensure_partitions(since=None, ahead=3, now=None):
+    """
+    Create missing monthly partitions, from the month of `since`
+    (default: this month) up to `ahead` months from now
+
+    :return: names of the partitions created
+    """
+
+    now = now or datetime.now(timezone.utc)
+    start = month_start(since or now)
+    until = add_months(month_start(now), ahead)
+
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        existing = partitions(cursor)
+
+        while start <= until:
+            if start not in existing:
+                created.append(create_partition(cursor, start))
+            start = add_months(start, 1)
+
+    return created
+
+
+def delete_events(since, until, batch_size=None):
+    """
+    Delete the ResultEvents between since (inclusive) and until (exclusive),
+    one transaction per batch
+
+    :return: number of rows deleted
+    """
+
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("""
+                DELETE FROM {events} WHERE id IN (
+                    SELECT id FROM {events} WHERE date >= %s AND date < %s LIMIT %s
+                )
+            """.format(events=EVENTS), [since, until, batch_size or config.partition_events_batch_size])
+            count = cursor.rowcount
+
+        if not count:
+            return deleted
+
+        deleted += count
+
+
+def expire_partitions(retention_months, drop=False, now=None):
+    """
+    Detach (or drop) the monthly partitions entirely older than `retention_months`,
+    each in a transaction of its own, then delete their ResultEvents.
+    Detached partitions are left as standalone tables.
+
+    :return: names of the partitions expired
+    """
+
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retention_months)
+
+    with connection.cursor() as cursor:
+        existing = sorted(partitions(cursor).items())
+
+    expired = []
+    for start, name in existing:
+        if add_months(start, 1) > cutoff:
+            continue
+
+        # ACCESS EXCLUSIVE on app_result until committed
+        with transaction.atomic(), connection.cursor() as cursor:
+            if drop:
+                cursor.execute("DROP TABLE {name}".format(name=name))
+            else:
+                cursor.execute("ALTER TABLE {parent} DETACH PARTITION {name}".format(parent=PARENT, name=name))
+
+        end = add_months(start, 1)
+        delete_events(start, end)
+        invalidate_latency([start + timedelta(days=day) for day in range((end - start).days)])
+
+        expired.append(name)
+
+    return expired
@@ -0,0 +1,80 @@
+"""
+Fan CPU-bound work on plain data (validating, scrubbing and classifying
+results, see app.ingest.process) out to worker processes
+
+`imap` sends the items to a ProcessPoolExecutor in chunks and yields the
+results in the order of the items, keeping at most `max_pending` chunks in
+flight: items are read from the iterator as results are consumed, so a dump
+of any size is processed in bounded memory, and the caller stays the single
+writer to the database.
+
+Workers don't touch the database, and the functions they run must be
+picklable (module level, or functools.partial of one).
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from rpki_validation_browser.utils import config
+
+
+def workers(count=None):
+    """
+    :param count: number of worker processes, 0 for one per core, default config.pool_workers
+    """
+
+    count = config.pool_workers if count is None else count
+
+    return count or os.cpu_count() or 1
+
+
+def apply(fn, items):
+    return [fn(item) for item in items]
+
+
+def chunks(items, size):
+    items = iter(items)
+
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def imap(fn, items, processes=None, chunk_size=None, max_pending=None):
+    """
+    :param fn: function of an item, run in the worker processes
+    :param processes: see workers, with 1 everything's run in this process
+    :param chunk_size: items sent to a worker at once, default config.pool_chunk_size
+    :param max_pending: chunks in flight, default twice the number of processes
+    :return: iterator of (item, fn(item)), in the order of items
+    """
+
+    processes = workers(processes)
+    chunk_size = chunk_size or config.pool_chunk_size
+
+    if processes == 1:
+        for item in items:
+            yield item, fn(item)
+        return
+
+    max_pending = max_pending or 2 * processes
+    pending = deque()
+
+    executor = ProcessPoolExecutor(processes)
+    try:
+        for chunk in chunks(items, chunk_size):
+            pending.append((chunk, executor.submit(apply, fn, chunk)))
+
+            if len(pending) >= max_pending:
+                chunk, future = pending.popleft()
+                yield from zip(chunk, future.result())
+
+        while pending:
+            chunk, future = pending.popleft()
+            yield from zip(chunk, future.result())
+    finally:
+        # the consumer stopped early, or something failed: don't run the rest
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -1,8 +1,19 @@
 from rest_framework import serializers
-from app.models import Result
+from app.models import Result, AsnRollup
+from app import metrics
 
 
 class ResultSerializer(serializers.ModelSerializer):
     class Meta:
         model = Result
         fields = ['date', 'json']
+
+    def is_valid(self, raise_exception=False):
+        with metrics.stage('serialize'):
+            return super(ResultSerializer, self).is_valid(raise_exception=raise_exception)
+
+
+class AsnRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AsnRollup
+        fields = ['bucket', 'rov', 'not_rov', 'not_on_time', 'total']
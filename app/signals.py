@@ -0,0 +1,24 @@
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import receiver
+from .models import Result
+
+
+@receiver(pre_save, sender=Result)
+def sync_result_columns(sender, instance, raw=False, **kwargs):
+    """
+    Fill the typed columns from Result.json (fixtures included)
+    """
+
+    instance.sync_columns()
+
+
+@receiver(post_save, sender=Result)
+def record_derived(sender, instance, created, raw=False, **kwargs):
+    """
+    Keep the derived tables up to date with every new Result (fixtures included)
+    """
+
+    if not created:
+        return
+
+    Result.objects.record_derived([instance])
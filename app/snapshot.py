@@ -0,0 +1,164 @@
+"""
+Columnar snapshots of Results for analytics (`manage.py export_snapshot`).
+
+Each Result is flattened into typed columns, and written in batches
+to one Parquet or Arrow IPC file per day:
+
+    <output>/day=2019-08-28/results.parquet
+
+A day's file is written to results.<ext>.tmp and renamed once complete: an
+export which fails half way leaves the previous file of the day as it was.
+"""
+
+import os
+from datetime import timezone
+import pyarrow
+import pyarrow.ipc
+import pyarrow.parquet
+from .events import index_events, rounded
+from .export import FIELDS
+
+SCHEMA = pyarrow.schema([
+    ('id', pyarrow.int64()),
+    ('date', pyarrow.timestamp('us', tz='UTC')),
+    ('asn', pyarrow.string()),
+    ('asns', pyarrow.list_(pyarrow.string())),
+    ('pfx', pyarrow.string()),
+    ('rpki_valid_passed', pyarrow.bool_()),
+    ('rpki_invalid_passed', pyarrow.bool_()),
+    ('finished_on_time', pyarrow.bool_()),
+    ('is_rov', pyarrow.bool_()),
+    ('valid_received_ms', pyarrow.int32()),
+    ('invalid_received_ms', pyarrow.int32()),
+    ('invalid_blocked_ms', pyarrow.int32()),
+    ('origin_location', pyarrow.string()),
+    ('user_agent', pyarrow.string()),
+])
+
+# column -> stage its duration comes from
+DURATIONS = {
+    'valid_received_ms': 'validReceived',
+    'invalid_received_ms': 'invalidReceived',
+    'invalid_blocked_ms': 'invalidBlocked',
+}
+
+# of the int32 columns
+INT32 = (-2 ** 31, 2 ** 31 - 1)
+
+EXTENSIONS = {
+    'parquet': 'parquet',
+    'arrow': 'arrow',
+}
+
+
+def flatten(row):
+    """
+    :param row: dict of app.export.FIELDS
+    :return: dict of SCHEMA columns
+    """
+
+    events = row['json'].get('events', [])
+    index = index_events(events)
+
+    def data(stage):
+        position = index.get(stage)
+        return events[position].get('data', {}) if position is not None else {}
+
+    flat = {
+        'id': row['id'],
+        'date': row['date'],
+        'asn': row['asns'][0] if row['asns'] else None,
+        'asns': row['asns'],
+        'pfx': row['pfx'],
+        'rpki_valid_passed': row['rpki_valid_passed'],
+        'rpki_invalid_passed': row['rpki_invalid_passed'],
+        'finished_on_time': row['finished_on_time'],
+        'is_rov': row['is_rov'],
+        'origin_location': data('initialized').get('originLocation'),
+        'user_agent': row['json'].get('user_agent') or data('initialized').get('userAgent'),
+    }
+
+    # rounded as ResultEvent.duration
+    for column, stage in DURATIONS.items():
+        duration = rounded(data(stage).get('duration'))
+        flat[column] = duration if duration is not None and INT32[0] <= duration <= INT32[1] else None
+
+    return flat
+
+
+class DayWriter:
+    """
+    Writes record batches to the file of a single day
+    """
+
+    def __init__(self, output, day, fmt):
+        directory = os.path.join(output, "day={day}".format(day=day))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = os.path.join(directory, "results.{ext}".format(ext=EXTENSIONS[fmt]))
+        self.temporary = self.path + '.tmp'
+
+        if fmt == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(self.temporary, SCHEMA)
+        else:
+            self.writer = pyarrow.ipc.new_file(self.temporary, SCHEMA)
+
+    def write(self, batch):
+        self.writer.write_table(pyarrow.Table.from_pylist(batch, schema=SCHEMA))
+
+    def close(self, complete=True):
+        """
+        :param complete: replace the day's file, otherwise the temporary file is removed
+        """
+
+        self.writer.close()
+
+        if complete:
+            os.rename(self.temporary, self.path)
+        else:
+            os.remove(self.temporary)
+
+
+def write_snapshot(queryset, output, fmt='parquet', batch_size=10000):
+    """
+    :param queryset: Results to write, see app.export.results (ordered by date),
+                     of whole UTC days: a day's file is replaced with what's written of it
+    :param output: directory, one sub-directory per day is created in it
+    :return: {day: number of rows}
+    """
+
+    counts = {}
+    writer = None
+    day = None
+    batch = []
+
+    try:
+        for row in queryset.values_list(*FIELDS).iterator(chunk_size=batch_size):
+            flat = flatten(dict(zip(FIELDS, row)))
+            row_day = flat['date'].astimezone(timezone.utc).date().isoformat()
+
+            if row_day != day or len(batch) >= batch_size:
+                if batch:
+                    writer.write(batch)
+                    batch = []
+
+                if row_day != day:
+                    if writer is not None:
+                        writer.close()
+                    writer = DayWriter(output, row_day, fmt)
+                    day = row_day
+
+            batch.append(flat)
+            counts[day] = counts.get(day, 0) + 1
+
+        if batch:
+            writer.write(batch)
+    except BaseException:
+        if writer is not None:
+            writer.close(complete=False)
+        raise
+
+    if writer is not None:
+        writer.close()
+
+    return counts
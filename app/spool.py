@@ -0,0 +1,237 @@
+"""
+Write-behind spool, absorbing bursts of POST /results/ (enabled with config.spool_dir)
+
+ResultView validates and scrubs a result, appends it to the spool and answers 202.
+`manage.py flush_spool` loads what has been spooled with COPY, in batches of
+config.spool_batch_size, and runs the ROV state / notification logic per batch
+(see app.ingest.save_results).
+
+    <spool_dir>/current.ndjson          appended to by every web worker, under flock
+    <spool_dir>/segment-<ns>.ndjson     sealed by the flusher, oldest first
+    <spool_dir>/rejected.ndjson         records the database wouldn't take
+
+Crash safety: appends are a single write() of a whole line (fsync'ed with
+config.spool_fsync), torn lines are skipped. The flusher moves a segment's
+SpoolSegment.offset forward in the transaction that inserts the batch, so after
+a crash it carries on from the last committed batch, and it only deletes a
+segment (then its SpoolSegment) once it has been marked finished.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import time
+from django.db import transaction, DatabaseError, InterfaceError, OperationalError
+from django.utils.dateparse import parse_datetime
+from rpki_validation_browser.utils import config
+from .ingest import save_results
+from .models import Result, SpoolSegment
+
+CURRENT = 'current.ndjson'
+REJECTED = 'rejected.ndjson'
+SEGMENT = 'segment-'
+
+logger = logging.getLogger(__name__)
+
+
+def enabled():
+    return bool(config.spool_dir)
+
+
+def path(name):
+    return os.path.join(config.spool_dir, name)
+
+
+def append(record):
+    """
+    :param record: {"json": {...}, "date": ISO 8601, "fingerprint": ...}, prepared and validated
+    """
+
+    line = (json.dumps(record, separators=(',', ':')) + '\n').encode()
+    current = path(CURRENT)
+
+    while True:
+        fd = os.open(current, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+            # sealed by the flusher while we were waiting for the lock: start over
+            try:
+                if os.fstat(fd).st_ino != os.stat(current).st_ino:
+                    continue
+            except FileNotFoundError:
+                continue
+
+            os.write(fd, line)
+            if config.spool_fsync:
+                os.fsync(fd)
+            return
+        finally:
+            os.close(fd)
+
+
+def seal():
+    """
+    Turn current.ndjson into a segment, if there's anything in it
+
+    :return: segment name, None if there was nothing to seal
+    """
+
+    try:
+        fd = os.open(path(CURRENT), os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+        if os.fstat(fd).st_size == 0:
+            return None
+
+        name = "{prefix}{ns:020d}.ndjson".format(prefix=SEGMENT, ns=time.time_ns())
+        os.rename(path(CURRENT), path(name))
+        return name
+    finally:
+        os.close(fd)
+
+
+def segments():
+    return sorted(name for name in os.listdir(config.spool_dir) if name.startswith(SEGMENT))
+
+
+def read(name, offset, limit):
+    """
+    :return: (list of raw lines, offset after them), complete lines only
+    """
+
+    lines = []
+
+    with open(path(name), 'rb') as f:
+        f.seek(offset)
+
+        while len(lines) < limit:
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                # end of the segment, or torn by a crash while writing
+                break
+
+            lines.append(line)
+            offset += len(line)
+
+    return lines, offset
+
+
+def to_result(line):
+    record = json.loads(line)
+
+    return Result(
+        json=record["json"],
+        date=parse_datetime(record["date"]),
+        fingerprint=record.get("fingerprint"),
+    )
+
+
+def reject(lines, error):
+    logger.error("spool: rejecting %d record(s): %s", len(lines), error)
+
+    with open(path(REJECTED), 'ab') as f:
+        for line in lines:
+            f.write(line)
+
+
+def load(lines):
+    """
+    :return: (saved, rejected)
+    """
+
+    parsed = []
+    broken = []
+
+    for line in lines:
+        try:
+            parsed.append((line, to_result(line)))
+        except (ValueError, KeyError, TypeError):
+            broken.append(line)
+
+    if broken:
+        reject(broken, "can't be parsed")
+
+    # fingerprints have been claimed when the results were spooled
+    try:
+        with transaction.atomic():
+            return len(save_results([result for _, result in parsed], claim=False, copy=True)), len(broken)
+    except (InterfaceError, OperationalError):
+        raise
+    except DatabaseError as e:
+        if len(parsed) == 1:
+            reject([parsed[0][0]], e)
+            return 0, len(broken) + 1
+
+    # find the one(s) the database won't take
+    saved, rejected = 0, len(broken)
+    for line, _ in parsed:
+        s, r = load([line])
+        saved, rejected = saved + s, rejected + r
+
+    return saved, rejected
+
+
+def flush_segment(name):
+    """
+    :return: number of Results saved
+    """
+
+    total = 0
+
+    while True:
+        with transaction.atomic():
+            segment, _ = SpoolSegment.objects.select_for_update().get_or_create(name=name)
+
+            if segment.finished:
+                break
+
+            lines, offset = read(name, segment.offset, config.spool_batch_size)
+
+            if not lines:
+                segment.finished = True
+                segment.save()
+                break
+
+            saved, rejected = load(lines)
+
+            segment.offset = offset
+            segment.records += saved
+            segment.rejected += rejected
+            segment.save()
+
+        total += saved
+
+    # only once it's been marked finished
+    os.remove(path(name))
+    SpoolSegment.objects.filter(name=name).delete()
+
+    return total
+
+
+def flush():
+    """
+    Seal what's been spooled and load every segment, oldest first.
+    A single flusher runs at a time.
+
+    :return: number of Results saved, None if another flusher is running
+    """
+
+    with open(path('flush.lock'), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+
+        seal()
+        names = segments()
+
+        # of segments removed by a flusher which stopped before deleting their row
+        SpoolSegment.objects.filter(finished=True).exclude(name__in=names).delete()
+
+        return sum(flush_segment(name) for name in names)
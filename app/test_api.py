@@ -1,7 +1,17 @@
 from django.test import override_settings
 from rest_framework.test import APITestCase
-from app.models import Result
+from app.models import Result, AsnRovState, AsnRollup, Notification
+import csv
+import gzip
+import io
 import json
+import os
+import tempfile
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from prometheus_client import REGISTRY
+from rpki_validation_browser.utils import config
 
 
 # Makes JSON --> Python copy pasting easier
@@ -57,19 +67,92 @@ class RpkiAPITestCase(APITestCase):
 
         documentation_asn = ["64496"]
 
-        self.client.post(
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                path='/results/',
+                data={
+                    "json": {
+                        "asn": documentation_asn,
+                        "pfx": "193.0.20.0/23",
+                        "rpki-valid-passed": True,
+                        "rpki-invalid-passed": True
+                    },
+                    "date": "2019-08-27T00:00:00.000Z"},
+                format='json'
+            )
+
+        self.assertEqual(Result.objects.count(), 2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["dry_run"])
+        self.assertEqual(response.data["classification"]["signal"], "not-rov")
+        self.assertTrue(response.data["classification"]["documentation"])
+
+    def test_dry_run(self):
+
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                path='/results/?dry_run=1',
+                data={
+                    "json": {
+                        "asn": self.asn,
+                        "pfx": "193.0.20/23",
+                        "ip": "193.0.20.1",
+                        "rpki-valid-passed": True,
+                        "rpki-invalid-passed": False,
+                        "events": [
+                            {
+                                "data": {"ip": "193.0.20.1", "duration": 100},
+                                "stage": "validReceived"
+                            },
+                            {
+                                "data": {"duration": 100},
+                                "stage": "invalidBlocked"
+                            }
+                        ]
+                    },
+                    "date": "2019-08-27T00:00:00.000Z"},
+                format='json'
+            )
+
+        self.assertEqual(Result.objects.count(), 2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("193.0.20.1", json.dumps(response.data["json"]))
+        self.assertEqual(
+            response.data["classification"],
+            {
+                "asns": self.asn,
+                "pfx": "193.0.20.0/23",
+                "signal": "rov",
+                "finished-on-time": True,
+                "is-doing-rpki": True,
+                "documentation": False
+            }
+        )
+
+    def test_invalid_payload(self):
+
+        response = self.client.post(
             path='/results/',
             data={
                 "json": {
-                    "asn": documentation_asn,
+                    "asn": [3333],
                     "pfx": "193.0.20.0/23",
-                    "rpki-valid-passed": True,
-                    "rpki-invalid-passed": True
                 },
-                "date": "2019-08-27T00:00:00.000Z"},
+                "date": "2019-08-27T00:00:00.000Z"
+            },
             format='json'
         )
 
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["path"], "json.asn.0")
+        self.assertEqual(response.data["error"], "3333 is not of type 'string'")
+
+        response = self.client.post(path='/results/', data={"date": "2019-08-27T00:00:00.000Z"}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "'json' is a required property")
         self.assertEqual(Result.objects.count(), 2)
 
 
@@ -528,3 +611,716 @@ class DurationTestCase(APITestCase):
             Result.objects.order_by('-id').first().is_doing_rpki(),
         )
 
+
+
+@override_settings(DEBUG=True)
+class BulkTestCase(APITestCase):
+    fixtures = ['no-rov.json']
+    asn = ["3333"]
+
+    def result(self, asn, invalid_passed):
+        return json.dumps({
+            "json": {
+                "asn": asn,
+                "pfx": "193.0.20.0/23",
+                "ip": "193.0.20.1",
+                "rpki-valid-passed": True,
+                "rpki-invalid-passed": invalid_passed,
+                "events": [
+                    {
+                        "data": {
+                            "ip": "193.0.20.1",
+                            "testUrl": "https://hash.rpki-valid-beacon.meerval.net/valid.json",
+                            "duration": 593
+                        },
+                        "stage": "validReceived"
+                    },
+                    {
+                        "data": {
+                            "testUrl": "https://hash.rpki-invalid-beacon.meerval.net/invalid.json",
+                            "duration": 1143
+                        },
+                        "stage": "invalidReceived" if invalid_passed else "invalidBlocked"
+                    }
+                ]
+            },
+            "date": "2019-08-30T00:00:00.000Z"
+        })
+
+    def test_bulk(self):
+
+        body = "\n".join([
+            self.result(self.asn, False),
+            self.result(self.asn, False),
+            "{not json",
+            json.dumps({"json": {"asn": self.asn}}),
+            "",
+            self.result(["64496"], False),
+            self.result(["24555"], True),
+        ])
+
+        response = self.client.post(
+            path='/results/bulk/',
+            data=body,
+            content_type='application/x-ndjson'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["accepted"], 3)
+        self.assertEqual(response.data["rejected"], 2)
+        self.assertEqual(
+            [(line["line"], line["status"]) for line in response.data["lines"]],
+            [(1, "accepted"), (2, "accepted"), (3, "rejected"), (4, "rejected"), (6, "skipped"), (7, "accepted")]
+        )
+        self.assertEqual(response.data["lines"][3]["error"], "'pfx' is a required property")
+        self.assertEqual(response.data["lines"][3]["path"], "json")
+
+        # documentation ASNs are not stored
+        self.assertEqual(Result.objects.count(), 5)
+        self.assertFalse(Result.objects.filter(asns__contains=["64496"]).exists())
+
+        # the same scrubbing is applied
+        for result in Result.objects.filter(id__gt=2):
+            self.assertNotIn("193.0.20.1", json.dumps(result.json))
+            self.assertNotIn("hash", json.dumps(result.json))
+            self.assertTrue(result.finished_on_time)
+
+        # derived rows and a single notification for the AS new to ROV
+        self.assertEqual(AsnRovState.objects.get(asn="3333").rov_on_time_count, 2)
+        self.assertEqual(AsnRovState.objects.get(asn="24555").not_rov_count, 1)
+        self.assertEqual(Notification.objects.get().payload["asn"], self.asn)
+
+    def test_bulk_without_rpki_flags(self):
+        line = json.loads(self.result(["1234"], False))
+        del line["json"]["rpki-valid-passed"]
+        del line["json"]["rpki-invalid-passed"]
+
+        body = "\n".join([self.result(["24555"], False), json.dumps(line)])
+
+        response = self.client.post(
+            path='/results/bulk/',
+            data=body,
+            content_type='application/x-ndjson'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(line["line"], line["status"]) for line in response.data["lines"]],
+            [(1, "accepted"), (2, "accepted")]
+        )
+        self.assertEqual(Result.objects.filter(asns__contains=["1234"]).count(), 1)
+
+
+@override_settings(DEBUG=True)
+class StatsTestCase(APITestCase):
+    fixtures = ['no-rov.json']
+    asn = ["3333"]
+
+    def setUp(self):
+        self.client.post(
+            path='/results/',
+            data={
+                "json": {
+                    "asn": self.asn,
+                    "pfx": "193.0.20.0/23",
+                    "rpki-valid-passed": True,
+                    "rpki-invalid-passed": False,
+                    "events": [
+                        {"data": {"duration": 100}, "stage": "validReceived"},
+                        {"data": {"duration": 100}, "stage": "invalidBlocked"},
+                    ]
+                },
+                "date": "2019-08-30T10:30:00.000Z"
+            },
+            format='json'
+        )
+
+    def test_asn_stats(self):
+
+        response = self.client.get(
+            path='/stats/asns/3333/',
+            data={"since": "2019-08-01T00:00:00Z", "until": "2019-09-01T00:00:00Z"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["totals"],
+            {"rov": 1, "not_rov": 2, "not_on_time": 0, "total": 3, "rov_fraction": 1 / 3}
+        )
+        self.assertEqual(
+            [(bucket["bucket"], bucket["rov"], bucket["total"]) for bucket in response.data["buckets"]],
+            [("2019-08-28T00:00:00Z", 0, 1), ("2019-08-29T00:00:00Z", 0, 1), ("2019-08-30T00:00:00Z", 1, 1)]
+        )
+
+        response = self.client.get(
+            path='/stats/asns/3333/',
+            data={"period": "hour", "since": "2019-08-30T00:00:00Z", "until": "2019-08-31T00:00:00Z"}
+        )
+        self.assertEqual(
+            [bucket["bucket"] for bucket in response.data["buckets"]],
+            ["2019-08-30T10:00:00Z"]
+        )
+
+        response = self.client.get(path='/stats/asns/3333/', data={"period": "week"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_latency(self):
+
+        cache.clear()
+        self.client.post(
+            path='/results/',
+            data={
+                "json": {
+                    "asn": ["24555"],
+                    "pfx": "193.0.20.0/23",
+                    "rpki-valid-passed": True,
+                    "rpki-invalid-passed": False,
+                    "events": [
+                        {"data": {"duration": 200, "addressFamily": 6}, "stage": "validReceived"},
+                        {"data": {"duration": 7000, "addressFamily": 6}, "stage": "invalidBlocked"},
+                    ]
+                },
+                "date": "2019-08-31T10:30:00.000Z"
+            },
+            format='json'
+        )
+
+        def latency(**params):
+            response = self.client.get(
+                path='/stats/latency/',
+                data=dict(params, since="2019-08-01T00:00:00Z", until="2019-09-01T00:00:00Z")
+            )
+            self.assertEqual(response.status_code, 200)
+            return response.data
+
+        rows = latency()["stats"]
+        stats = {row["stage"]: row for row in rows}
+
+        self.assertEqual(stats["validReceived"]["count"], 4)
+        self.assertEqual(stats["validReceived"]["over_threshold"], 0)
+        # 100, 200, 593, 593: interpolated within the 10 ms bin
+        self.assertEqual(stats["validReceived"]["quantiles"]["p50"], 210)
+
+        self.assertEqual(stats["invalidBlocked"]["count"], 2)
+        self.assertEqual(stats["invalidBlocked"]["over_threshold"], 0.5)
+        self.assertEqual(stats["invalidBlocked"]["histogram"][0], 1)
+        self.assertEqual(stats["invalidBlocked"]["histogram"][14], 1)
+
+        # past days come from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(latency()["stats"], rows)
+
+        # until results of a past day are posted
+        self.client.post(
+            path='/results/',
+            data={
+                "json": {
+                    "asn": ["24555"],
+                    "pfx": "193.0.20.0/23",
+                    "events": [{"data": {"duration": 300}, "stage": "validReceived"}]
+                },
+                "date": "2019-08-31T11:00:00.000Z"
+            },
+            format='json'
+        )
+        stats = {row["stage"]: row for row in latency()["stats"]}
+        self.assertEqual(stats["validReceived"]["count"], 5)
+
+        # only the day written is read again
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                path='/stats/latency/', data={"since": "2019-08-01T00:00:00Z", "until": "2019-08-31T00:00:00Z"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["stats"])
+
+        # the day in progress isn't cached
+        from datetime import datetime, timezone
+        from app import latency as latency_stats
+
+        day = datetime(2019, 8, 31, tzinfo=timezone.utc)
+        generation = latency_stats.generation()
+        day_generation = latency_stats.generation(day)
+        other_generation = latency_stats.generation(datetime(2019, 8, 30, tzinfo=timezone.utc))
+
+        latency_stats.invalidate([datetime.now(timezone.utc)])
+        self.assertEqual(latency_stats.generation(day), day_generation)
+        latency_stats.invalidate([datetime(2019, 8, 31, 12, tzinfo=timezone.utc), datetime.now(timezone.utc)])
+        self.assertNotEqual(latency_stats.generation(day), day_generation)
+        self.assertEqual(latency_stats.generation(datetime(2019, 8, 30, tzinfo=timezone.utc)), other_generation)
+        self.assertEqual(latency_stats.generation(), generation)
+
+        latency_stats.invalidate()
+        self.assertNotEqual(latency_stats.generation(), generation)
+
+        stats = latency(group="asn", limit=1)["stats"]
+        self.assertEqual({row["group"] for row in stats}, {"3333"})
+        self.assertEqual(sum(row["count"] for row in stats if row["stage"] == "validReceived"), 3)
+
+        stats = latency(group="family")["stats"]
+        self.assertEqual(
+            {(row["group"], row["stage"]): row["count"] for row in stats if row["group"] != ""},
+            {("4", "validReceived"): 2, ("4", "invalidReceived"): 2, ("6", "validReceived"): 1, ("6", "invalidBlocked"): 1}
+        )
+
+        response = self.client.get(path='/stats/latency/', data={"group": "week"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_recompute(self):
+
+        incremental = list(AsnRollup.objects.order_by('asn', 'period', 'bucket').values())
+        self.assertEqual(len(incremental), 6)
+
+        AsnRollup.objects.all().delete()
+        AsnRollup.objects.recompute()
+
+        recomputed = list(AsnRollup.objects.order_by('asn', 'period', 'bucket').values())
+        self.assertEqual(
+            [dict(row, id=None) for row in recomputed],
+            [dict(row, id=None) for row in incremental]
+        )
+
+
+class ExportTestCase(APITestCase):
+    fixtures = ['no-rov.json']
+
+    def export(self, **params):
+        params.setdefault("since", "2019-01-01")
+        response = self.client.get(path='/results/export/', data=params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_authentication(self):
+
+        response = self.client.get(path='/results/export/')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_export(self):
+
+        self.client.force_authenticate(User.objects.create(username="researcher"))
+
+        rows = [json.loads(line) for line in self.export().decode().splitlines()]
+        self.assertEqual([row["id"] for row in rows], [1, 2])
+        self.assertEqual(rows[0]["asns"], ["3333"])
+        self.assertEqual(rows[0]["date"], "2019-08-28T00:00:00+00:00")
+        self.assertEqual(rows[0]["json"]["pfx"], "193.0.20.0/23")
+
+        rows = list(csv.DictReader(io.StringIO(self.export(output="csv", until="2019-08-29").decode())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["asns"], "3333")
+        self.assertEqual(json.loads(rows[0]["json"])["asn"], ["3333"])
+
+        self.assertEqual(
+            gzip.decompress(self.export(gzip=1)).decode(),
+            self.export().decode()
+        )
+
+        self.assertEqual(self.export(asn="24555"), b"")
+
+        # the 30 days window by default
+        response = self.client.get(path='/results/export/')
+        self.assertEqual(b''.join(response.streaming_content), b"")
+
+    def test_command(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.csv.gz")
+            call_command('export_results', format='csv', gzip=True, output=path, since="2019-08-29")
+
+            with gzip.open(path, 'rt') as f:
+                rows = list(csv.DictReader(f))
+
+        self.assertEqual([row["id"] for row in rows], ["2"])
+
+    def test_snapshot(self):
+
+        import pyarrow.dataset
+        import pyarrow.ipc
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('export_snapshot', output=directory, since="2019-01-01", batch_size=1, stdout=io.StringIO())
+
+            self.assertEqual(sorted(os.listdir(directory)), ["day=2019-08-28", "day=2019-08-29"])
+
+            # only the columns asked for are read
+            table = pyarrow.dataset.dataset(directory, format="parquet", partitioning="hive").to_table(
+                columns=["id", "asn", "valid_received_ms", "invalid_received_ms", "invalid_blocked_ms", "origin_location"]
+            )
+            rows = sorted(table.to_pylist(), key=lambda row: row["id"])
+
+            self.assertEqual(rows[0], {
+                "id": 1,
+                "asn": "3333",
+                "valid_received_ms": 593,
+                "invalid_received_ms": 1143,
+                "invalid_blocked_ms": None,
+                "origin_location": "https://8080.ripe.net",
+            })
+
+            call_command('export_snapshot', output=directory, format='arrow', until="2019-08-29", stdout=io.StringIO())
+
+            with pyarrow.memory_map(os.path.join(directory, "day=2019-08-28", "results.arrow")) as source:
+                table = pyarrow.ipc.open_file(source).read_all()
+
+            self.assertEqual(table.column("id").to_pylist(), [1])
+            self.assertTrue(table.column("rpki_invalid_passed").to_pylist()[0])
+
+            # widened to whole days, the day's file isn't replaced by part of it
+            call_command('export_snapshot', output=directory, format='arrow', since="2019-08-28T12:00:00Z",
+                         until="2019-08-28T12:00:00Z", stdout=io.StringIO())
+
+            with pyarrow.memory_map(os.path.join(directory, "day=2019-08-28", "results.arrow")) as source:
+                self.assertEqual(pyarrow.ipc.open_file(source).read_all().column("id").to_pylist(), [1])
+
+            # nor by what a failed export had written of it
+            from unittest import mock
+            from app import snapshot
+
+            def flatten(row, flatten=snapshot.flatten):
+                if row['id'] == 2:
+                    raise ValueError
+                return flatten(row)
+
+            with mock.patch('app.snapshot.flatten', flatten), self.assertRaises(ValueError):
+                call_command('export_snapshot', output=directory, batch_size=1, stdout=io.StringIO())
+
+            self.assertEqual(sorted(os.listdir(os.path.join(directory, "day=2019-08-28"))),
+                             ["results.arrow", "results.parquet"])
+            self.assertEqual(os.listdir(os.path.join(directory, "day=2019-08-29")), ["results.parquet"])
+
+    def test_snapshot_durations(self):
+        from app.snapshot import flatten
+
+        row = dict.fromkeys(["id", "date", "pfx", "rpki_valid_passed", "rpki_invalid_passed", "finished_on_time",
+                             "is_rov"], None)
+        row.update(asns=[], json={"events": [
+            {"data": {"duration": 4999.7}, "stage": "validReceived"},
+            {"data": {"duration": 592.5}, "stage": "invalidReceived"},
+            {"data": {"duration": 1e12}, "stage": "invalidBlocked"},
+        ]})
+
+        # as ResultEvent.duration, the int32 columns don't take what doesn't fit
+        flat = flatten(row)
+        self.assertEqual(
+            (flat["valid_received_ms"], flat["invalid_received_ms"], flat["invalid_blocked_ms"]), (5000, 593, None)
+        )
+
+
+class MetricsTestCase(APITestCase):
+    fixtures = ['no-rov.json']
+    asn = ["3333"]
+
+    def setUp(self):
+        self.previous = config.metrics
+
+    def tearDown(self):
+        config.metrics = self.previous
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_disabled(self):
+
+        config.metrics = False
+        before = self.sample('rpki_stage_seconds_count', stage='validate')
+
+        self.client.post(path='/results/', data=BulkTestCase.result(self, self.asn, False), content_type='application/json')
+
+        self.assertEqual(self.sample('rpki_stage_seconds_count', stage='validate'), before)
+        self.assertEqual(self.client.get(path='/metrics').status_code, 404)
+
+    def test_metrics(self):
+
+        config.metrics = True
+        view = 'result-list'
+
+        before = {
+            'request': self.sample('rpki_request_seconds_count', method='POST', view=view, status='201'),
+            'queries': self.sample('rpki_db_queries_sum', view=view),
+            'queued': self.sample('rpki_notifications_total', kind=Notification.NEW_ROV, outcome='queued'),
+        }
+
+        response = self.client.post(
+            path='/results/', data=BulkTestCase.result(self, self.asn, False), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.sample('rpki_request_seconds_count', method='POST', view=view, status='201'),
+                         before['request'] + 1)
+        self.assertGreater(self.sample('rpki_db_queries_sum', view=view), before['queries'])
+        self.assertEqual(self.sample('rpki_notifications_total', kind=Notification.NEW_ROV, outcome='queued'),
+                         before['queued'] + 1)
+
+        for stage in ('validate', 'scrub', 'serialize', 'insert', 'record_derived', 'notify', 'ases_are_new_to_rov'):
+            self.assertGreater(self.sample('rpki_stage_seconds_count', stage=stage), 0, stage)
+
+        response = self.client.get(path='/metrics')
+        self.assertEqual(response.status_code, 200)
+
+        text = response.content.decode()
+        self.assertIn('rpki_stage_seconds_bucket{le="0.005",stage="validate"}', text)
+        self.assertIn('rpki_notification_queue{status="pending"} 1.0', text)
+
+
+class DuplicateTestCase(APITestCase):
+    fixtures = ['no-rov.json']
+    run_hash = "d6efab04-07b5-450a-bad0-42fb6aaad635"
+
+    def setUp(self):
+        cache.clear()
+
+    def result(self, date="2019-08-30T00:00:00.000Z"):
+        data = json.loads(BulkTestCase.result(self, ["3333"], False))
+        data["date"] = date
+        for event in data["json"]["events"]:
+            event["data"]["testUrl"] = event["data"]["testUrl"].replace("hash", self.run_hash)
+
+        return data
+
+    def post(self, data):
+        return self.client.post(path='/results/', data=data, format='json')
+
+    def test_duplicate(self):
+
+        before = Result.objects.count()
+
+        self.assertEqual(self.post(self.result()).status_code, 201)
+
+        response = self.post(self.result())
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["duplicate"])
+
+        # past the cache window, the unique constraint catches it
+        cache.clear()
+        response = self.post(self.result())
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["duplicate"])
+
+        self.assertEqual(Result.objects.count(), before + 1)
+        self.assertEqual(AsnRovState.objects.get(asn="3333").rov_count, 1)
+
+        # keyed, nothing of the run's hash is stored
+        result = Result.objects.order_by('-id').first()
+        self.assertEqual(len(result.fingerprint), 32)
+        self.assertNotIn(self.run_hash, json.dumps(result.json) + result.fingerprint)
+
+        # the same run posted again with another date, within the window
+        response = self.post(self.result(date="2019-08-30T00:01:00.000Z"))
+        self.assertTrue(response.data["duplicate"])
+
+    def test_bulk(self):
+
+        before = Result.objects.count()
+        line = json.dumps(self.result())
+
+        response = self.client.post(
+            path='/results/bulk/',
+            data="\n".join([line, line]),
+            content_type='application/x-ndjson'
+        )
+        self.assertEqual([line["status"] for line in response.data["lines"]], ["accepted", "duplicate"])
+
+        # already stored, and not in the cache anymore
+        cache.clear()
+        response = self.client.post(path='/results/bulk/', data=line, content_type='application/x-ndjson')
+        self.assertEqual([line["status"] for line in response.data["lines"]], ["duplicate"])
+
+        self.assertEqual(Result.objects.count(), before + 1)
+
+
+class SpoolTestCase(APITestCase):
+    fixtures = ['no-rov.json']
+
+    def setUp(self):
+        cache.clear()
+        self.previous = config.spool_dir, config.spool_batch_size
+        self.directory = tempfile.TemporaryDirectory()
+        config.spool_dir = self.directory.name
+
+    def tearDown(self):
+        config.spool_dir, config.spool_batch_size = self.previous
+        self.directory.cleanup()
+
+    def record(self, asn):
+        data = json.loads(BulkTestCase.result(self, [asn], False))
+        return {"json": data["json"], "date": "2019-08-30T00:00:00+00:00", "fingerprint": None}
+
+    def test_spool(self):
+
+        before = Result.objects.count()
+
+        for asn in ("3333", "24555"):
+            response = self.client.post(path='/results/', data=BulkTestCase.result(self, [asn], False),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 202)
+            self.assertTrue(response.data["spooled"])
+
+        # nothing written until flushed
+        self.assertEqual(Result.objects.count(), before)
+
+        call_command('flush_spool', '--once', stdout=io.StringIO())
+
+        self.assertEqual(Result.objects.count(), before + 2)
+        self.assertEqual(AsnRovState.objects.get(asn="3333").rov_count, 1)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(os.listdir(self.directory.name), ['flush.lock'])
+
+        # always-on deployments (see docker-compose.yaml)
+        config.spool_dir = ''
+        call_command('flush_spool', '--if-enabled', stdout=io.StringIO())
+
+    def test_replay(self):
+        from app import spool
+        from app.models import SpoolSegment
+
+        before = Result.objects.count()
+        config.spool_batch_size = 1
+
+        for asn in ("3333", "24555", "3333"):
+            spool.append(self.record(asn))
+
+        # torn by a crash while appending
+        with open(spool.path(spool.CURRENT), 'a') as f:
+            f.write('{"json": {"asn"')
+
+        name = spool.seal()
+
+        # the first record was flushed before a crash
+        _, offset = spool.read(name, 0, 1)
+        SpoolSegment.objects.create(name=name, offset=offset, records=1)
+
+        self.assertEqual(spool.flush(), 2)
+        self.assertEqual(Result.objects.count(), before + 2)
+        self.assertEqual(spool.segments(), [])
+        # nothing left to resume
+        self.assertFalse(SpoolSegment.objects.exists())
+
+        # finished, but the flusher crashed before deleting it
+        spool.append(self.record("3333"))
+        name = spool.seal()
+        SpoolSegment.objects.create(name=name, finished=True)
+        # deleted, but the flusher crashed before deleting its row
+        SpoolSegment.objects.create(name=spool.SEGMENT + "1", finished=True)
+
+        self.assertEqual(spool.flush(), 0)
+        self.assertEqual(Result.objects.count(), before + 2)
+        self.assertEqual(spool.segments(), [])
+        self.assertFalse(SpoolSegment.objects.exists())
+
+
+class ImportTestCase(APITestCase):
+    fixture = os.path.join(os.path.dirname(__file__), 'fixtures', 'no-rov.json')
+
+    def import_results(self, *args, **options):
+        call_command('import_results', *args, no_progress=True, stdout=io.StringIO(), **options)
+
+    def test_fixture(self):
+        from unittest import mock
+        from django.core.management.base import CommandError
+        from app import importer
+
+        # records split across reads
+        with mock.patch.object(importer, 'CHUNK', 7):
+            self.import_results(self.fixture, batch_size=1)
+
+        self.assertEqual(Result.objects.count(), 2)
+        self.assertEqual(AsnRovState.objects.get(asn="3333").not_rov_count, 2)
+        self.assertEqual(AsnRollup.objects.filter(period=AsnRollup.DAY).count(), 2)
+        self.assertEqual(Notification.objects.count(), 0)
+
+        # as is, without --rescrub
+        self.assertIn("rpki-valid-beacon", json.dumps(Result.objects.first().json))
+
+        with self.assertRaises(CommandError):
+            self.import_results(self.fixture)
+
+    def test_resume(self):
+        from app.models import ImportJob
+
+        def line(asn, date="2019-08-30T00:00:00Z"):
+            data = json.loads(BulkTestCase.result(self, [asn], False))
+            data["date"] = date
+            for event in data["json"]["events"]:
+                event["data"]["testUrl"] = event["data"]["testUrl"].replace("hash", DuplicateTestCase.run_hash)
+            return json.dumps(data)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.ndjson.gz")
+            with gzip.open(path, 'wt') as f:
+                f.write("\n".join([
+                    line("3333"),
+                    line("24555"),
+                    line("3333", date="yesterday"),
+                    line("64496"),
+                    line("24555", date="2019-08-31T00:00:00Z"),
+                ]) + "\n")
+
+            # the first record made it in before the import was interrupted
+            ImportJob.objects.create(name="dump", position=1)
+
+            rejected = os.path.join(directory, "rejected.ndjson")
+            self.import_results(path, name="dump", batch_size=2, rescrub=True, rejected=rejected, workers=2)
+
+            with open(rejected) as f:
+                self.assertEqual([json.loads(r)["date"] for r in f], ["yesterday"])
+
+        job = ImportJob.objects.get(name="dump")
+        self.assertEqual((job.position, job.imported, job.skipped, job.rejected), (5, 2, 1, 1))
+        self.assertTrue(job.finished)
+
+        self.assertEqual(sorted(Result.objects.values_list('asns', flat=True)), [["24555"], ["24555"]])
+
+        # scrubbed and fingerprinted again
+        result = Result.objects.first()
+        self.assertNotIn(DuplicateTestCase.run_hash, json.dumps(result.json))
+        self.assertEqual(len(result.fingerprint), 32)
+        self.assertEqual(AsnRovState.objects.get(asn="24555").rov_on_time_count, 2)
+
+class ArchiveTestCase(APITestCase):
+    fixtures = ['no-rov.json']
+
+    def setUp(self):
+        self.previous = config.archive_dir
+        self.directory = tempfile.TemporaryDirectory()
+        config.archive_dir = self.directory.name
+
+    def tearDown(self):
+        config.archive_dir = self.previous
+        self.directory.cleanup()
+
+    def test_archive(self):
+        from datetime import datetime, timezone
+        from app import archive
+        from app.models import ArchiveSegment
+
+        # not old enough
+        call_command('archive_results', older_than=100000, stdout=io.StringIO())
+        self.assertEqual(Result.objects.count(), 2)
+
+        self.assertEqual(AsnRollup.objects.filter(asn="3333", period=AsnRollup.DAY).count(), 2)
+
+        call_command('archive_results', batch_size=1, stdout=io.StringIO())
+
+        self.assertEqual(Result.objects.count(), 0)
+
+        # the derived tables are history, they keep counting them
+        self.assertEqual(AsnRollup.objects.filter(asn="3333", period=AsnRollup.DAY).count(), 2)
+        self.assertEqual(AsnRovState.objects.get(asn="3333").not_rov_count, 2)
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            [segment.name + ".ndjson.zst" for segment in ArchiveSegment.objects.order_by('name')]
+        )
+        self.assertEqual(ArchiveSegment.objects.filter(asns__contains=["3333"]).count(), 2)
+
+        self.assertEqual([row["id"] for row in archive.rows(asn="3333")], [1, 2])
+        self.assertEqual(list(archive.rows(asn="24555")), [])
+
+        rows = list(archive.rows(since=datetime(2019, 8, 29, tzinfo=timezone.utc)))
+        self.assertEqual([row["id"] for row in rows], [2])
+        self.assertEqual(rows[0]["json"]["pfx"], "193.0.20.0/23")
+
+        # research queries through the export
+        self.client.force_authenticate(User.objects.create(username="researcher"))
+        response = self.client.get(path='/results/export/', data={"since": "2019-01-01", "archived": 1})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [1, 2])
@@ -0,0 +1,141 @@
+import asyncio
+import json
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.signals import request_started, request_finished
+from django.db import close_old_connections
+from django.core.wsgi import get_wsgi_application
+from rest_framework.test import APITestCase
+from app.async_ingest import BatchWriter, IngestApplication
+from app.models import Result, AsnRovState, Notification
+from rpki_validation_browser.utils import config
+
+
+class AsyncIngestTestCase(APITestCase):
+    fixtures = ['no-rov.json']
+
+    def setUp(self):
+        self.application = IngestApplication(get_wsgi_application())
+        self.previous = config.async_batch_delay
+        config.async_batch_delay = 0.05
+
+        # as the test client does, keep the connection of the test's transaction
+        patcher = mock.patch('app.async_ingest.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+
+    def tearDown(self):
+        config.async_batch_delay = self.previous
+
+    def result(self, asn, invalid_passed=False):
+        return {
+            "json": {
+                "asn": [asn],
+                "pfx": "193.0.20.0/23",
+                "ip": "193.0.20.1",
+                "rpki-valid-passed": True,
+                "rpki-invalid-passed": invalid_passed,
+                "events": [
+                    {"data": {"ip": "193.0.20.1", "duration": 593}, "stage": "validReceived"},
+                    {"data": {"duration": 1143}, "stage": "invalidReceived" if invalid_passed else "invalidBlocked"},
+                ]
+            },
+            "date": "2019-08-30T00:00:00.000Z"
+        }
+
+    async def call(self, method, path, body=b'', query=b''):
+        scope = {
+            'type': 'http', 'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+            'method': method, 'path': path, 'query_string': query,
+            'headers': [(b'host', b'testserver'), (b'content-type', b'application/json')],
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.application(scope, receive, send)
+
+        return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+    def run_requests(self, *requests):
+
+        async def run():
+            try:
+                return await asyncio.gather(*[self.call(*request) for request in requests])
+            finally:
+                await self.application.close()
+
+        return async_to_sync(run)()
+
+    def test_concurrent(self):
+
+        before = Result.objects.count()
+        body = json.dumps(self.result("3333")).encode()
+
+        responses = self.run_requests(*[('POST', '/results/', body)] * 20)
+
+        self.assertEqual({status for status, _ in responses}, {201})
+        self.assertNotIn(b"193.0.20.1", responses[0][1])
+        self.assertTrue(json.loads(responses[0][1])["json"]["finished-on-time"])
+
+        # same writes as ResultView, a single notification
+        self.assertEqual(Result.objects.count(), before + 20)
+        self.assertEqual(AsnRovState.objects.get(asn="3333").rov_on_time_count, 20)
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_rejected_and_dry_run(self):
+
+        before = Result.objects.count()
+
+        (invalid, body), (documentation, dry_run), (explicit, _), (broken, _) = self.run_requests(
+            ('POST', '/results/', json.dumps({"json": {"asn": ["3333"]}}).encode()),
+            ('POST', '/results/', json.dumps(self.result("64496")).encode()),
+            ('POST', '/results', json.dumps(self.result("3333")).encode(), b'dry_run=1'),
+            ('POST', '/results/', b'{not json'),
+        )
+
+        self.assertEqual(invalid, 400)
+        self.assertEqual(json.loads(body), {"error": "'pfx' is a required property", "path": "json"})
+        self.assertEqual((documentation, explicit, broken), (200, 200, 400))
+        self.assertTrue(json.loads(dry_run)["dry_run"])
+        self.assertEqual(Result.objects.count(), before)
+
+    def test_fallback(self):
+
+        # anything else is served by the WSGI application
+        [(status, _)] = self.run_requests(('GET', '/metrics'))
+        self.assertEqual(status, 404)
+
+    def test_cancelled(self):
+
+        gone, waiting = Result(json={}), Result(json={})
+
+        def write(results):
+            if gone in results:
+                raise RuntimeError("can't be saved")
+            return results
+
+        async def run():
+            writer = BatchWriter()
+            try:
+                # the request is cancelled while its result is waiting for the batch to fill up
+                cancelled = asyncio.ensure_future(writer.submit(gone))
+                await asyncio.sleep(0)
+                cancelled.cancel()
+
+                return await asyncio.wait_for(writer.submit(waiting), 5)
+            finally:
+                await writer.close()
+
+        with mock.patch('app.async_ingest.write', side_effect=write):
+            self.assertTrue(async_to_sync(run)())
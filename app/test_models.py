@@ -1,5 +1,12 @@
+from datetime import datetime, timezone
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.test import TestCase, override_settings
-from app.models import Result
+from app.models import Result, ResultEvent, AsnRovState, AsnRollup, BackfillJob, as_prefix
+from app.partitions import ensure_partitions, expire_partitions
 
 
 class RpkiSmileyTestCase:
@@ -36,7 +43,7 @@ class ResultTestCase(TestCase):
         self.assertEqual(Result.objects.results_seen_doing_rov().count(), 0)
 
         new = Result(
-            json=Result.rov_signal
+            json=dict(Result.rov_signal)
         )
         new.json.update(
             {
@@ -66,3 +73,270 @@ class ResultTestCase(TestCase):
 
         self.assertFalse(Result.objects.ases_have_been_seen_not_doing_rov(["33"]))
         self.assertFalse(Result.objects.ases_have_been_seen_not_doing_rov("33"))
+
+    def test_typed_columns(self):
+
+        # fixtures go through pre_save too
+        self.assertEqual(Result.objects.results_seen_from(self.asn).count(), 2)
+        self.assertEqual(Result.objects.results_seen_from(["33"]).count(), 0)
+        self.assertEqual(Result.objects.results_seen_not_doing_rov().count(), 2)
+
+        new = Result(
+            json={
+                "asn": self.asn,
+                "pfx": "193.0.20/23",
+                "rpki-valid-passed": True,
+                "rpki-invalid-passed": None,
+                "finished-on-time": True
+            }
+        )
+        new.save()
+        new.refresh_from_db()
+
+        self.assertEqual(new.asns, self.asn)
+        self.assertEqual(new.pfx, "193.0.20.0/23")
+        self.assertTrue(new.rpki_valid_passed)
+        self.assertIsNone(new.rpki_invalid_passed)
+        self.assertTrue(new.finished_on_time)
+        self.assertFalse(new.is_rov)
+
+    def test_get_event(self):
+
+        result = Result.objects.get(pk=1)
+
+        self.assertEqual(
+            result.event_index,
+            {"initialized": 0, "validReceived": 1, "invalidReceived": 2, "enrichedReceived": 3}
+        )
+        self.assertEqual(result.get_event("invalidReceived")["data"]["duration"], 1143)
+        self.assertEqual(result.get_event("invalidBlocked"), {})
+
+    def test_as_prefix(self):
+
+        self.assertEqual(as_prefix("193.0.20.0/23"), "193.0.20.0/23")
+        self.assertEqual(as_prefix("193.0.21.1/23"), "193.0.20.0/23")
+        self.assertEqual(as_prefix("2001:67c:2e8::/48"), "2001:67c:2e8::/48")
+        self.assertIsNone(as_prefix("not a prefix"))
+        self.assertIsNone(as_prefix(None))
+
+
+@override_settings(DEBUG=True)
+class AsnRovStateTestCase(TestCase):
+    fixtures = ['no-rov.json']
+    asn = ["3333"]
+
+    def test_fixture_is_recorded(self):
+
+        state = AsnRovState.objects.get(asn="3333")
+
+        self.assertEqual(state.not_rov_count, 2)
+        self.assertEqual(state.rov_count, 0)
+        self.assertIsNone(state.first_seen_rov)
+        self.assertIsNotNone(state.last_seen_not_rov)
+
+    def test_record_returns_new_ases(self):
+
+        new = Result(json={"asn": self.asn, "finished-on-time": True})
+        new.json.update(Result.rov_signal)
+
+        self.assertEqual(AsnRovState.objects.record([new]), {"3333"})
+        self.assertEqual(AsnRovState.objects.record([new]), set())
+        self.assertEqual(AsnRovState.objects.get(asn="3333").rov_on_time_count, 2)
+
+    def test_rebuild(self):
+
+        new = Result(json={"asn": self.asn + ["64496"], "finished-on-time": True})
+        new.json.update(Result.rov_signal)
+        new.save()
+
+        before = list(AsnRovState.objects.order_by('asn').values())
+
+        AsnRovState.objects.all().delete()
+        self.assertEqual(AsnRovState.objects.rebuild(), 2)
+
+        self.assertEqual(list(AsnRovState.objects.order_by('asn').values()), before)
+
+
+class ResultEventTestCase(TestCase):
+    fixtures = ['no-rov.json', 'half-ms.json']
+
+    def timings(self):
+        return sorted(ResultEvent.objects.values_list('result_id', 'date', 'stage', 'duration', 'success', 'address_family'))
+
+    def test_record(self):
+
+        events = {
+            event.get_stage_display(): event
+            for event in ResultEvent.objects.filter(result_id=1)
+        }
+
+        self.assertEqual(sorted(events), ["enrichedReceived", "invalidReceived", "validReceived"])
+        self.assertEqual(events["validReceived"].duration, 593)
+        self.assertEqual(events["invalidReceived"].duration, 1143)
+        self.assertEqual(events["validReceived"].date, Result.objects.get(id=1).date)
+
+    def test_copy(self):
+        from app.ingest import save_results
+
+        result = Result.objects.get(id=1)
+        result.id = None
+        result.date = datetime(2019, 9, 1, tzinfo=timezone.utc)
+
+        save_results([result], claim=False, copy=True)
+
+        self.assertIsNotNone(result.id)
+        self.assertEqual(result.timings.count(), 3)
+
+    def test_rebuild(self):
+
+        before = self.timings()
+        self.assertEqual(len(before), 9)
+
+        # rounded half away from zero, as in SQL
+        self.assertEqual(
+            sorted(ResultEvent.objects.filter(result_id=3).values_list('duration', flat=True)),
+            [593, 1143, 1177]
+        )
+
+        ResultEvent.objects.all().delete()
+        self.assertEqual(ResultEvent.objects.rebuild(since=datetime(2019, 8, 29, tzinfo=timezone.utc)), 6)
+        self.assertEqual(ResultEvent.objects.rebuild(), 9)
+
+        self.assertEqual(self.timings(), before)
+
+
+class BackfillTestCase(TestCase):
+    fixtures = ['no-rov.json']
+
+    def backfill(self, job, **options):
+        call_command('backfill', job, batch_size=1, stdout=StringIO(), **options)
+        return BackfillJob.objects.get(name=job)
+
+    def test_finished_on_time(self):
+        Result.objects.filter(id=2).update(finished_on_time=False)
+
+        state = self.backfill('finished-on-time')
+
+        self.assertTrue(state.finished)
+        self.assertEqual((state.batches, state.rows, state.changed), (2, 2, 1))
+        self.assertTrue(Result.objects.get(id=2).finished_on_time)
+
+    def derived(self):
+        return (
+            list(AsnRovState.objects.order_by('asn').values()),
+            list(AsnRollup.objects.order_by('asn', 'period', 'bucket').values('asn', 'period', 'bucket', 'rov',
+                                                                             'not_rov', 'not_on_time', 'total')),
+        )
+
+    def test_threshold(self):
+        result = Result.objects.get(id=1)
+        result.json["rpki-invalid-passed"] = False
+        Result.objects.filter(id=1).update(
+            json=result.json, rpki_valid_passed=True, rpki_invalid_passed=False, is_rov=True
+        )
+        AsnRovState.objects.rebuild()
+        AsnRollup.objects.recompute()
+        self.assertEqual(AsnRovState.objects.get(asn="3333").rov_on_time_count, 1)
+
+        with mock.patch('app.backfill.ON_TIME_THRESHOLD', 1000):
+            state = self.backfill('finished-on-time')
+
+        self.assertEqual(state.changed, 2)
+
+        result = Result.objects.get(id=1)
+        self.assertFalse(result.finished_on_time)
+        self.assertFalse(result.json["finished-on-time"])
+        self.assertFalse(result.is_rov)
+
+        # adjusted in each batch, as they'd be rebuilt from the new finished_on_time
+        self.assertEqual(AsnRovState.objects.get(asn="3333").rov_on_time_count, 0)
+        self.assertEqual(
+            AsnRollup.objects.get(asn="3333", period=AsnRollup.DAY, bucket=result.date).not_on_time, 1
+        )
+
+        derived = self.derived()
+        AsnRovState.objects.rebuild()
+        AsnRollup.objects.recompute()
+        self.assertEqual(self.derived(), derived)
+
+    def test_resume(self):
+        Result.objects.update(finished_on_time=False)
+        BackfillJob.objects.create(name='finished-on-time', last_id=1, batches=1, rows=1)
+
+        state = self.backfill('finished-on-time')
+
+        self.assertEqual((state.batches, state.rows, state.changed), (2, 2, 1))
+        self.assertFalse(Result.objects.get(id=1).finished_on_time)
+        self.assertTrue(Result.objects.get(id=2).finished_on_time)
+
+        with self.assertRaises(CommandError):
+            self.backfill('finished-on-time')
+
+    def test_max_batches(self):
+        state = self.backfill('scrub', max_batches=1)
+
+        self.assertEqual((state.last_id, state.finished), (1, False))
+
+    def test_scrub(self):
+        result = Result.objects.get(id=1)
+        result.json["ip"] = "192.0.2.1"
+        Result.objects.filter(id=1).update(json=result.json)
+
+        self.assertEqual(self.backfill('scrub').changed, 2)
+
+        result = Result.objects.get(id=1)
+        self.assertNotIn("ip", result.json)
+        self.assertNotIn("d6efab04", str(result.json))
+
+        # nothing left to scrub
+        self.assertEqual(self.backfill('scrub', restart=True).changed, 0)
+
+
+class PartitionTestCase(TestCase):
+
+    def partition_of(self, result):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text FROM app_result WHERE id = %s", [result.id])
+            return cursor.fetchone()[0]
+
+    def test_partitions(self):
+
+        now = datetime(2040, 1, 15, tzinfo=timezone.utc)
+
+        result = Result(json={"asn": ["3333"]}, date=datetime(2040, 3, 2, tzinfo=timezone.utc))
+        result.save()
+        self.assertEqual(self.partition_of(result), "app_result_default")
+
+        # rows are moved out of the default partition
+        self.assertEqual(
+            ensure_partitions(now=now, ahead=2),
+            ["app_result_p204001", "app_result_p204002", "app_result_p204003"]
+        )
+        self.assertEqual(self.partition_of(result), "app_result_p204003")
+        self.assertEqual(ensure_partitions(now=now, ahead=2), [])
+
+        old = Result(
+            json={"asn": ["3333"], "rpki-valid-passed": True, "rpki-invalid-passed": True},
+            date=datetime(2040, 1, 20, tzinfo=timezone.utc)
+        )
+        old.save()
+        ResultEvent.objects.create(result_id=old.id, date=old.date, stage=2, duration=100)
+        self.assertEqual(AsnRovState.objects.get(asn="3333").not_rov_count, 1)
+
+        expired = expire_partitions(1, now=datetime(2040, 3, 1, tzinfo=timezone.utc))
+        self.assertIn("app_result_p204001", expired)
+        self.assertNotIn("app_result_p204002", expired)
+        self.assertFalse(Result.objects.filter(id=old.id).exists())
+        self.assertTrue(Result.objects.filter(id=result.id).exists())
+
+        # the timings go with the results, the derived tables are history
+        self.assertFalse(ResultEvent.objects.filter(result_id=old.id).exists())
+        self.assertEqual(AsnRovState.objects.get(asn="3333").not_rov_count, 1)
+        self.assertEqual(
+            list(AsnRollup.objects.filter(asn="3333", period=AsnRollup.DAY).values_list('bucket', flat=True)),
+            [datetime(2040, 1, 20, tzinfo=timezone.utc), datetime(2040, 3, 2, tzinfo=timezone.utc)]
+        )
+
+        self.assertEqual(
+            expire_partitions(1, drop=True, now=datetime(2040, 4, 1, tzinfo=timezone.utc)), ["app_result_p204002"]
+        )
@@ -0,0 +1,291 @@
+import json
+from datetime import timedelta
+import requests
+from io import StringIO
+from unittest import mock
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from app.models import Notification
+from app.libs import HttpClient, CircuitOpen, MattermostClient, RipestatClient, RipestatError, holder_cache
+from prometheus_client import REGISTRY
+from rpki_validation_browser.utils import config
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """
+    Local stand-in for stat.ripe.net and mattermost.ripe.net
+    """
+
+    protocol_version = 'HTTP/1.1'
+    holder = "RIPE-NCC-AS - Reseaux IP Europeens Network Coordination Centre (RIPE NCC)"
+
+    def do_GET(self):
+        time.sleep(getattr(self.server, 'latency', 0))
+        self.server.requests.append(self.path)
+        self.reply({"data": {"holder": self.holder}})
+
+    def do_POST(self):
+        self.server.requests.append(self.path)
+        self.server.messages.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+        self.reply({})
+
+    def reply(self, body):
+        status = self.server.status
+        self.send_response(status)
+        body = json.dumps(body).encode()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.clients.add(self.client_address)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(DEBUG=False)
+class StandInTestCase(APITestCase):
+    """
+    Points config at a StandIn server
+    """
+
+    # upstream calls are counted, retries are tested in HttpClientTestCase
+    overrides = {'http_retries': 0}
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+        self.server.daemon_threads = True
+        self.server.status = 200
+        self.server.clients = set()
+        self.server.requests = []
+        self.server.messages = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        url = "http://127.0.0.1:{port}".format(port=self.server.server_port)
+        self.config = {
+            'ripestat_url': url,
+            'mattermost_url': url,
+            'notification_backoff': 0,
+            'notification_max_attempts': 3,
+            'metrics': True,
+        }
+        self.config.update(self.overrides)
+        self.previous = {k: getattr(config, k) for k in self.config}
+        for k, v in self.config.items():
+            setattr(config, k, v)
+
+        cache.clear()
+        holder_cache.clear()
+        HttpClient.reset()
+
+    def tearDown(self):
+        for k, v in self.previous.items():
+            setattr(config, k, v)
+
+        HttpClient.reset()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class NotificationTestCase(StandInTestCase):
+    fixtures = ['no-rov.json']
+    asn = ["3333"]
+
+    def post_rov(self):
+        return self.client.post(
+            path='/results/',
+            data={
+                "json": {
+                    "asn": self.asn,
+                    "pfx": "193.0.20.0/23",
+                    "rpki-valid-passed": True,
+                    "rpki-invalid-passed": False,
+                    "events": [
+                        {
+                            "data": {"duration": 100},
+                            "stage": "validReceived",
+                        },
+                        {
+                            "data": {"duration": 100},
+                            "stage": "invalidBlocked",
+                        },
+                    ]
+                },
+                "date": "2019-08-30T00:00:00.000Z"
+            },
+            format='json'
+        )
+
+    def test_post_only_queues(self):
+
+        self.post_rov()
+
+        # nothing has been sent from the request path
+        self.assertEqual(self.server.requests, [])
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.status, Notification.PENDING)
+        self.assertEqual(notification.payload["asn"], self.asn)
+        self.assertIsNotNone(notification.payload["last_seen_not_rov"])
+
+        # only the first ROV result is notified
+        self.post_rov()
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_deliver(self):
+
+        sent = REGISTRY.get_sample_value('rpki_notifications_total', {'kind': 'new-rov', 'outcome': 'sent'}) or 0
+
+        self.post_rov()
+        call_command('process_notifications', once=True, stdout=StringIO())
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.status, Notification.SENT)
+        self.assertEqual(notification.attempts, 1)
+
+        self.assertEqual(self.server.requests[0], "/data/as-overview/data.json?resource=AS3333")
+        self.assertEqual(len(self.server.messages), 1)
+
+        # both requests timed, by host
+        host = "127.0.0.1:{port}".format(port=self.server.server_port)
+        self.assertEqual(REGISTRY.get_sample_value('rpki_http_client_seconds_count', {'host': host, 'status': '200'}), 2)
+        self.assertEqual(REGISTRY.get_sample_value('rpki_notifications_total', {'kind': 'new-rov', 'outcome': 'sent'}), sent + 1)
+
+        msg = self.server.messages[0]["text"]
+        self.assertTrue(msg.startswith("[AS 3333](https://stat.ripe.net/AS3333) (RIPE-NCC-AS"))
+        self.assertIn("previously not doing Route Origin Validation (last seen: Aug 29 2019 00:00:00)", msg)
+
+    def test_retry(self):
+
+        self.post_rov()
+        self.server.status = 500
+
+        call_command('process_notifications', once=True, stdout=StringIO())
+
+        # with no backoff, --once keeps retrying until max attempts
+        notification = Notification.objects.get()
+        self.assertEqual(notification.status, Notification.FAILED)
+        self.assertEqual(notification.attempts, config.notification_max_attempts)
+        self.assertIn("AS3333 holder lookup failed", notification.last_error)
+        self.assertEqual(self.server.messages, [])
+
+        # retries within ripestat_negative_ttl don't hit RIPEstat again
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_holder_cache(self):
+
+        for i in range(3):
+            Notification.objects.create(
+                kind=Notification.NEW_ROV,
+                payload={"asn": self.asn, "pfx": "193.0.20.0/23", "last_seen_not_rov": None, "third_party": False}
+            )
+
+        call_command('process_notifications', once=True, stdout=StringIO())
+
+        # fetched once, then served from the in-process LRU
+        self.assertEqual(Notification.objects.filter(status=Notification.SENT).count(), 3)
+        self.assertEqual(self.server.requests.count("/data/as-overview/data.json?resource=AS3333"), 1)
+        self.assertEqual(holder_cache.stats, {'local_hits': 2, 'shared_hits': 0, 'misses': 1})
+
+        # another worker only has the shared cache
+        holder_cache.local.clear()
+        self.assertEqual(RipestatClient().fetch_holder("3333"), StandIn.holder)
+        self.assertEqual(holder_cache.stats['shared_hits'], 1)
+        self.assertEqual(self.server.requests.count("/data/as-overview/data.json?resource=AS3333"), 1)
+
+    def test_lease(self):
+        from app.notifications import process_next
+
+        self.post_rov()
+        leased = []
+
+        def deliver(notification):
+            # claimed and committed before the upstream requests
+            leased.append(Notification.objects.get(pk=notification.pk).next_attempt)
+            raise SystemExit
+
+        with mock.patch('app.notifications.deliver', deliver), self.assertRaises(SystemExit):
+            process_next()
+
+        self.assertGreater(leased[0], timezone.now() + timedelta(seconds=config.notification_lease - 60))
+
+        # the worker died: nothing's due until the lease expires
+        notification = Notification.objects.get()
+        self.assertEqual((notification.status, notification.attempts), (Notification.PENDING, 0))
+        self.assertIsNone(process_next())
+
+        Notification.objects.update(next_attempt=timezone.now())
+        self.assertEqual(process_next().status, Notification.SENT)
+
+    def test_holder_negative_cache(self):
+
+        self.server.status = 500
+        with self.assertRaises(RipestatError):
+            RipestatClient().fetch_holder("3333")
+
+        # RIPEstat is back, but the failure is remembered for ripestat_negative_ttl
+        self.server.status = 200
+        with self.assertRaises(RipestatError):
+            RipestatClient().fetch_holder("3333")
+
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class HttpClientTestCase(StandInTestCase):
+    overrides = {'http_retries': 2, 'http_retry_backoff': 0, 'http_breaker_threshold': 5}
+
+    def fetch(self):
+        return RipestatClient().fetch_info(resource="AS3333")
+
+    def test_keep_alive(self):
+
+        for i in range(3):
+            self.fetch()
+
+        # a single connection
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_retry_and_circuit_breaker(self):
+
+        self.server.status = 500
+
+        with self.assertRaises(requests.HTTPError):
+            self.fetch()
+        self.assertEqual(len(self.server.requests), 3)
+
+        # POSTs aren't retried
+        with self.assertRaises(requests.HTTPError):
+            MattermostClient().post("hi")
+        self.assertEqual(len(self.server.requests), 4)
+
+        # 5 consecutive failures: calls fail without reaching the upstream
+        with self.assertRaises(CircuitOpen):
+            self.fetch()
+        self.assertEqual(len(self.server.requests), 5)
+
+        with self.assertRaises(CircuitOpen):
+            self.fetch()
+        self.assertEqual(len(self.server.requests), 5)
+
+    def test_fetch_holders(self):
+
+        self.server.latency = 0.2
+        asns = ["3333", "3334", "3335", "3336"]
+
+        start = time.monotonic()
+        holders = RipestatClient().fetch_holders(asns)
+
+        self.assertEqual(holders, [StandIn.holder] * 4)
+        self.assertEqual(
+            sorted(self.server.requests),
+            ["/data/as-overview/data.json?resource=AS" + asn for asn in asns]
+        )
+        # concurrently
+        self.assertLess(time.monotonic() - start, 0.6)
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import time
+from functools import partial
+from django.test import SimpleTestCase
+from app.pool import imap
+
+
+def invert(directory, x):
+    """
+    1 / x, slowly, leaving a file behind for every x it's run for
+    """
+
+    if x:
+        time.sleep(0.2)
+    open(os.path.join(directory, str(x)), 'w').close()
+
+    return 1 / x
+
+
+class PoolTestCase(SimpleTestCase):
+
+    def test_imap(self):
+        pulled = []
+
+        def items():
+            for i in range(20):
+                pulled.append(i)
+                yield -i
+
+        results = imap(abs, items(), processes=2, chunk_size=3, max_pending=2)
+
+        # no more than max_pending chunks read ahead
+        self.assertEqual(next(results), (0, 0))
+        self.assertEqual(len(pulled), 6)
+
+        self.assertEqual(list(results), [(-i, i) for i in range(1, 20)])
+
+    def test_error(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(ZeroDivisionError):
+                list(imap(partial(invert, directory), range(20), processes=2, chunk_size=1, max_pending=10))
+
+            # the chunks waiting for a worker have been cancelled
+            self.assertIn("0", os.listdir(directory))
+            self.assertLess(len(os.listdir(directory)), 10)
+
+    def test_inline(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            results = imap(partial(invert, directory), [1, 2, 0, 4], processes=1)
+
+            self.assertEqual(next(results), (1, 1))
+            self.assertEqual(next(results), (2, 0.5))
+            with self.assertRaises(ZeroDivisionError):
+                next(results)
+
+            self.assertEqual(sorted(os.listdir(directory)), ["0", "1", "2"])
@@ -0,0 +1,97 @@
+from jsonschema import Draft7Validator
+from jsonschema.exceptions import best_match
+from rest_framework.exceptions import ValidationError
+
+# What a client POSTs to /results/
+ENVELOPE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "json": {
+            "type": "object"
+        },
+        # "date": {
+        #     "type": "date-time"
+        # }
+    },
+    "required": ["json"]  # "date"
+}
+
+# Result.json
+PAYLOAD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "asn": {
+            "type": "array",
+            "items": {
+                "type": "string"
+            }
+        },
+        "pfx": {
+            "type": "string"
+        },
+        "events": {
+            "type": "array"
+        },
+    },
+    "required": ["asn", "pfx"]
+}
+
+# Schemas are checked and validators built once, at import
+Draft7Validator.check_schema(ENVELOPE_SCHEMA)
+Draft7Validator.check_schema(PAYLOAD_SCHEMA)
+
+envelope_validator = Draft7Validator(ENVELOPE_SCHEMA)
+payload_validator = Draft7Validator(PAYLOAD_SCHEMA)
+
+
+class ResultValidationError(ValidationError):
+    """
+    400, with the path to the offending element, e.g. json.asn.0
+    """
+
+    def __init__(self, message, path):
+        self.message = message
+        self.path = '.'.join(str(p) for p in path)
+
+        super(ResultValidationError, self).__init__(detail={
+            "error": self.message,
+            "path": self.path,
+        })
+
+
+def is_common_shape(data):
+    """
+    Plain isinstance checks accepting what the beacon sends.
+    Anything accepted here is accepted by the schemas too.
+    """
+
+    if type(data) is not dict:
+        return False
+
+    json = data.get("json")
+    if type(json) is not dict:
+        return False
+
+    asn = json.get("asn")
+    if type(asn) is not list or not all(type(a) is str for a in asn):
+        return False
+
+    return type(json.get("pfx")) is str and type(json.get("events", [])) is list
+
+
+def validate_result(data):
+    """
+    :param data: {"json": {...}, "date": ...} as posted by the client
+    :raises ResultValidationError: if data doesn't match the schemas
+    """
+
+    if is_common_shape(data):
+        return
+
+    error = best_match(envelope_validator.iter_errors(data))
+    if error is not None:
+        raise ResultValidationError(error.message, error.absolute_path)
+
+    error = best_match(payload_validator.iter_errors(data["json"]))
+    if error is not None:
+        raise ResultValidationError(error.message, ["json"] + list(error.absolute_path))
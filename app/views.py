@@ -1,200 +1,342 @@
-from datetime import datetime, timedelta
-from rest_framework import viewsets
-from django.http.response import HttpResponseForbidden
-from .serializers import ResultSerializer
-from .models import Result
-from .libs import MattermostClient, RipestatClient, DataProtector
-from jsonschema import validate
+import json
+from datetime import timedelta
+from rest_framework import viewsets, serializers, status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.db import transaction, IntegrityError
+from django.http import Http404
+from django.http.response import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from .serializers import ResultSerializer, AsnRollupSerializer
+from .models import Result, Notification, AsnRollup
+from .ingest import prepare, save_results
+from . import archive
+from . import latency
+from . import export as result_export
+from . import metrics
+from . import duplicates
+from . import spool
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from .events import ON_TIME_THRESHOLD
+from .libs import parse_date
+from .validation import ResultValidationError
+from rpki_validation_browser.utils import config
+
+
+def dry_run_requested(request):
+    return request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+
+
+def query_date(request, param, default):
+    value = request.query_params.get(param)
+    if value is None:
+        return default
+
+    date = parse_date(value)
+    if date is None:
+        raise serializers.ValidationError({param: "expected an ISO 8601 date or date-time"})
+
+    return date
 
 
 class ResultView(viewsets.ModelViewSet):
 
-    queryset = Result.objects.filter(
-        date__gt=datetime.now() - timedelta(days=30)  # capped at 30d
-    )
+    queryset = Result.objects.all()
     serializer_class = ResultSerializer
     http_method_names = ['get', 'head', 'options', 'post']
 
+    def get_queryset(self):
+        # capped at 30d, evaluated per request so that the window
+        # doesn't drift and partitions outside of it are pruned
+        return Result.objects.filter(
+            date__gt=timezone.now() - timedelta(days=30)
+        )
+
     def list(self, request, *args, **kwargs):
         return HttpResponseForbidden()
 
+    def is_dry_run(self, request):
+        """
+        Dry runs go through validation, scrubbing and classification
+        without touching the database: explicitly requested with ?dry_run=1,
+        and always for documentation ASNs (used for testing the production API)
+        https://tools.ietf.org/html/rfc5398#section-4
+        """
+
+        if dry_run_requested(request):
+            return True
+
+        return any([Result.objects.is_documentation_asn(asn) for asn in request.data["json"]["asn"]])
+
     def create(self, request, *args, **kwargs):
 
-        schema = {
-            "type": "object",
-            "properties": {
-                "json": {
-                    "type": "object"
-                },
-                # "date": {
-                #     "type": "date-time"
-                # }
-            },
-            "required": ["json"]  # "date"
-        }
-
-        validate(
-            instance=request.data,
-            schema=schema
-        )
+        self.event_index, self.fingerprint = prepare(request.data)
 
-        schema = {
-            "type": "object",
-            "properties": {
-                "asn": {
-                    "type": "array",
-                    "items": {
-                        "type": "string"
-                    }
-                },
-                "pfx": {
-                    "type": "string"
-                },
-                "events": {
-                    "type": "array"
-                },
-            },
-            "required": ["asn", "pfx"]
-        }
-
-        __json = request.data["json"]
-        validate(
-            instance=__json,
-            schema=schema
-        )
+        if self.is_dry_run(request):
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
 
-        # Remove sensitive data we just don't want to store in our DB
+            result = Result(**serializer.validated_data)
+            result.event_index = self.event_index
 
-        # Remove individual ip address
-        if "ip" in __json.keys():
-            del __json["ip"]
+            return Response(dict(serializer.data, **{
+                "dry_run": True,
+                "classification": result.classification(),
+            }))
 
-        # Track if the result finished on time ( t < 5000 )
-        __json["finished-on-time"] = False
+        # Browsers retry: answer duplicates as if they had been saved, without writing
+        if not duplicates.claim(self.fingerprint):
+            return self.duplicate(request)
 
-        # Instance in charge of performing data cleanup.
-        # After de-serialising, we don't want to keep
-        # information we don't *really* need
+        try:
+            if spool.enabled():
+                return self.spool(request)
 
-        data_protector = DataProtector()
+            return super(ResultView, self).create(request, *args, **kwargs)
+        except duplicates.DuplicateResult:
+            return self.duplicate(request)
+        except Exception:
+            duplicates.release(self.fingerprint)
+            raise
 
-        # Strip out any trailing strings after /
-        if "events" in __json.keys():
-            events = __json["events"]
+    def spool(self, request):
+        """
+        Write-behind: saved later, in bulk, by `manage.py flush_spool`
+        """
 
-            initialized = [e for e in events if e["stage"] == "initialized"]
-            invalid_blocked = [e for e in events if e["stage"] == "invalidBlocked"]
-            invalid_received = [e for e in events if e["stage"] == "invalidReceived"]
-            invalid_await = [e for e in events if e["stage"] == "invalidAwait"]
-            valid_received = [e for e in events if e["stage"] == "validReceived"]
-            enrich_received = [e for e in events if e["stage"] == "enrichedReceived"]
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-            if initialized:
-                data_protector.protect_origin(initialized[0])
+        spool.append({
+            "json": serializer.validated_data["json"],
+            "date": serializer.validated_data.get("date", timezone.now()).isoformat(),
+            "fingerprint": self.fingerprint,
+        })
 
-            # Remove individual ip address stored in events array
-            for ip_event in events:
-                data_protector.wipe_ip(ip_event)
+        return Response(dict(serializer.data, spooled=True), status=status.HTTP_202_ACCEPTED)
 
-            # Remove traces of IP in enrichedReceived event
-            if enrich_received:
-                data_protector.protect_entich_received(enrich_received[0])
+    def duplicate(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-            # Remove URLs containing hashes
-            if initialized:
-                data_protector.protect_initialized(initialized[0])
+        return Response(dict(serializer.data, duplicate=True))
 
-            for event in [valid_received, invalid_received, invalid_await, invalid_blocked]:
-                if not event:
-                    continue
+    def perform_create(self, serializer):
+        """
+        Notify the rpki-smiley Mattermost channel on new ASes doing RPKI.
+        The message itself is queued and sent by `manage.py process_notifications`.
+        """
 
-                data_protector.protect_event(event[0])
+        with transaction.atomic():
+            # Derived tables are updated along with the Result (see app.signals)
+            with metrics.stage('insert'):
+                try:
+                    with transaction.atomic():
+                        serializer.save(fingerprint=self.fingerprint)
+                except IntegrityError as e:
+                    # seen before the cache window
+                    if duplicates.is_duplicate_error(e):
+                        raise duplicates.DuplicateResult()
+                    raise
 
-            # Flag this experiment as finished-on-time if
-            # time to fetch valid < 5000
-            # time to fetch invalid < 5000
+            result = serializer.instance
+            result.event_index = self.event_index
 
-            # ROV = True
-            if invalid_blocked and valid_received:
-                invalid_duration = invalid_blocked[0]["data"]["duration"]
-                valid_duration = valid_received[0]["data"]["duration"]
+            asns = result.json['asn']
 
-                __json["finished-on-time"] = invalid_duration < 5000 and valid_duration < 5000
+            # We're seeing this AS doing RPKI for the first time if
+            # the new Result is_doing_rpki=true and  it has finished on time
+            # and there's only 1 ROV result counted for it (this one, has just been saved)
 
-            # ROV = False
-            elif invalid_received and valid_received:
-                invalid_duration = invalid_received[0]["data"]["duration"]
-                valid_duration = valid_received[0]["data"]["duration"]
+            with metrics.stage('notify'):
+                new = result.is_doing_rpki() and result.has_finished_ont_time() and Result.objects.ases_are_new_to_rov(asns)
 
-                __json["finished-on-time"] = invalid_duration < 5000 and valid_duration < 5000
+                if new:
+                    Notification.objects.enqueue_new_rov(result)
 
-            else:
-                # other cases are not considered to have finished-on-time
-                pass
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Newline delimited JSON, one result per line (same format as a single POST).
+        The body is read line by line and written in chunks of config.bulk_chunk_size.
+        With ?dry_run=1 nothing is written.
+        """
 
-        return super(ResultView, self).create(request, *args, **kwargs)
+        lines = []
+        chunk = []
+        dry_run = dry_run_requested(request)
 
-    def perform_create(self, serializer):
+        def flush():
+            if dry_run:
+                saved = set()
+            else:
+                saved = {id(result) for result in save_results([result for _, result in chunk])}
+
+            for number, result in chunk:
+                if id(result) in saved:
+                    status = "accepted"
+                elif dry_run:
+                    status = "dry-run"
+                elif result.is_documentation():
+                    status = "skipped"
+                else:
+                    status = "duplicate"
+
+                lines.append({"line": number, "status": status})
+            chunk.clear()
+
+        for number, line in enumerate(request.stream or [], start=1):
+
+            if not line.strip():
+                continue
+
+            try:
+                data = json.loads(line)
+                index, fingerprint = prepare(data)
+
+                serializer = self.get_serializer(data=data)
+                serializer.is_valid(raise_exception=True)
+            except ResultValidationError as e:
+                lines.append({"line": number, "status": "rejected", "error": e.message, "path": e.path})
+                continue
+            except (ValueError, KeyError, TypeError, serializers.ValidationError) as e:
+                lines.append({"line": number, "status": "rejected", "error": str(e)})
+                continue
+
+            result = Result(fingerprint=fingerprint, **serializer.validated_data)
+            result.event_index = index
+            chunk.append((number, result))
+
+            if len(chunk) >= config.bulk_chunk_size:
+                flush()
+
+        flush()
+
+        return Response({
+            "accepted": len([line for line in lines if line["status"] == "accepted"]),
+            "rejected": len([line for line in lines if line["status"] == "rejected"]),
+            "lines": sorted(lines, key=lambda line: line["line"]),
+        })
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def export(self, request, *args, **kwargs):
         """
-        Notify the rpki-smiley Mattermost channel on new ASes doing RPKI
+        Stream results out, read through a server-side cursor
+
+        ?output=ndjson|csv (default: ndjson)
+        ?since=<ISO 8601>&until=<ISO 8601> (default: the last 30 days)
+        ?asn=<asn>
+        ?archived=1, include the results moved to cold storage (see app.archive)
+        ?gzip=1
         """
 
-        super(ResultView, self).perform_create(serializer)
+        fmt = request.query_params.get('output', 'ndjson')
+        if fmt not in result_export.FORMATS:
+            raise serializers.ValidationError({"output": "must be one of " + ", ".join(sorted(result_export.FORMATS))})
+
+        until = query_date(request, 'until', None)
+        since = query_date(request, 'since', timezone.now() - timedelta(days=30))
+
+        asn = request.query_params.get('asn')
+        results = result_export.results(since=since, until=until, asn=asn)
+
+        archived = ()
+        if request.query_params.get('archived', '').lower() in ('1', 'true', 'yes'):
+            archived = archive.rows(since=since, until=until, asn=asn)
+
+        lines = result_export.export(results, fmt=fmt, archived=archived)
+        filename = "results.{fmt}".format(fmt=fmt)
+
+        if request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes'):
+            response = StreamingHttpResponse(result_export.gzipped(lines), content_type='application/gzip')
+            filename += '.gz'
+        else:
+            response = StreamingHttpResponse(lines, content_type=result_export.FORMATS[fmt])
+
+        response['Content-Disposition'] = 'attachment; filename="{filename}"'.format(filename=filename)
+
+        return response
+
+
+class AsnStatsView(viewsets.ViewSet):
+    """
+    ROV counts of an ASN, per hour or day, from the pre-aggregated rollups
+
+    ?period=day|hour (default: day)
+    ?since=<ISO 8601>&until=<ISO 8601> (default: the last 30 days)
+    """
+
+    def retrieve(self, request, pk=None):
+
+        period = request.query_params.get('period', AsnRollup.DAY)
+        if period not in (AsnRollup.DAY, AsnRollup.HOUR):
+            raise serializers.ValidationError({"period": "must be one of day, hour"})
 
-        result = serializer.instance
+        until = query_date(request, 'until', timezone.now())
+        since = query_date(request, 'since', until - timedelta(days=30))
 
-        asns = result.json['asn']
-        pfx = result.json['pfx']
+        rollups = AsnRollup.objects.filter(
+            asn=pk,
+            period=period,
+            bucket__gte=since,
+            bucket__lt=until
+        ).order_by('bucket')
 
-        # We're seeing this AS doing RPKI for the first time if
-        # the new Result is_doing_rpki=true and  it has finished on time
-        # and there's only 1 object in db (this one, has just been saved)
+        totals = AsnRollup.objects.totals(rollups)
+        totals = {k: v or 0 for k, v in totals.items()}
+        totals["rov_fraction"] = totals["rov"] / totals["total"] if totals["total"] else None
 
-        new = result.is_doing_rpki() and result.has_finished_ont_time() and Result.objects.ases_are_new_to_rov(asns)
+        return Response({
+            "asn": pk,
+            "period": period,
+            "since": since,
+            "until": until,
+            "totals": totals,
+            "buckets": AsnRollupSerializer(rollups, many=True).data,
+        })
 
-        if new:
 
-            names = []
-            for asn in asns:
+class LatencyStatsView(viewsets.ViewSet):
+    """
+    Distribution of the fetch durations per stage, see app.latency
 
-                holder = RipestatClient().fetch_info(resource="AS{asn}".format(asn=asn))['data']['holder']
-                names.append(
-                    "[AS {asn}](https://stat.ripe.net/AS{asn}) ({holder})".format(
-                        asn=asn,
-                        holder=holder
-                    )
-                )
+    ?group=none|asn|family|origin (default: none)
+    ?asn=<asn>, only results from this ASN
+    ?since=<ISO 8601>&until=<ISO 8601> (default: the last 30 days), whole UTC days
+    ?limit=<n>, the n groups with the most fetches (default: 100)
+    """
 
-            msg = "{names} {verb} just been seen with rpki-valid=true, rpki-invalid=false, pfx={pfx}.".format(
-                names=', '.join(names),
-                verb='have' if len(names) > 1 else 'has',
-                pfx="[{pfx}](https://stat.ripe.net/{pfx})".format(pfx=pfx)
-            )
+    def list(self, request):
 
-            # We've previously seen this ASNs not doing ROV
-            if Result.objects.ases_have_been_seen_not_doing_rov(asns):
+        group = request.query_params.get('group', 'none')
+        if group not in latency.GROUPS:
+            raise serializers.ValidationError({"group": "must be one of " + ", ".join(sorted(latency.GROUPS))})
 
-                last_result = Result.objects.results_seen_not_doing_rov(
-                    ).filter(
-                        json__asn__contains=asns
-                    ).order_by('date').last()
+        try:
+            limit = int(request.query_params.get('limit', 100))
+        except ValueError:
+            raise serializers.ValidationError({"limit": "expected an integer"})
 
-                msg += " We saw {subject} previously not doing Route Origin Validation (last seen: {last_seen}).".format(
-                    subject='them' if len(names) > 1 else 'it',
-                    last_seen=last_result.date.strftime("%b %d %Y %H:%M:%S")
-                )
+        until = query_date(request, 'until', timezone.now())
+        since = query_date(request, 'since', until - timedelta(days=30))
 
-            if 'events' in result.json.keys():
-                initialized = [event for event in result.json['events'] if event["stage"] == "initialized"]
-                if initialized and initialized[0]["data"]["originLocation"] != "sg-pub.ripe.net":
-                    msg += " This result comes from a 3rd party site (not sg-pub.ripe.net)."
+        return Response({
+            "group": group,
+            "since": since,
+            "until": until,
+            "threshold": ON_TIME_THRESHOLD,
+            "histogram_edges": latency.COARSE_EDGES.tolist(),
+            "stats": latency.stats(since, until, group=group, asn=request.query_params.get('asn'), limit=limit),
+        })
 
-            MattermostClient().send_msg(msg=msg)
 
-        # If any of the ASNs is part of the documentation range, then
-        # don't persist, as it'll be used for testing
-        # https://tools.ietf.org/html/rfc5398#section-4
-        if any([Result.objects.is_documentation_asn(asn) for asn in asns]):
-            result.delete()
+def metrics_view(request):
+    """
+    Prometheus text format, see app.metrics
+    """
 
+    if not config.metrics:
+        raise Http404
 
+    return HttpResponse(generate_latest(REGISTRY), content_type=CONTENT_TYPE_LATEST)
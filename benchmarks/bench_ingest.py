@@ -0,0 +1,178 @@
+"""
+Where time goes when a result is posted to ResultView, stage by stage,
+for synthetic payloads modelled on app/fixtures/no-rov.json with
+varying numbers of events and ASNs.
+
+    python benchmarks/bench_ingest.py [--number 200] [--events 4,16,64] [--asns 1,4,16]
+                                      [--baseline previous.json]
+
+Runs against a throwaway test database (created and dropped, as by manage.py test).
+Prints a JSON document: per case and stage, microseconds per call (median and p95)
+and queries per call. With --baseline, the median ratio against a previous run
+is added to each stage ("change" > 1 is slower).
+"""
+
+import argparse
+import copy
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rpki_validation_browser.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment, setup_databases, teardown_databases  # noqa: E402
+from app.events import process_events  # noqa: E402
+from app.models import Result  # noqa: E402
+from app.serializers import ResultSerializer  # noqa: E402
+from app.validation import validate_result  # noqa: E402
+
+FIXTURE = os.path.join(ROOT, 'app', 'fixtures', 'no-rov.json')
+
+
+def payload(events, asns):
+    """
+    :param events: number of events, the fixture's events are repeated to get there
+    :param asns: number of ASNs, outside of the documentation ranges
+    :return: {"json": {...}, "date": ...} as posted by the client
+    """
+
+    base = json.load(open(FIXTURE))[0]["fields"]["json"]
+
+    data = copy.deepcopy(base)
+    data["asn"] = [str(3333 + i) for i in range(asns)]
+    data["ip"] = "193.0.21.108"
+    data["events"] = [copy.deepcopy(base["events"][i % len(base["events"])]) for i in range(events)]
+
+    return {"json": data, "date": "2019-08-28T00:00:00.000Z"}
+
+
+def measure(fn, inputs):
+    """
+    :param fn: called once per input
+    :return: {"us_median", "us_p95", "queries"}
+    """
+
+    timings = []
+    with CaptureQueriesContext(connection) as queries:
+        for value in inputs:
+            start = time.perf_counter()
+            fn(value)
+            timings.append((time.perf_counter() - start) * 1e6)
+
+    timings.sort()
+    return {
+        "us_median": round(statistics.median(timings), 1),
+        "us_p95": round(timings[int(len(timings) * 0.95) - 1], 1),
+        "queries": round(len(queries) / len(inputs), 2),
+    }
+
+
+def copies(data, number):
+    # each stage works in place, it gets its own copy of the payload
+    return [copy.deepcopy(data) for _ in range(number)]
+
+
+def run_case(data, number):
+
+    stages = {}
+
+    stages["validate"] = measure(validate_result, copies(data, number))
+    stages["scrub"] = measure(lambda d: process_events(d["json"]), copies(data, number))
+
+    prepared = copy.deepcopy(data)
+    process_events(prepared["json"])
+
+    def serialize(d):
+        serializer = ResultSerializer(data=d)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    stages["serializer"] = measure(serialize, copies(prepared, number))
+
+    # INSERT, including the derived tables kept up to date by app.signals
+    validated = [serialize(d) for d in copies(prepared, number)]
+    stages["insert"] = measure(lambda v: Result(**v).save(), validated)
+
+    # what perform_create / enqueue_new_rov ask the ResultManager
+    asns = prepared["json"]["asn"]
+
+    def notification_queries(_):
+        if Result.objects.ases_are_new_to_rov(asns) and Result.objects.ases_have_been_seen_not_doing_rov(asns):
+            Result.objects.last_seen_not_doing_rov(asns)
+
+    stages["notification_queries"] = measure(notification_queries, range(number))
+
+    client = Client()
+    stages["request"] = measure(
+        lambda d: client.post('/results/', data=json.dumps(d), content_type='application/json'),
+        copies(data, number)
+    )
+
+    return stages
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(cases, baseline):
+    previous = {(case["events"], case["asns"]): case["stages"] for case in baseline["cases"]}
+
+    for case in cases:
+        for name, stage in case["stages"].items():
+            before = previous.get((case["events"], case["asns"]), {}).get(name)
+            if before and before["us_median"]:
+                stage["change"] = round(stage["us_median"] / before["us_median"], 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=200, help="Calls per stage and case")
+    parser.add_argument('--events', default='4,16,64', help="Comma separated event counts")
+    parser.add_argument('--asns', default='1,4,16', help="Comma separated ASN counts")
+    parser.add_argument('--baseline', help="JSON output of a previous run to compare to")
+    args = parser.parse_args()
+
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+
+    try:
+        cases = []
+        for events in [int(n) for n in args.events.split(',')]:
+            for asns in [int(n) for n in args.asns.split(',')]:
+                cases.append({
+                    "events": events,
+                    "asns": asns,
+                    "stages": run_case(payload(events, asns), args.number),
+                })
+    finally:
+        teardown_databases(databases, verbosity=0)
+
+    if args.baseline:
+        compare(cases, json.load(open(args.baseline)))
+
+    print(json.dumps({
+        "benchmark": "ingest",
+        "commit": git_commit(),
+        "number": args.number,
+        "cases": cases,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Per-request cost of validating a submitted result:
+jsonschema.validate() on schema literals (as ResultView.create used to)
+vs. the validators precompiled in app.validation.
+
+    python benchmarks/bench_validation.py [--number 20000]
+
+Prints a JSON document, timings in microseconds per call.
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rpki_validation_browser.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from jsonschema import validate  # noqa: E402
+from app.validation import validate_result, ResultValidationError  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app', 'fixtures', 'no-rov.json')
+
+
+def before(data):
+    # ResultView.create before precompiled validators
+    schema = {
+        "type": "object",
+        "properties": {
+            "json": {
+                "type": "object"
+            },
+        },
+        "required": ["json"]
+    }
+
+    validate(
+        instance=data,
+        schema=schema
+    )
+
+    schema = {
+        "type": "object",
+        "properties": {
+            "asn": {
+                "type": "array",
+                "items": {
+                    "type": "string"
+                }
+            },
+            "pfx": {
+                "type": "string"
+            },
+            "events": {
+                "type": "array"
+            },
+        },
+        "required": ["asn", "pfx"]
+    }
+
+    validate(
+        instance=data["json"],
+        schema=schema
+    )
+
+
+def after(data):
+    validate_result(data)
+
+
+def uncommon(data):
+    # invalid (asn is not a list of strings): misses the fast path, the schemas find the error
+    try:
+        validate_result(data)
+    except ResultValidationError:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    data = {"json": json.load(open(FIXTURE))[0]["fields"]["json"], "date": "2019-08-28T00:00:00.000Z"}
+    bad = {"json": dict(data["json"], asn=[3333]), "date": data["date"]}
+
+    results = {}
+    for name, fn, payload in [('before', before, data), ('after', after, data), ('after_slow_path', uncommon, bad)]:
+        seconds = min(timeit.repeat(lambda: fn(payload), number=args.number, repeat=3))
+        results[name] = round(seconds / args.number * 1e6, 3)
+
+    print(json.dumps({
+        "benchmark": "validation",
+        "number": args.number,
+        "us_per_call": results,
+        "speedup": round(results['before'] / results['after'], 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+End-to-end load harness: posts a mix of results to the full Django stack
+at a target rate, with RIPEstat and Mattermost replaced by local stand-ins
+that can be made slow or failing.
+
+    python benchmarks/load.py [--rate 50] [--duration 30] [--concurrency 32]
+                              [--mix rov=50,not-rov=40,late=5,documentation=5]
+                              [--asns 1000]
+                              [--stub-latency 100] [--stub-error-rate 0.05]
+                              [--url http://127.0.0.1:8000]
+
+Without --url, `manage.py runserver` and `manage.py process_notifications` are
+started with rpki_validation_browser.env_settings (DJANGO_DB_* for the database),
+pointed at the stand-ins through DJANGO_CONFIG_RIPESTAT_URL / _MATTERMOST_URL.
+With --url, the server is expected to have been started that way already.
+
+Requests are scheduled open loop (every 1/rate seconds whether or not previous
+ones have completed) and latency is measured from the scheduled time, so that
+a saturated server shows up as latency rather than as a lower request rate.
+Prints a JSON document: throughput, p50/p95/p99 latency (ms), overall and per kind,
+status codes, and the requests seen by the stand-ins.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """
+    Local stand-in for stat.ripe.net and mattermost.ripe.net,
+    answering after server.latency ms and failing server.error_rate of the time
+    """
+
+    def do_GET(self):
+        self.reply("ripestat", {"data": {"holder": "AS{path} - Load test".format(path=self.path.split('AS')[-1])}})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.reply("mattermost", {})
+
+    def reply(self, kind, body):
+        server = self.server
+        time.sleep(random.uniform(0.5, 1.5) * server.latency / 1000)
+
+        failed = random.random() < server.error_rate
+        with server.lock:
+            server.counts[kind + (" error" if failed else "")] += 1
+
+        self.send_response(500 if failed else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({} if failed else body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stand_in(latency, error_rate):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.lock = threading.Lock()
+    server.counts = {k: 0 for k in ("ripestat", "ripestat error", "mattermost", "mattermost error")}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def result(kind, asn):
+    """
+    :param kind: rov, not-rov, late (ROV, not finished on time) or documentation
+    :return: {"json": {...}, "date": ...} as posted by the beacon
+    """
+
+    invalid = "invalidBlocked" if kind in ("rov", "late", "documentation") else "invalidReceived"
+    duration = random.randint(5001, 9000) if kind == "late" else random.randint(50, 2000)
+
+    return {
+        "json": {
+            "asn": ["64496"] if kind == "documentation" else [str(asn)],
+            "pfx": "193.0.{n}.0/24".format(n=asn % 256),
+            "rpki-valid-passed": True,
+            "rpki-invalid-passed": invalid == "invalidReceived",
+            "user_agent": "load.py",
+            "events": [
+                {
+                    "stage": "initialized",
+                    "success": True,
+                    "error": None,
+                    "data": {"originLocation": "https://sg-pub.ripe.net", "userAgent": "load.py"},
+                },
+                {
+                    "stage": "validReceived",
+                    "success": True,
+                    "error": None,
+                    "data": {"duration": random.randint(50, 1000), "addressFamily": 4, "rpki-valid-passed": True},
+                },
+                {
+                    "stage": invalid,
+                    "success": True,
+                    "error": None,
+                    "data": {"duration": duration, "addressFamily": 4},
+                },
+            ],
+        },
+        "date": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def parse_mix(mix):
+    kinds = {}
+    for part in mix.split(','):
+        kind, weight = part.split('=')
+        kinds[kind.strip()] = float(weight)
+
+    unknown = set(kinds) - {"rov", "not-rov", "late", "documentation"}
+    if unknown:
+        raise ValueError("unknown kinds in --mix: " + ", ".join(sorted(unknown)))
+
+    return kinds
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {}
+
+    latencies = sorted(latencies)
+
+    def p(q):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * q))], 1)
+
+    return {
+        "count": len(latencies),
+        "p50": p(0.50),
+        "p95": p(0.95),
+        "p99": p(0.99),
+        "mean": round(statistics.mean(latencies), 1),
+        "max": round(latencies[-1], 1),
+    }
+
+
+def post(url, data):
+    """
+    :return: HTTP status, 0 on connection errors
+    """
+
+    request = urllib.request.Request(
+        url + "/results/",
+        data=json.dumps(data).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+
+def run(url, rate, duration, concurrency, mix, asns):
+
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+
+    samples = []
+    lock = threading.Lock()
+
+    def send(kind, scheduled):
+        status = post(url, result(kind, random.randint(1, asns)))
+        latency = (time.perf_counter() - scheduled) * 1000
+
+        with lock:
+            samples.append((kind, status, latency))
+
+    total = int(rate * duration)
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(total):
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            pool.submit(send, random.choices(kinds, weights)[0], scheduled)
+
+    elapsed = time.perf_counter() - start
+
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    ok = [latency for _, status, latency in samples if 200 <= status < 300]
+
+    return {
+        "target_rate": rate,
+        "requests": len(samples),
+        "elapsed": round(elapsed, 2),
+        "throughput": round(len(ok) / elapsed, 1),
+        "statuses": statuses,
+        "latency_ms": percentiles(ok),
+        "latency_ms_by_kind": {
+            kind: percentiles([latency for k, status, latency in samples if k == kind and 200 <= status < 300])
+            for kind in kinds
+        },
+    }
+
+
+def spawn(port, stand_in_url):
+    """
+    Start the web server and the notification worker against the stand-ins
+    :return: list of Popen
+    """
+
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'rpki_validation_browser.env_settings'),
+        DJANGO_DEBUG='0',
+        DJANGO_CONFIG_RIPESTAT_URL=stand_in_url,
+        DJANGO_CONFIG_MATTERMOST_URL=stand_in_url,
+        DJANGO_CONFIG_NOTIFICATION_BACKOFF='1',
+    )
+
+    manage = [sys.executable, os.path.join(ROOT, 'manage.py')]
+
+    return [
+        subprocess.Popen(manage + ['runserver', '--noreload', '127.0.0.1:{port}'.format(port=port)],
+                         env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+        subprocess.Popen(manage + ['process_notifications', '--interval', '1'],
+                         env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+    ]
+
+
+def wait_for(url, timeout=30):
+    deadline = time.time() + timeout
+
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + "/", timeout=1)
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+
+    raise SystemExit("{url} didn't come up in {timeout}s".format(url=url, timeout=timeout))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="Running server to load, default: start one")
+    parser.add_argument('--port', type=int, default=8765, help="Port of the server started without --url")
+    parser.add_argument('--rate', type=float, default=50, help="Target requests per second")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds")
+    parser.add_argument('--concurrency', type=int, default=32, help="Requests in flight, at most")
+    parser.add_argument('--mix', default='rov=50,not-rov=40,late=5,documentation=5',
+                        help="Relative weights of rov, not-rov, late and documentation results")
+    parser.add_argument('--asns', type=int, default=1000, help="ASNs are drawn from 1..N")
+    parser.add_argument('--stub-latency', type=float, default=100, help="ms, +-50%% per request")
+    parser.add_argument('--stub-error-rate', type=float, default=0.0, help="Fraction of stand-in requests failing")
+    parser.add_argument('--drain', type=float, default=5, help="Seconds to let notifications go out after the run")
+    args = parser.parse_args()
+
+    stand_in = start_stand_in(args.stub_latency, args.stub_error_rate)
+    stand_in_url = "http://127.0.0.1:{port}".format(port=stand_in.server_port)
+
+    processes = []
+    url = args.url
+
+    try:
+        if url is None:
+            url = "http://127.0.0.1:{port}".format(port=args.port)
+            processes = spawn(args.port, stand_in_url)
+            wait_for(url)
+
+        report = run(url.rstrip('/'), args.rate, args.duration, args.concurrency, parse_mix(args.mix), args.asns)
+
+        time.sleep(args.drain)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+        stand_in.shutdown()
+
+    report["stand_in"] = dict(
+        stand_in.counts,
+        url=stand_in_url,
+        latency_ms=args.stub_latency,
+        error_rate=args.stub_error_rate
+    )
+
+    print(json.dumps(dict({"benchmark": "load", "mix": parse_mix(args.mix)}, **report), indent=2))
+
+
+if __name__ == '__main__':
+    main()
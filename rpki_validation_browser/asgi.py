@@ -0,0 +1,20 @@
+"""
+ASGI config for rpki_validation_browser project.
+
+POST /results/ is served by the async ingest path (app.async_ingest),
+the rest of the site by the WSGI application. Run with e.g.
+
+    uvicorn rpki_validation_browser.asgi:application --host 0.0.0.0 --port 8000
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rpki_validation_browser.settings')
+
+wsgi_application = get_wsgi_application()
+
+from app.async_ingest import IngestApplication  # noqa: E402
+
+application = IngestApplication(wsgi_application)
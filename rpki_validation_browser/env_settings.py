@@ -18,3 +18,26 @@ for k, v in DATABASES['default'].items():
         continue
 
     DATABASES['default'][k] = os.environ[os_k]
+
+if "DJANGO_DEBUG" in os.environ:
+    DEBUG = os.environ["DJANGO_DEBUG"].lower() in ('1', 'true', 'yes')
+
+# DJANGO_CONFIG_<KEY> overrides config.<key>, e.g.
+# DJANGO_CONFIG_RIPESTAT_URL=http://127.0.0.1:8081
+
+for k, v in vars(config).items():
+
+    os_k = f"DJANGO_CONFIG_{k.upper()}"
+
+    if os_k not in os.environ or isinstance(v, dict):
+        continue
+
+    value = os.environ[os_k]
+
+    # before int, bool is one
+    if isinstance(v, bool):
+        value = value.lower() in ('1', 'true', 'yes')
+    elif isinstance(v, (int, float)):
+        value = type(v)(value)
+
+    setattr(config, k, value)
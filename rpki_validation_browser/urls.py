@@ -21,14 +21,17 @@ from rest_framework import routers
 from rest_framework_swagger.views import get_swagger_view
 from app.apps import RPKIAppConfig
 
-from app.views import ResultView
+from app.views import ResultView, AsnStatsView, LatencyStatsView, metrics_view
 
 schema_view = get_swagger_view(title=RPKIAppConfig.verbose_name)
 
 router = routers.DefaultRouter()
 router.register(r'results', ResultView)
+router.register(r'stats/asns', AsnStatsView, basename='asn-stats')
+router.register(r'stats/latency', LatencyStatsView, basename='latency-stats')
 
 urlpatterns = [
     url(r'^', include(router.urls)),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view),
 ]
@@ -19,6 +19,75 @@ class Config:
         self.memcached = ''
         self.server_id = ''
         self.mattermost_token = ''
+        self.mattermost_url = 'https://mattermost.ripe.net'
+        self.ripestat_url = 'https://stat.ripe.net'
+        self.http_timeout = 5
+
+        # outbound HTTP (see app.libs.HttpClient), seconds / requests
+        self.http_connect_timeout = 2
+        self.http_pool_size = 10
+        self.http_retries = 2
+        self.http_retry_backoff = 0.2
+        self.http_breaker_threshold = 5
+        self.http_breaker_cooldown = 30
+        self.http_max_concurrency = 8
+
+        # RIPEstat AS holder cache, in seconds / entries
+        self.ripestat_cache_ttl = 86400
+        self.ripestat_negative_ttl = 300
+        self.ripestat_lru_size = 1024
+
+        # rows per INSERT in POST /results/bulk/
+        self.bulk_chunk_size = 1000
+
+        # duplicate submissions (see app.duplicates), seconds / key, SECRET_KEY if empty
+        self.duplicate_window = 86400
+        self.fingerprint_key = ''
+
+        # write-behind spool (see app.spool), disabled if empty / records / seconds
+        self.spool_dir = ''
+        self.spool_batch_size = 5000
+        self.spool_flush_interval = 1
+        self.spool_fsync = False
+
+        # cold storage (see manage.py archive_results), disabled if empty / days / results / zstd or gzip
+        self.archive_dir = ''
+        self.archive_after_days = 180
+        self.archive_batch_size = 10000
+        self.archive_compression = 'zstd'
+
+        # worker processes of the bulk paths (see app.pool), 0 for one per core / results per chunk
+        self.pool_workers = 0
+        self.pool_chunk_size = 200
+
+        # manage.py backfill (see app.backfill), rows / seconds between batches
+        self.backfill_batch_size = 5000
+        self.backfill_sleep = 0
+
+        # GET /stats/latency/ (see app.latency), rows / seconds
+        self.latency_chunk_size = 50000
+        self.latency_cache_ttl = 604800
+
+        # async ingest path (see rpki_validation_browser/asgi.py), results / seconds / bytes
+        self.async_batch_size = 200
+        self.async_batch_delay = 0.01
+        self.async_queue_size = 10000
+        self.async_max_body = 1048576
+
+        # app_result monthly partitions (see manage.py manage_partitions), ResultEvents deleted per transaction
+        self.partition_months_ahead = 3
+        self.result_retention_months = 24
+        self.partition_events_batch_size = 10000
+
+        # Prometheus metrics at /metrics (see app.metrics)
+        self.metrics = False
+
+        # notification outbox (see manage.py process_notifications)
+        self.notification_max_attempts = 8
+        self.notification_backoff = 30
+        self.notification_max_backoff = 3600
+        # seconds a worker has to deliver a notification, more than the HTTP retries take
+        self.notification_lease = 300
 
         self.load_config_file()
 